@@ -2,9 +2,10 @@ import os
 import firebase_admin
 from firebase_admin import credentials, auth, firestore
 from dotenv import load_dotenv
-import requests
 from fastapi import HTTPException, status
 from datetime import datetime
+import metrics
+from services import doc_cache, bulk_writes, wallet_view
 
 load_dotenv()
 
@@ -26,12 +27,12 @@ try:
         
     # Initialize Firestore
     db = firestore.client()
+    # Count/time every Firestore RPC for /metrics
+    metrics.instrument_firestore()
 except Exception as e:
     # Fail fast: The app cannot work without Firebase Admin.
     raise RuntimeError(f"Failed to initialize Firebase Admin: {e}")
 
-FIREBASE_WEB_API_KEY = os.getenv("FIREBASE_WEB_API_KEY")
-
 def create_user(email: str, password: str, first_name: str, last_name: str):
     """Creates a new user in Firebase Authentication and stores profile in Firestore."""
     try:
@@ -65,14 +66,20 @@ def create_user(email: str, password: str, first_name: str, last_name: str):
             detail=str(e)
         )
 
-def get_user_profile(uid: str):
-    """Fetches user profile from Firestore."""
+def _load_doc(ref):
+    doc = ref.get()
+    return doc.to_dict() if doc.exists else None
+
+def get_user_profile(uid: str, fresh: bool = False):
+    """Fetches user profile from Firestore (cached, see services/doc_cache.py)."""
     try:
-        doc = db.collection("users").document(uid).get()
-        if doc.exists:
-            return doc.to_dict()
+        profile = doc_cache.get(doc_cache.PROFILE, uid, lambda: _load_doc(db.collection("users").document(uid)), fresh=fresh)
+        if profile is not None:
+            return profile
         else:
              raise HTTPException(status_code=404, detail="User profile not found")
+    except HTTPException:
+        raise
     except Exception as e:
          raise HTTPException(status_code=500, detail=str(e))
 
@@ -104,6 +111,7 @@ def update_user_profile(uid: str, updates: dict):
             # Add updated timestamp
             firestore_updates['updated_at'] = firestore.SERVER_TIMESTAMP
             db.collection("users").document(uid).update(firestore_updates)
+            doc_cache.invalidate(uid, doc_cache.PROFILE)
             
         return get_user_profile(uid)
 
@@ -121,82 +129,11 @@ def update_user_profile(uid: str, updates: dict):
          raise HTTPException(status_code=500, detail=str(e))
 
 
-def verify_password(email: str, password: str):
-    """
-    Logs in a user via Firebase REST API to get an ID token.
-    Firebase Admin SDK does not support logging in with password directly.
-    """
-    if not FIREBASE_WEB_API_KEY:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Server misconfiguration: FIREBASE_WEB_API_KEY not set."
-        )
-
-    request_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={FIREBASE_WEB_API_KEY}"
-    payload = {
-        "email": email,
-        "password": password,
-        "returnSecureToken": True
-    }
-    
-    response = requests.post(request_url, json=payload)
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        # Debugging
-        print(f"Login failed: {response.status_code} - {response.text}")
-        
-        # Map Firebase errors to HTTP exceptions
-        try:
-            error_data = response.json()
-        except:
-             print("Could not parse error JSON")
-             raise HTTPException(status_code=500, detail=f"Upstream auth error: {response.status_code}")
-
-        error_msg = error_data.get('error', {}).get('message', 'Login failed')
-        if "INVALID_PASSWORD" in error_msg or "EMAIL_NOT_FOUND" in error_msg:
-             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid email or password"
-            )
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=error_msg
-        )
-
-def refresh_access_token(refresh_token: str):
-    """
-    Exchanges a valid refresh token for a new ID token.
-    Endpoint: https://securetoken.googleapis.com/v1/token
-    """
-    if not FIREBASE_WEB_API_KEY:
-        raise HTTPException(
-             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-             detail="Server misconfiguration: FIREBASE_WEB_API_KEY not set."
-        )
-        
-    url = f"https://securetoken.googleapis.com/v1/token?key={FIREBASE_WEB_API_KEY}"
-    payload = {
-        "grant_type": "refresh_token",
-        "refresh_token": refresh_token
-    }
-    
-    response = requests.post(url, json=payload)
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Token refresh failed: {response.text}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not refresh token. Please login again."
-        )
-
 def set_onboarded(uid: str, status: bool = True):
     """Updates the user's onboarded status."""
     try:
         db.collection("users").document(uid).update({"onboarded": status})
+        doc_cache.invalidate(uid, doc_cache.PROFILE)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -208,6 +145,8 @@ def save_global_card(card_data: dict):
     
     # Use name as document ID for simplicity and deduplication
     db.collection('cards').document(card_id).set(card_data, merge=True)
+    # Wallets already holding this card get the new details
+    wallet_view.refresh_card(card_id)
     return card_id
 
 def get_global_card(query: str):
@@ -282,6 +221,8 @@ def add_user_card(uid: str, card_data: dict):
     # Save User-Specific Fields
     if 'sign_on_bonus' in card_data and card_data['sign_on_bonus']:
         link_data['sign_on_bonus'] = card_data['sign_on_bonus']
+    if card_data.get('last4'):
+        link_data['last4'] = card_data['last4']
     
     # Check for duplicate
     doc_ref = db.collection('users').document(uid).collection('cards').document(card_id)
@@ -291,61 +232,20 @@ def add_user_card(uid: str, card_data: dict):
              detail="This card is already in your wallet."
          )
 
-    # Save to user's subcollection
-    doc_ref.set(link_data)
+    # Save to user's subcollection, and the wallet view in the same batch
+    result = bulk_writes.commit(db, [bulk_writes.set_doc(doc_ref, link_data)] + wallet_view.add_writes(uid, card_id, link_data))
+    doc_cache.invalidate(uid, doc_cache.WALLET)
+    if not result.ok:
+        raise HTTPException(status_code=500, detail="Could not add the card to your wallet")
     
-def get_user_cards(uid: str):
+
+def get_user_cards(uid: str, fresh: bool = False):
     """
-    Fetches user's cards using a Relational Pattern.
-    1. Get Card IDs and User-Specific Data from User's subcollection.
-    2. Fetch up-to-date details from Global 'cards' collection.
-    3. Merge Global Details + User Specifics (Sign-on Bonus).
+    Fetches user's cards: global card details merged with the user's own fields (sign-on
+    bonus, last 4), from the denormalized wallet view (one read, see services/wallet_view.py).
+    Read-modify-writes of a card's bonus read the links instead (wallet_view.read_links).
     """
-    # 1. Get references/IDs
-    user_card_docs = db.collection('users').document(uid).collection('cards').stream()
-    
-    user_cards_map = {} # Map ID -> User Data (e.g. bonus)
-    card_ids = []
-    
-    for doc in user_card_docs:
-        # We use the document ID as the card ID (name)
-        card_ids.append(doc.id)
-        user_cards_map[doc.id] = doc.to_dict()
-        
-    if not card_ids:
-        return []
-        
-    # 2. Fetch Global Data (Batch / WHERE IN)
-    # Firestore 'in' query supports up to 10 items. If > 10, need to chunk or use getAll.
-    # strict_consistency: db.getAll(*refs) is best.
-    
-    cards = []
-    
-    # Chunking for safety (though getAll supports more, 'in' only 10)
-    # Using getAll with document references is efficient.
-    refs = [db.collection('cards').document(cid) for cid in card_ids]
-    
-    global_docs = db.get_all(refs)
-    
-    for doc in global_docs:
-        if doc.exists:
-            data = doc.to_dict()
-            # Ensure ID is injected
-            data['card_id'] = doc.id
-            
-            # 3. Merge User Specifics
-            user_specific_data = user_cards_map.get(doc.id, {})
-            if 'sign_on_bonus' in user_specific_data:
-                data['sign_on_bonus'] = user_specific_data['sign_on_bonus']
-            
-            cards.append(data)
-        else:
-            # Handle case where global card was deleted but user still has ref
-            # Option: Return basic data from user doc? Or skip?
-            # For now, skip.
-            print(f"Warning: User {uid} has orphaned card {doc.id}")
-            
-    return cards
+    return doc_cache.get(doc_cache.WALLET, uid, lambda: wallet_view.read(uid), fresh=fresh)
 
 def remove_user_card(uid: str, card_id: str):
     """Removes a card from the user's wallet."""
@@ -354,12 +254,25 @@ def remove_user_card(uid: str, card_id: str):
         print(f"Removing card {card_id} for user {uid}")
         
         # The document ID in the subcollection is the card ID (name)
-        db.collection('users').document(uid).collection('cards').document(card_id).delete()
+        card_ref = db.collection('users').document(uid).collection('cards').document(card_id)
+        result = bulk_writes.commit(db, [bulk_writes.delete_doc(card_ref)] + wallet_view.remove_writes(uid, card_id))
+        doc_cache.invalidate(uid, doc_cache.WALLET)
+        if not result.ok:
+            raise RuntimeError(f"Could not remove card: {result.failed}")
         print(f"Successfully deleted card document {card_id}")
     except Exception as e:
         print(f"Error removing card: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_agent_state(uid: str, fresh: bool = False):
+    """
+    The agent's public state (users/{uid}/public_agent_state/main) or None. Cached, except
+    while a run is in flight ("thinking"): that run may finish on another instance.
+    """
+    ref = db.collection('users').document(uid).collection('public_agent_state').document('main')
+    return doc_cache.get(doc_cache.AGENT_STATE, uid, lambda: _load_doc(ref), fresh=fresh,
+                         keep=lambda state: state.get('status') != 'thinking')
+
 # MARK: - Action Center Helpers
 
 def add_action_item(uid: str, category: str, item_data: dict):
@@ -0,0 +1,117 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordBearer
+import auth
+import metrics
+
+# Shared request dependencies (used by main.py and every router).
+#
+# get_current_user verifies the Firebase ID token once and then serves it from an LRU
+# cache keyed by the token's SHA-256 (the raw token is never stored), until the token's
+# own `exp`. Cache hits cost a hash and a dict lookup instead of a Firebase round trip.
+#
+# Revocation is not re-checked per request: refresh_revocations() runs on the scheduler
+# every AUTH_REVOCATION_REFRESH_SECONDS (jobs.py) and drops cached tokens of users who were
+# disabled or had their tokens revoked since, so they are verified again (and rejected)
+# on their next request.
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_REVOCATION_REFRESH_SECONDS = int(os.getenv("AUTH_REVOCATION_REFRESH_SECONDS", "60"))
+# Tokens this close to `exp` are verified again rather than served from the cache
+_EXPIRY_SKEW_SECONDS = 30
+# firebase_admin.auth.get_users() limit
+_USERS_PER_LOOKUP = 100
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+
+_tokens = OrderedDict()  # sha256(token) -> decoded token
+_lock = threading.Lock()
+
+
+def _key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _cached(key: str) -> dict | None:
+    with _lock:
+        decoded = _tokens.get(key)
+        if decoded is None:
+            return None
+        if decoded.get("exp", 0) - _EXPIRY_SKEW_SECONDS <= time.time():
+            del _tokens[key]
+            metrics.AUTH_TOKEN_CACHE.labels("expired").inc()
+            return None
+        _tokens.move_to_end(key)
+        return decoded
+
+
+def _remember(key: str, decoded: dict):
+    with _lock:
+        _tokens[key] = decoded
+        _tokens.move_to_end(key)
+        while len(_tokens) > AUTH_TOKEN_CACHE_SIZE:
+            _tokens.popitem(last=False)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    """
+    Verifies the Firebase ID token and returns the decoded token (user info).
+    """
+    key = _key(token)
+    decoded = _cached(key)
+    if decoded is not None:
+        metrics.AUTH_TOKEN_CACHE.labels("hit").inc()
+        return decoded
+
+    metrics.AUTH_TOKEN_CACHE.labels("miss").inc()
+    try:
+        # Verify the ID token while checking if the token is revoked.
+        decoded = await run_in_threadpool(auth.auth.verify_id_token, token, check_revoked=True)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Invalid authentication credentials: {e}",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    _remember(key, decoded)
+    return decoded
+
+
+async def get_current_user_uid(current_user: dict = Depends(get_current_user)) -> str:
+    """Just the UID of the verified user."""
+    return current_user['uid']
+
+
+def refresh_revocations() -> int:
+    """Drops cached tokens of disabled / revoked users. Blocking; returns how many were dropped."""
+    with _lock:
+        by_uid = {}
+        for key, decoded in _tokens.items():
+            by_uid.setdefault(decoded.get("uid"), []).append((key, decoded))
+    uids = [uid for uid in by_uid if uid]
+
+    stale = []
+    for start in range(0, len(uids), _USERS_PER_LOOKUP):
+        identifiers = [auth.auth.UidIdentifier(uid) for uid in uids[start:start + _USERS_PER_LOOKUP]]
+        result = auth.auth.get_users(identifiers)
+        for user in result.users:
+            valid_after = user.tokens_valid_after_timestamp or 0  # milliseconds
+            for key, decoded in by_uid.get(user.uid, []):
+                # Same rule as verify_id_token(check_revoked=True)
+                if user.disabled or decoded.get("iat", 0) * 1000 < valid_after:
+                    stale.append(key)
+        # Deleted accounts
+        for identifier in result.not_found:
+            stale += [key for key, _ in by_uid.get(identifier.uid, [])]
+
+    with _lock:
+        for key in stale:
+            _tokens.pop(key, None)
+    if stale:
+        metrics.AUTH_TOKEN_CACHE.labels("revoked").inc(len(stale))
+    return len(stale)
@@ -1,33 +1,29 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from google import genai
-from google.genai import types
+from apscheduler.triggers.interval import IntervalTrigger
 import os
 import auth as auth
 from firebase_admin import firestore
 import time
-import json
+import metrics
+import dependencies
 
 from services.marathon_agent import MarathonAgent
+from services import gemini_gateway, structured_output, prompts, usage, model_routing, wallet_view
+from models import CardBenefitsUpdate, PriceCheckResult
+import services.agent_queue as agent_queue
 
 # Initialize Scheduler
 scheduler = BackgroundScheduler()
 
-def get_gemini_client():
-    """Returns a configured Gemini Client."""
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        return None
-    return genai.Client(api_key=api_key)
-
+@metrics.timed_job("monthly_card_update")
 def update_all_cards():
     """
     CRON JOB: Runs monthly.
     Iterates through all cards in Global DB and updates their benefits using AI Search.
     """
     print("--- 🔄 STARTING MONTHLY CARD UPDATE JOB ---")
-    client = get_gemini_client()
-    if not client:
+    if not gemini_gateway.is_configured():
         print("Skipping job: No Gemini API Key.")
         return
 
@@ -45,63 +41,30 @@ def update_all_cards():
             print(f"Checking updates for: {card_name}...")
             
             # 2. Ask Gemini for Updates
+            # Same cached rules prefix as /cards/search, so the whole batch reuses one cache
             prompt = f"""
-            Perform a deep, comprehensive search for the **OFFICIAL "Guide to Benefits" or "Terms and Conditions" (PDF or Official Site)** for the credit card: "{card_name}".
-            Read through the fine print to find every single perk, including hidden ones like insurance and protections.
+            Research the benefits of the credit card: "{card_name}".
             
             Return a JSON object with a 'benefits' list.
             Format:
             {{
-                "benefits": [
-                    {{
-                        "category": "Travel" | "Dining" | "Shopping" | "Protection" | "Lifestyle",
-                        "title": "Short Title (e.g. 'Delta SkyClub Access')",
-                        "description": "One sentence summary.",
-                        "details": "Deep details. List specific retailers, coverage amounts (e.g. '$50k collision'), or limitations."
-                    }}
-                ]
+                "benefits": [ ...benefit objects... ]
             }}
-            
-            IMPORTANT RULES:
-            1. 📄 SOURCE OF TRUTH: You MUST try to find the "Guide to Benefits" PDF or official landing page.
-            2. 🚫 EXCLUDE GENERIC/FINANCIAL FEATURES: Exclude "0% APR", "Annual Fees", "Balance Transfers", "Monthly Installments", "Family/Authorized User" features, "$0 Liability", "ID Theft Protection", and "Presale Tickets". These are standard or costs.
-            3. 💰 COMPREHENSIVE REWARDS STRUCTURE: You MUST list EVERY SINGLE earning rate. Do not summarize.
-               - Include specific multipliers (e.g. "2x miles on Restaurants", "2x miles on Hotel Stays").
-               - Include the base rate (e.g. "1x miles on all other purchases").
-               - Include any tier bonuses.
-               - MISS NOTHING. Errors of omission are unacceptable.
-            4. 🛡️ MANDATORY CHECK: You MUST explicitly look for "Extended Warranty", "Purchase Protection", and "Return Protection". If the card has them, INCLUDE THEM.
-            5. 🔗 CONSOLIDATE BY RATE: Group all categories with the SAME earning rate into one single line.
-               - BAD: "2x on Dining", "2x on Travel" (Separate lines)
-               - GOOD: "2x Miles on Dining & Travel" (Combined)
-               - Combine partner offers if they share a rate.
-            6. 📅 VERIFY DATE VALIDITY: Double-check that detailed partners (e.g. Panera, T-Mobile) are STILL valid for the current date. Do not list expired partners.
-            7. 📝 BE SPECIFIC: List specific active retailers and coverage amounts in 'details'.
-            8. 🔎 GO DEEP: Find mostly purchase perks and insurance.
             """
             
             try:
                 # Add delay to avoid rate limits
                 time.sleep(2) 
                 
-                response = client.models.generate_content(
-                    model='gemini-3-flash-preview',
+                result = model_routing.generate_tiered_sync(
+                    "card_update",
                     contents=prompt,
-                    config=types.GenerateContentConfig(
-                        tools=[types.Tool(google_search=types.GoogleSearch())],
-                        response_mime_type='application/json' 
-                    )
+                    model_cls=CardBenefitsUpdate,
+                    config=gemini_gateway.grounded_json_config(system_instruction=prompts.CARD_BENEFIT_RULES),
+                    cache_key=prompts.CARD_BENEFIT_RULES_KEY
                 )
                 
-                # Extract JSON (Using response_mime_type handles most formatting, but good to be safe)
-                text = response.text.strip()
-                # If the model returns markdown code blocks despite mime_type request
-                if text.startswith("```json"): text = text[7:]
-                if text.endswith("```"): text = text[:-3]
-                
-                result = json.loads(text)
-                
-                new_benefits = result.get('benefits')
+                new_benefits = [b.dict() for b in result.benefits]
                 
                 if new_benefits:
                     # 3. Update Global DB
@@ -110,11 +73,16 @@ def update_all_cards():
                         'last_updated': firestore.SERVER_TIMESTAMP
                     })
                     print(f"✅ Updated {card_name}")
+                    metrics.job_item("monthly_card_update", "updated")
+                    # Copy the new benefits into the wallets holding this card
+                    wallet_view.refresh_card(doc.id)
                 else:
                     print(f"⚠️ No benefits found for {card_name}")
+                    metrics.job_item("monthly_card_update", "empty")
                     
             except Exception as e:
                 print(f"❌ Error updating {card_name}: {e}")
+                metrics.job_item("monthly_card_update", "error")
                 
         print("--- ✅ MONTHLY UPDATE JOB COMPLETE ---")
         
@@ -123,16 +91,14 @@ def update_all_cards():
 
 
 
-def check_single_item_price(item: dict, client=None):
+def check_single_item_price(item: dict):
     """
     Checks the price for a single item. 
     Can be called by Cron Job OR manually via API trigger.
     """
-    if not client:
-        client = get_gemini_client()
-        if not client:
-            print("Skipping check: No Gemini API Key.")
-            return
+    if not gemini_gateway.is_configured():
+        print("Skipping check: No Gemini API Key.")
+        return
 
     item_id = item.get('id')
     uid = item.get('uid')
@@ -171,40 +137,28 @@ def check_single_item_price(item: dict, client=None):
         # Rate limit protection if running in batch (caller handles big loops, but small safety here)
         # time.sleep(1) 
         
-        response = client.models.generate_content(
-            model='gemini-3-flash-preview', # Updated to valid model
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                tools=[types.Tool(google_search=types.GoogleSearch())],
-                response_mime_type='application/json'
-            )
-        )
-        
-        text = response.text.strip()
-        if text.startswith("```json"): text = text[7:]
-        if text.endswith("```"): text = text[:-3]
-        
         try:
-            result = json.loads(text)
-            
-            # Handle potential list response
-            if isinstance(result, list):
-                if len(result) > 0:
-                    result = result[0]
-                else:
-                    print(f"Empty list returned for {product_name}")
-                    return
-        except json.JSONDecodeError:
-            print(f"JSON Decode Error for {product_name}: {text}")
+            result = structured_output.generate_structured_sync(
+                "price_check",
+                contents=prompt,
+                model_cls=PriceCheckResult,
+                config=gemini_gateway.grounded_json_config(),
+                uid=uid
+            )
+        except structured_output.StructuredOutputError as e:
+            print(f"Invalid price check output for {product_name}: {e}")
+            return
+        except usage.BudgetExceededError:
+            print(f"Skipping price check for {product_name}: user {uid} is over today's AI budget")
             return
 
-        found_price = result.get('lowest_price')
-        found_url = result.get('url')
+        found_price = result.lowest_price
+        found_url = result.url
         
-        if found_price and isinstance(found_price, (int, float)):
+        if found_price:
             # Check if lower
             if found_price < original_price:
-                print(f"📉 PRICE DROP FOUND: ${found_price} at {result.get('retailer')}")
+                print(f"📉 PRICE DROP FOUND: ${found_price} at {result.retailer}")
                 
                 # Update Item
                 auth.update_action_item(uid, 'price_protection', item_id, {
@@ -224,6 +178,7 @@ def check_single_item_price(item: dict, client=None):
     except Exception as e:
         print(f"Error checking {product_name}: {e}")
 
+@metrics.timed_job("daily_price_check")
 def check_price_drops():
     """
     CRON JOB: Runs Daily at Midnight.
@@ -231,8 +186,7 @@ def check_price_drops():
     Uses Gemini 3 Flash + Google Search to find lower prices.
     """
     print("--- 💰 STARTING PRICE CHECK JOB ---")
-    client = get_gemini_client()
-    if not client:
+    if not gemini_gateway.is_configured():
         print("Skipping job: No Gemini API Key.")
         return
 
@@ -242,7 +196,8 @@ def check_price_drops():
         print(f"Found {len(items)} items to monitor.")
         
         for item in items:
-            check_single_item_price(item, client)
+            check_single_item_price(item)
+            metrics.job_item("daily_price_check")
             # Add delay to avoid rate limits
             time.sleep(1)
                 
@@ -251,6 +206,7 @@ def check_price_drops():
     except Exception as e:
         print(f"Fatal Price Job Error: {e}")
 
+@metrics.timed_job("weekly_marathon_agent")
 def run_daily_marathon():
     """
     CRON JOB: Runs Daily at Midnight.
@@ -269,15 +225,67 @@ def run_daily_marathon():
             if uid:
                 try:
                     agent.run_agent_cycle(uid)
+                    metrics.job_item("weekly_marathon_agent")
                     # Add delay to avoid rate limits per user
                     time.sleep(5) 
                 except Exception as e:
                     print(f"❌ Error running agent for user {uid}: {e}")
+                    metrics.job_item("weekly_marathon_agent", "error")
                     
         print("--- ✅ MARATHON AGENT JOB COMPLETE ---")
     except Exception as e:
         print(f"Fatal Marathon Job Error: {e}")
 
+@metrics.timed_job("agent_run_queue")
+def process_agent_queue():
+    """
+    INTERVAL JOB: Runs every few seconds.
+    Executes agent cycles whose debounce window has elapsed.
+    """
+    try:
+        processed = agent_queue.process_agent_queue()
+        metrics.job_item("agent_run_queue", count=processed)
+        if processed:
+            print(f"--- 🗂️ AGENT QUEUE: ran {processed} cycle(s) ---")
+    except Exception as e:
+        print(f"Agent Queue Job Error: {e}")
+
+@metrics.timed_job("usage_flush")
+def flush_usage():
+    """
+    INTERVAL JOB: Writes accumulated per-user Gemini token counts to Firestore.
+    """
+    flushed = usage.flush()
+    if flushed:
+        metrics.job_item("usage_flush", "flushed", count=flushed)
+
+@metrics.timed_job("auth_revocation_refresh")
+def refresh_auth_revocations():
+    """
+    INTERVAL JOB: Drops cached ID tokens of users revoked or disabled since they were verified.
+    """
+    try:
+        dropped = dependencies.refresh_revocations()
+        if dropped:
+            metrics.job_item("auth_revocation_refresh", "dropped", count=dropped)
+    except Exception as e:
+        print(f"Auth Revocation Refresh Error: {e}")
+
+@metrics.timed_job("wallet_view_check")
+def check_wallet_views():
+    """
+    CRON JOB: Runs daily.
+    Repairs denormalized wallet views that drifted from the users' card links.
+    """
+    try:
+        counts = wallet_view.check_all()
+        metrics.job_item("wallet_view_check", "checked", count=counts["checked"])
+        if counts["repaired"]:
+            metrics.job_item("wallet_view_check", "repaired", count=counts["repaired"])
+        print(f"✅ Wallet views checked: {counts['checked']}, repaired: {counts['repaired']}")
+    except Exception as e:
+        print(f"Wallet View Check Error: {e}")
+
 def start_scheduler():
     # Schedule: 2nd of every month at midnight (Card Update)
     trigger_cards = CronTrigger(day=2, hour=0, minute=0)
@@ -291,8 +299,25 @@ def start_scheduler():
     trigger_agent = CronTrigger(day_of_week='mon', hour=0, minute=0)
     scheduler.add_job(run_daily_marathon, trigger_agent, id='weekly_marathon_agent')
     
+    # Schedule: Every few seconds (Drain debounced agent runs from the durable queue)
+    # Runs left pending by a previous instance are picked up on the first tick.
+    trigger_queue = IntervalTrigger(seconds=int(os.getenv("AGENT_QUEUE_POLL_SECONDS", "10")))
+    scheduler.add_job(process_agent_queue, trigger_queue, id='agent_run_queue', max_instances=1, coalesce=True)
+    
+    # Schedule: Every 30 seconds (Persist per-user token usage counters)
+    trigger_usage = IntervalTrigger(seconds=usage.USAGE_FLUSH_SECONDS)
+    scheduler.add_job(flush_usage, trigger_usage, id='usage_flush', max_instances=1, coalesce=True)
+    
+    # Schedule: Every minute (Revocation status for cached auth tokens)
+    trigger_revocations = IntervalTrigger(seconds=dependencies.AUTH_REVOCATION_REFRESH_SECONDS)
+    scheduler.add_job(refresh_auth_revocations, trigger_revocations, id='auth_revocation_refresh', max_instances=1, coalesce=True)
+    
+    # Schedule: Daily at 3 AM (Repair drifted wallet views)
+    trigger_wallets = CronTrigger(hour=3, minute=0)
+    scheduler.add_job(check_wallet_views, trigger_wallets, id='wallet_view_check', max_instances=1, coalesce=True)
+    
     scheduler.start()
-    print("📅 Scheduler started: Monthly card updates & Daily price checks active.")
+    print("📅 Scheduler started: Monthly card updates, Daily price checks & Agent run queue active.")
 
 def shutdown_scheduler():
     scheduler.shutdown()
@@ -0,0 +1,291 @@
+import os
+import hmac
+import time
+import functools
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Prometheus metrics for the backend, exposed at GET /metrics.
+# Everything here is an in-process counter/histogram update (no I/O), so it is
+# cheap enough to leave on in production. Label values are kept low-cardinality:
+# route TEMPLATES (not raw paths), fixed call-site names, and exception class names.
+#
+# The endpoint is public-facing like the rest of the API, so scrapes must send
+# `Authorization: Bearer $METRICS_TOKEN`; with no METRICS_TOKEN set it is closed.
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# MARK: - HTTP
+
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests by route template.",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+
+# MARK: - Gemini
+
+# LLM calls are slow and long-tailed; buckets go well past the HTTP ones.
+GEMINI_CALL_LATENCY = Histogram(
+    "gemini_call_duration_seconds",
+    "Latency of Gemini generate_content calls by call site.",
+    ["call_site", "outcome"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 240)
+)
+GEMINI_TOKENS = Counter(
+    "gemini_tokens_total",
+    "Tokens reported in usage_metadata by call site.",
+    ["call_site", "kind"]
+)
+GEMINI_ERRORS = Counter(
+    "gemini_errors_total",
+    "Failed Gemini calls by call site and exception type.",
+    ["call_site", "error"]
+)
+
+GEMINI_STRUCTURED_REPAIRS = Counter(
+    "gemini_structured_repairs_total",
+    "Structured outputs fixed locally (no extra call) by call site and repair kind.",
+    ["call_site", "repair"]
+)
+GEMINI_STRUCTURED_RETRIES = Counter(
+    "gemini_structured_retries_total",
+    "Extra Gemini calls made because a structured output could not be repaired.",
+    ["call_site"]
+)
+GEMINI_STRUCTURED_FAILURES = Counter(
+    "gemini_structured_failures_total",
+    "Structured outputs still invalid after all retries.",
+    ["call_site"]
+)
+GEMINI_TIER_ANSWERS = Counter(
+    "gemini_tier_answers_total",
+    "Structured answers by call site and the model tier that produced them.",
+    ["call_site", "tier"]
+)
+GEMINI_TIER_ESCALATIONS = Counter(
+    "gemini_tier_escalations_total",
+    "Answers rejected by a tier (invalid / low_confidence / rejected) and retried on the next one.",
+    ["call_site", "tier", "reason"]
+)
+GEMINI_HEDGES = Counter(
+    "gemini_hedged_calls_total",
+    "Calls that were hedged with a second request, by which attempt won.",
+    ["call_site", "winner"]
+)
+GEMINI_DEADLINES_EXCEEDED = Counter(
+    "gemini_deadlines_exceeded_total",
+    "Interactive operations that ran past their deadline.",
+    ["call_site"]
+)
+DEGRADED_RESPONSES = Counter(
+    "degraded_responses_total",
+    "Responses served from a fallback (cached / heuristic / pending) instead of a fresh model answer.",
+    ["call_site", "kind"]
+)
+STATEMENT_JOBS = Counter(
+    "statement_jobs_total",
+    "Statement ingestion jobs by outcome.",
+    ["status"]
+)
+STATEMENT_PARSER = Counter(
+    "statement_parser_total",
+    "Statements by issuer and how they were extracted (local = template only, partial = template + Gemini pages, model = Gemini only).",
+    ["issuer", "outcome"]
+)
+AUTH_TOKEN_CACHE = Counter(
+    "auth_token_cache_total",
+    "Verified ID-token cache lookups and evictions (hit / miss / expired / revoked)",
+    ["outcome"],
+)
+DOC_CACHE = Counter(
+    "doc_cache_total",
+    "Cached user document reads and invalidations by kind (hit / miss / fresh / invalidated).",
+    ["kind", "outcome"],
+)
+IDENTITY_REQUESTS = Counter(
+    "identity_requests_total",
+    "Sign-in / token refresh calls to Firebase's REST endpoints by final HTTP status (or error).",
+    ["endpoint", "status"],
+)
+
+STATEMENT_DEDUP = Counter(
+    "statement_dedup_total",
+    "Statement uploads by re-upload match (content = same file, text = same text layer, none = new).",
+    ["match"]
+)
+GEMINI_BUDGET_EVENTS = Counter(
+    "gemini_budget_events_total",
+    "Calls made on the cheaper path (soft) or refused (hard) because a user hit a daily token budget.",
+    ["call_site", "level"]
+)
+GEMINI_CONTEXT_CACHE = Counter(
+    "gemini_context_cache_total",
+    "Context cache lookups for static prompt prefixes (hit / created / create_failed / inline / invalidated).",
+    ["key", "result"]
+)
+
+# usage_metadata attribute -> 'kind' label
+_USAGE_FIELDS = {
+    "prompt_token_count": "prompt",
+    "candidates_token_count": "output",
+    "thoughts_token_count": "thoughts",
+    "cached_content_token_count": "cached",
+    "tool_use_prompt_token_count": "grounding",
+}
+
+# MARK: - Firestore
+
+FIRESTORE_RPC_LATENCY = Histogram(
+    "firestore_rpc_duration_seconds",
+    "Latency of Firestore RPCs (time until the call / stream is returned).",
+    ["method", "outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# Unary + server-streaming RPCs issued by the admin SDK. Long-lived streams
+# (listen, write) are intentionally left out.
+_FIRESTORE_RPCS = (
+    "get_document", "list_documents", "create_document", "update_document", "delete_document",
+    "batch_get_documents", "begin_transaction", "commit", "rollback",
+    "run_query", "run_aggregation_query", "list_collection_ids", "batch_write",
+)
+
+# MARK: - Jobs
+
+JOB_DURATION = Histogram(
+    "job_duration_seconds",
+    "Duration of scheduled/background jobs.",
+    ["job", "outcome"],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200)
+)
+JOB_ITEMS = Counter(
+    "job_items_processed_total",
+    "Items processed by scheduled/background jobs.",
+    ["job", "outcome"]
+)
+
+
+def scrape_authorized(authorization: str | None) -> bool:
+    """True if the Authorization header carries METRICS_TOKEN as a bearer token."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if not METRICS_TOKEN or scheme.lower() != "bearer":
+        return False
+    return hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode())
+
+
+def render_latest():
+    """Returns (body, content_type) for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+async def http_metrics_middleware(request, call_next):
+    """Records request latency keyed by the matched route template (e.g. /actions/{category})."""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or "unmatched"
+        if route_path != "/metrics":
+            HTTP_REQUEST_LATENCY.labels(request.method, route_path, str(status_code)).observe(time.perf_counter() - start)
+
+
+class GeminiCallRecorder:
+    """Handle yielded by track_gemini() so the caller can attach the response's usage_metadata."""
+
+    def __init__(self, call_site: str):
+        self.call_site = call_site
+
+    def record_usage(self, response):
+        for kind, value in usage_counts(response).items():
+            GEMINI_TOKENS.labels(self.call_site, kind).inc(value)
+
+
+def usage_counts(response) -> dict:
+    """Non-zero token counts from a response's usage_metadata, keyed by 'kind' (prompt, output, ...)."""
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return {}
+    counts = {}
+    for attr, kind in _USAGE_FIELDS.items():
+        value = getattr(usage, attr, None)
+        if value:
+            counts[kind] = value
+    return counts
+
+
+@contextmanager
+def track_gemini(call_site: str):
+    """
+    Wrap a single generate_content call:
+
+        with metrics.track_gemini("recommend") as call:
+            response = client.models.generate_content(...)
+            call.record_usage(response)
+    """
+    start = time.perf_counter()
+    recorder = GeminiCallRecorder(call_site)
+    try:
+        yield recorder
+    except Exception as e:
+        GEMINI_ERRORS.labels(call_site, type(e).__name__).inc()
+        GEMINI_CALL_LATENCY.labels(call_site, "error").observe(time.perf_counter() - start)
+        raise
+    GEMINI_CALL_LATENCY.labels(call_site, "ok").observe(time.perf_counter() - start)
+
+
+def job_item(job: str, outcome: str = "ok", count: int = 1):
+    """Counts items a job handled, e.g. job_item("daily_price_check", "price_drop")."""
+    JOB_ITEMS.labels(job, outcome).inc(count)
+
+
+def timed_job(job: str):
+    """Decorator recording the duration of every run of a scheduled/background job."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                JOB_DURATION.labels(job, "error").observe(time.perf_counter() - start)
+                raise
+            JOB_DURATION.labels(job, "ok").observe(time.perf_counter() - start)
+            return result
+        return wrapper
+    return decorator
+
+
+def _timed_rpc(method_name: str, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            FIRESTORE_RPC_LATENCY.labels(method_name, "error").observe(time.perf_counter() - start)
+            raise
+        FIRESTORE_RPC_LATENCY.labels(method_name, "ok").observe(time.perf_counter() - start)
+        return result
+    wrapper._metrics_wrapped = True
+    return wrapper
+
+
+def instrument_firestore():
+    """
+    Counts and times every Firestore RPC by wrapping the generated GAPIC client.
+    Hooking at this layer counts each network call exactly once, whether it came from
+    doc.get(), a WriteBatch, a transaction or a query stream. Idempotent.
+    """
+    from google.cloud.firestore_v1.services.firestore.client import FirestoreClient
+
+    for method_name in _FIRESTORE_RPCS:
+        fn = getattr(FirestoreClient, method_name, None)
+        if fn is None or getattr(fn, "_metrics_wrapped", False):
+            continue
+        setattr(FirestoreClient, method_name, _timed_rpc(method_name, fn))
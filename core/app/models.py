@@ -54,6 +54,7 @@ class UserCard(BaseModel):
     brand: str
     benefits: list[Benefit] | None = None
     sign_on_bonus: SignOnBonus | None = None
+    last4: str | None = None # Matches statements to this card (services/card_resolver.py)
 
 class RecommendationRequest(BaseModel):
     store_name: str
@@ -70,6 +71,8 @@ class RecommendationResponse(BaseModel):
     # Enhanced Fields
     corrected_store_name: str | None = None
     is_valid_store: bool = True
+    # 0-1 self-reported; low values escalate to a grounded model (services/model_routing.py)
+    confidence: float | None = None
 
 class ActionCenterCategory(str, Enum):
     CAR_RENTAL = "car_rental_insurance"
@@ -155,3 +158,40 @@ class AgentPublicState(BaseModel):
 
 class AgentStartRequest(BaseModel):
     goal: str
+
+# Gemini Structured Output Models
+# Passed as `response_schema` and used to validate replies (see services/structured_output.py)
+
+class CardSearchResult(BaseModel):
+    # Empty object ({}) means the query was not a real card
+    name: str | None = None
+    brand: str | None = None
+    benefits: list[Benefit] = []
+    confidence: float | None = None
+
+class CardBenefitsUpdate(BaseModel):
+    benefits: list[Benefit] = []
+
+class PriceCheckResult(BaseModel):
+    lowest_price: float | None = None
+    retailer: str | None = None
+    url: str | None = None
+
+class StatementTransaction(BaseModel):
+    date: str # YYYY-MM-DD
+    retailer: str
+    amount: float
+    card_name: str = "Credit Card"
+    card_last4: str | None = None
+    cashback_earned: float = 0.0
+
+class StatementExtraction(BaseModel):
+    transactions: list[StatementTransaction] = []
+
+class StatementProfile(BaseModel):
+    card_name: str = "Credit Card"
+    card_last4: str | None = None
+
+class AgentCycleResult(BaseModel):
+    thought_signature: str = ""
+    public_plan: AgentPublicState
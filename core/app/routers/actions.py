@@ -1,29 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from models import ActionItem, ActionCenterCategory, HelpRequest
 import auth
-import os
-from google import genai
-from google.genai import types
 from services.marathon_agent import MarathonAgent
+from services import gemini_gateway, usage, deadlines, fallbacks
+import metrics
 import jobs
 
 router = APIRouter(prefix="/actions", tags=["Action Center"])
 
-# Helper to get current user (duplicated from main.py, ideally shared in dependencies.py)
-from fastapi.security import OAuth2PasswordBearer
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
-        return auth.auth.verify_id_token(token, check_revoked=True)
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-
-def get_gemini_client():
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        return None
-    return genai.Client(api_key=api_key)
+from dependencies import get_current_user
 
 @router.post("/trigger-agent")
 def trigger_agent_debug(current_user: dict = Depends(get_current_user)):
@@ -77,7 +63,7 @@ def delete_item(category: ActionCenterCategory, item_id: str, current_user: dict
     return {"status": "success", "id": item_id}
 
 @router.post("/{category}/{item_id}/help", response_model=dict)
-def get_help_for_item(category: ActionCenterCategory, item_id: str, request: HelpRequest, current_user: dict = Depends(get_current_user)):
+async def get_help_for_item(category: ActionCenterCategory, item_id: str, request: HelpRequest, current_user: dict = Depends(get_current_user)):
     """
     Generates Gemini 3 Pro Preview help instructions for a specific claim/benefit.
     Saves the result to the item so it acts as a cache.
@@ -85,7 +71,7 @@ def get_help_for_item(category: ActionCenterCategory, item_id: str, request: Hel
     uid = current_user['uid']
     
     # 1. Fetch Item
-    item = auth.get_action_item(uid, category.value, item_id)
+    item = await run_in_threadpool(auth.get_action_item, uid, category.value, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
@@ -95,10 +81,13 @@ def get_help_for_item(category: ActionCenterCategory, item_id: str, request: Hel
     # But usually, checking if it exists prevents accidental costs. 
     # Let's assume hitting this endpoint forces a refresh or generation.
     
-    client = get_gemini_client()
-    if not client:
+    if not gemini_gateway.is_configured():
         raise HTTPException(status_code=503, detail="AI Service Unavailable")
 
+    # Over the daily soft budget: serve the saved instructions instead of regenerating
+    if item.get('gemini_instructions') and await usage.abudget_status(uid) != usage.BUDGET_OK:
+        return {"status": "success", "instructions": item['gemini_instructions'], "cached": True}
+
     # 3. Construct Prompt
     # "situation that a user is asking for {category} help on X card with the users additional info provided"
     
@@ -138,22 +127,32 @@ def get_help_for_item(category: ActionCenterCategory, item_id: str, request: Hel
     - Use clear headings or bullet points.
     """
     
-    try:
-        response = client.models.generate_content(
-            model='gemini-3-flash-preview',
-            contents=prompt,
-        )
+    async def generate_and_save():
+        response = await gemini_gateway.generate("help", contents=prompt, uid=uid)
         
         instructions = response.text.strip()
         
         # 4. Save to DB
-        auth.update_action_item(uid, category.value, item_id, {
+        await run_in_threadpool(auth.update_action_item, uid, category.value, item_id, {
             "help_requested": True,
             "gemini_instructions": instructions
         })
-        
+        return instructions
+
+    try:
+        # Past the deadline the tailored answer is still generated and saved to the item
+        instructions = await deadlines.with_deadline("help", generate_and_save(), keep_running=True)
         return {"status": "success", "instructions": instructions}
+
+    except deadlines.DeadlineExceededError:
+        if item.get('gemini_instructions'):
+            metrics.DEGRADED_RESPONSES.labels("help", "cached").inc()
+            return {"status": "success", "instructions": item['gemini_instructions'], "cached": True}
+        metrics.DEGRADED_RESPONSES.labels("help", "heuristic").inc()
+        return {"status": "success", "instructions": fallbacks.generic_help_instructions(category, card_name), "degraded": True}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Gemini Error: {e}")
         raise HTTPException(status_code=500, detail=f"AI Error: {str(e)}")
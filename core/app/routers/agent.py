@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from models import AgentStartRequest, AgentPublicState, MilestoneUpdateRequest
 import auth
-from services.marathon_agent import MarathonAgent
+import services.agent_queue as agent_queue
+from services import usage, doc_cache
 
 router = APIRouter(
     prefix="/agent",
@@ -9,29 +10,17 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# Shared Dependency (Assuming main.py exposes it or we import from main logic, 
-# but circular imports are bad. We should duplicate get_current_user extraction or move it to a shared dependency file.
-# For now, I'll rely on `main.py` having it, but `agent.py` can't import `main`.
-# So I need to implement `get_current_user` logic here or move `get_current_user` to `auth.py` or `dependencies.py`.
-# Checking `auth.py`, it has `verify_id_token`.
-# I will implement a local dependency here to avoid main import issues.
-from fastapi.security import OAuth2PasswordBearer
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
-        decoded_token = auth.auth.verify_id_token(token, check_revoked=True)
-        return decoded_token
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Invalid token")
+from dependencies import get_current_user
 
 @router.post("/start")
-def start_agent(request: AgentStartRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+def start_agent(request: AgentStartRequest, current_user: dict = Depends(get_current_user)):
     """
     Initializes the CreditAgent with a goal and triggers the first run immediately.
     """
     uid = current_user['uid']
     print(f"Starting agent for {uid} with goal: {request.goal}")
+    # Refuse up front rather than leaving the UI "thinking" on a run that can't call Gemini
+    usage.ensure_within_budget(uid)
     
     try:
         # 1. Set the goal in Public State
@@ -45,10 +34,10 @@ def start_agent(request: AgentStartRequest, background_tasks: BackgroundTasks, c
             "reasoning_summary": "Agent is starting...",
             "optional_tasks": [] # Clear side quests
         }, merge=True)
+        doc_cache.invalidate(uid, doc_cache.AGENT_STATE)
         
-        # 2. Trigger Agent Cycle in Background
-        agent = MarathonAgent()
-        background_tasks.add_task(agent.run_agent_cycle, uid)
+        # 2. Queue the first Agent Cycle (no debounce: a new goal should start right away)
+        agent_queue.enqueue_agent_run(uid, reason="start", debounce_seconds=0)
         
         return {"status": "started", "message": "Agent is thinking..."}
         
@@ -63,11 +52,7 @@ def get_agent_state(current_user: dict = Depends(get_current_user)):
     """
     uid = current_user['uid']
     try:
-        public_ref = auth.db.collection('users').document(uid).collection('public_agent_state').document('main')
-        doc = public_ref.get()
-        if doc.exists:
-            return doc.to_dict()
-        return None
+        return auth.get_agent_state(uid)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -75,7 +60,6 @@ def get_agent_state(current_user: dict = Depends(get_current_user)):
 async def update_milestone(
     milestone_id: str,
     update_data: MilestoneUpdateRequest,
-    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """Update progress, notes, or status of a specific milestone."""
@@ -117,10 +101,10 @@ async def update_milestone(
         # This ensures the client sees "thinking" immediately upon return
         state.status = "thinking"
         public_ref.set(state.dict(), merge=True)
+        doc_cache.invalidate(uid, doc_cache.AGENT_STATE)
         
-        # Trigger Agent to re-evaluate based on user update
-        agent = MarathonAgent()
-        background_tasks.add_task(agent.run_agent_cycle, uid)
+        # Queue Agent re-evaluation (debounced: several quick edits -> one run)
+        agent_queue.enqueue_agent_run(uid, reason="milestone_update")
         
         return {"status": "success", "milestone": milestone}
 
@@ -131,7 +115,6 @@ async def update_milestone(
 @router.post("/tasks/{task_id}/complete")
 async def complete_optional_task(
     task_id: str,
-    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
     """Marks a side quest as complete and triggers the agent."""
@@ -157,11 +140,11 @@ async def complete_optional_task(
         state.status = "thinking"
         # Save
         public_ref.set(state.dict(), merge=True)
+        doc_cache.invalidate(uid, doc_cache.AGENT_STATE)
         
         # Trigger Agent
-        print(f"Side Quest {task_id} completed for {uid}. Triggering agent...")
-        agent = MarathonAgent()
-        background_tasks.add_task(agent.run_agent_cycle, uid)
+        print(f"Side Quest {task_id} completed for {uid}. Queueing agent...")
+        agent_queue.enqueue_agent_run(uid, reason="task_complete")
         
         return {"status": "success", "message": "Quest completed!"}
         
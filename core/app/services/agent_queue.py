@@ -0,0 +1,221 @@
+import os
+from datetime import datetime, timedelta, timezone
+import auth
+from firebase_admin import firestore
+
+# Durable per-user queue of MarathonAgent run requests.
+# Layout: agent_run_queue/{uid}
+# {
+#     "uid": "...",
+#     "status": "pending" | "running",
+#     "run_after": <timestamp>,          # debounced due time
+#     "first_requested_at": <timestamp>, # start of the current burst (caps the debounce)
+#     "requested_at": <timestamp>,       # most recent trigger
+#     "trigger_count": 3,
+#     "last_reason": "milestone_update",
+#     "rerun_requested": False,          # a trigger arrived while the run was in flight
+#     "lease_expires_at": <timestamp>,   # only while running
+#     "attempts": 0
+# }
+# Every trigger pushes run_after forward by the debounce window, so a burst of edits
+# collapses into ONE cycle that reads the latest state. Because the queue lives in
+# Firestore (not in FastAPI BackgroundTasks), pending runs survive instance restarts.
+
+QUEUE_COLLECTION = "agent_run_queue"
+
+AGENT_RUN_DEBOUNCE_SECONDS = float(os.getenv("AGENT_RUN_DEBOUNCE_SECONDS", "30"))
+AGENT_RUN_MAX_DELAY_SECONDS = float(os.getenv("AGENT_RUN_MAX_DELAY_SECONDS", "120"))
+AGENT_RUN_LEASE_SECONDS = float(os.getenv("AGENT_RUN_LEASE_SECONDS", "600"))
+AGENT_RUN_MAX_ATTEMPTS = int(os.getenv("AGENT_RUN_MAX_ATTEMPTS", "3"))
+AGENT_RUN_BATCH_SIZE = int(os.getenv("AGENT_RUN_BATCH_SIZE", "10"))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def compute_run_after(now: datetime, first_requested_at: datetime | None, debounce_seconds: float, max_delay_seconds: float) -> datetime:
+    """
+    Debounced due time for a trigger arriving at `now`.
+    Each trigger pushes the run back by `debounce_seconds`, but never past
+    `first_requested_at + max_delay_seconds` so a steady stream of edits cannot starve the run.
+    """
+    run_after = now + timedelta(seconds=debounce_seconds)
+    if first_requested_at:
+        deadline = first_requested_at + timedelta(seconds=max_delay_seconds)
+        if run_after > deadline:
+            run_after = max(deadline, now)
+    return run_after
+
+
+def is_claimable(entry: dict, now: datetime) -> bool:
+    """A queue entry can be claimed if it is pending and due, or if a previous worker's lease expired."""
+    status = entry.get('status')
+    if status == 'pending':
+        run_after = entry.get('run_after')
+        return run_after is None or run_after <= now
+    if status == 'running':
+        lease = entry.get('lease_expires_at')
+        return lease is None or lease <= now
+    return False
+
+
+def _queue_ref(uid: str):
+    return auth.db.collection(QUEUE_COLLECTION).document(uid)
+
+
+def enqueue_agent_run(uid: str, reason: str = "manual", debounce_seconds: float | None = None):
+    """
+    Requests an agent cycle for `uid`. Safe to call many times in a row:
+    triggers inside the debounce window coalesce into a single run.
+    """
+    if debounce_seconds is None:
+        debounce_seconds = AGENT_RUN_DEBOUNCE_SECONDS
+
+    ref = _queue_ref(uid)
+
+    @firestore.transactional
+    def _enqueue(transaction):
+        snap = ref.get(transaction=transaction)
+        entry = snap.to_dict() if snap.exists else {}
+        now = _now()
+
+        first_requested_at = entry.get('first_requested_at') if entry else None
+        if not first_requested_at or entry.get('status') not in ('pending', 'running'):
+            first_requested_at = now
+
+        run_after = compute_run_after(now, first_requested_at, debounce_seconds, AGENT_RUN_MAX_DELAY_SECONDS)
+
+        if entry.get('status') == 'running' and not is_claimable(entry, now):
+            # A cycle is already in flight with (possibly) stale inputs.
+            # Flag it so the worker re-queues once the current run finishes.
+            transaction.update(ref, {
+                "rerun_requested": True,
+                "run_after": run_after,
+                "requested_at": now,
+                "last_reason": reason,
+                "trigger_count": firestore.Increment(1)
+            })
+            return "rerun_requested"
+
+        transaction.set(ref, {
+            "uid": uid,
+            "status": "pending",
+            "run_after": run_after,
+            "first_requested_at": first_requested_at,
+            "requested_at": now,
+            "last_reason": reason,
+            "trigger_count": firestore.Increment(1),
+            "rerun_requested": False,
+            "attempts": entry.get('attempts', 0) if entry.get('status') == 'pending' else 0
+        }, merge=True)
+        return "queued"
+
+    result = _enqueue(auth.db.transaction())
+    print(f"🗂️ Agent run {result} for {uid} (reason: {reason})")
+    return result
+
+
+def _claim(uid: str):
+    """Atomically flips a due entry to 'running'. Returns the claimed entry or None if another worker won."""
+    ref = _queue_ref(uid)
+
+    @firestore.transactional
+    def _claim_txn(transaction):
+        snap = ref.get(transaction=transaction)
+        if not snap.exists:
+            return None
+        entry = snap.to_dict()
+        now = _now()
+        if not is_claimable(entry, now):
+            return None
+        transaction.update(ref, {
+            "status": "running",
+            "claimed_at": now,
+            "lease_expires_at": now + timedelta(seconds=AGENT_RUN_LEASE_SECONDS),
+            "rerun_requested": False,
+            "attempts": firestore.Increment(1)
+        })
+        entry['attempts'] = entry.get('attempts', 0) + 1
+        return entry
+
+    return _claim_txn(auth.db.transaction())
+
+
+def _finish(uid: str, succeeded: bool, attempts: int):
+    """
+    Releases the lease. If new triggers arrived mid-run (or the run failed and has
+    attempts left) the entry goes back to 'pending'; otherwise it is removed.
+    """
+    ref = _queue_ref(uid)
+
+    @firestore.transactional
+    def _finish_txn(transaction):
+        snap = ref.get(transaction=transaction)
+        if not snap.exists:
+            return
+        entry = snap.to_dict()
+        now = _now()
+
+        if entry.get('rerun_requested'):
+            transaction.update(ref, {
+                "status": "pending",
+                "rerun_requested": False,
+                "first_requested_at": entry.get('requested_at') or now,
+                "lease_expires_at": firestore.DELETE_FIELD,
+                "attempts": 0
+            })
+        elif not succeeded and attempts < AGENT_RUN_MAX_ATTEMPTS:
+            # Linear backoff before retrying a failed cycle
+            transaction.update(ref, {
+                "status": "pending",
+                "run_after": now + timedelta(seconds=AGENT_RUN_DEBOUNCE_SECONDS * attempts),
+                "lease_expires_at": firestore.DELETE_FIELD
+            })
+        else:
+            transaction.delete(ref)
+
+    _finish_txn(auth.db.transaction())
+
+
+def process_agent_queue(limit: int | None = None):
+    """
+    Drains due queue entries and runs one agent cycle per user.
+    Called periodically by the scheduler; claims are transactional so several
+    instances can drain the same queue without double-running a user.
+    """
+    from services.marathon_agent import MarathonAgent
+
+    limit = limit or AGENT_RUN_BATCH_SIZE
+    now = _now()
+
+    # run_after is also set on running entries, so expired leases are picked up here too.
+    due_docs = auth.db.collection(QUEUE_COLLECTION)\
+        .where('run_after', '<=', now)\
+        .order_by('run_after')\
+        .limit(limit)\
+        .stream()
+
+    processed = 0
+    agent = None
+    for doc in due_docs:
+        uid = doc.id
+        entry = _claim(uid)
+        if not entry:
+            continue
+
+        if agent is None:
+            agent = MarathonAgent()
+
+        print(f"🗂️ Running queued agent cycle for {uid} ({entry.get('trigger_count', 1)} trigger(s), last: {entry.get('last_reason')})")
+        succeeded = False
+        try:
+            agent.run_agent_cycle(uid)
+            succeeded = True
+        except Exception as e:
+            print(f"❌ Queued agent run failed for {uid}: {e}")
+        finally:
+            _finish(uid, succeeded, entry.get('attempts', 1))
+        processed += 1
+
+    return processed
@@ -0,0 +1,163 @@
+import os
+import time
+import random
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1.transforms import Increment
+
+# Chunked, parallel Firestore writes.
+#
+# A single WriteBatch is limited to 500 writes, so large statements used to fail outright.
+# commit() splits a list of writes into batches of BULK_WRITE_CHUNK_SIZE, commits up to
+# BULK_WRITE_CONCURRENCY of them at once (worker threads; the client is blocking) and
+# retries contention / transient errors with jittered backoff. A chunk that still fails is
+# replayed one write at a time, so failures are reported per document, not per chunk.
+#
+# Batches are atomic, the whole commit() is not: a document should appear at most once in
+# a call, and callers that derive totals from the writes should use result.failed.
+#
+# Batches carrying firestore.Increment are not idempotent: after a timeout or an internal
+# error the commit may still have been applied, and running it again would count twice.
+# Those are retried only on Aborted (definitely not applied) and are never replayed after
+# an ambiguous error; their writes are reported as failed instead.
+
+BULK_WRITE_CHUNK_SIZE = int(os.getenv("BULK_WRITE_CHUNK_SIZE", "400"))
+BULK_WRITE_CONCURRENCY = int(os.getenv("BULK_WRITE_CONCURRENCY", "4"))
+BULK_WRITE_RETRIES = int(os.getenv("BULK_WRITE_RETRIES", "3"))
+
+# Firestore's hard limit per commit
+_MAX_BATCH = 500
+
+_RETRYABLE = (
+    gexc.Aborted,              # contention
+    gexc.DeadlineExceeded,
+    gexc.ServiceUnavailable,
+    gexc.ResourceExhausted,
+    gexc.InternalServerError,
+)
+# The commit may or may not have been applied
+_AMBIGUOUS = (
+    gexc.DeadlineExceeded,
+    gexc.ServiceUnavailable,
+    gexc.InternalServerError,
+    gexc.Unknown,
+)
+
+
+@dataclass
+class Write:
+    kind: str                  # "set" | "update" | "delete"
+    ref: object                # DocumentReference
+    data: dict
+    merge: bool | list = False  # True, or the field paths to replace
+
+    @property
+    def path(self) -> str:
+        return self.ref.path
+
+
+def set_doc(ref, data: dict, merge: bool | list = False) -> Write:
+    return Write("set", ref, data, merge)
+
+
+def update_doc(ref, data: dict) -> Write:
+    return Write("update", ref, data)
+
+
+def delete_doc(ref) -> Write:
+    return Write("delete", ref, {})
+
+
+@dataclass
+class BulkWriteResult:
+    written: int = 0
+    # document path -> error message
+    failed: dict = field(default_factory=dict)
+    chunks: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+def _commit_batch(db, writes: list[Write]):
+    batch = db.batch()
+    for write in writes:
+        if write.kind == "set":
+            batch.set(write.ref, write.data, merge=write.merge)
+        elif write.kind == "delete":
+            batch.delete(write.ref)
+        else:
+            batch.update(write.ref, write.data)
+    batch.commit()
+
+
+def _has_increment(value) -> bool:
+    if isinstance(value, Increment):
+        return True
+    if isinstance(value, dict):
+        return any(_has_increment(item) for item in value.values())
+    return False
+
+
+def _idempotent(writes: list[Write]) -> bool:
+    return not any(_has_increment(write.data) for write in writes)
+
+
+def _with_retries(db, writes: list[Write]):
+    retryable = _RETRYABLE if _idempotent(writes) else (gexc.Aborted,)
+    for attempt in range(BULK_WRITE_RETRIES + 1):
+        try:
+            return _commit_batch(db, writes)
+        except retryable as e:
+            if attempt == BULK_WRITE_RETRIES:
+                raise
+            delay = 0.2 * (2 ** attempt) * (1 + random.random())
+            print(f"⚠️ Batch of {len(writes)} writes failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _commit_chunk(db, writes: list[Write]) -> tuple[int, dict]:
+    try:
+        _with_retries(db, writes)
+        return len(writes), {}
+    except Exception as e:
+        if len(writes) == 1:
+            return 0, {writes[0].path: str(e)}
+        if isinstance(e, _AMBIGUOUS) and not _idempotent(writes):
+            # Replaying could apply the increments a second time
+            print(f"❌ Batch of {len(writes)} writes with increments failed ({type(e).__name__}), not replaying")
+            return 0, {write.path: str(e) for write in writes}
+        print(f"⚠️ Batch of {len(writes)} writes failed ({e}), writing one at a time")
+
+    written, failed = 0, {}
+    for write in writes:
+        try:
+            _with_retries(db, [write])
+            written += 1
+        except Exception as e:
+            failed[write.path] = str(e)
+    return written, failed
+
+
+def commit(db, writes: list[Write], chunk_size: int | None = None) -> BulkWriteResult:
+    """Commits `writes` in parallel batches. Blocking; never raises for failed writes."""
+    size = max(1, min(chunk_size or BULK_WRITE_CHUNK_SIZE, _MAX_BATCH))
+    chunks = [writes[start:start + size] for start in range(0, len(writes), size)]
+    result = BulkWriteResult(chunks=len(chunks))
+    if not chunks:
+        return result
+
+    if len(chunks) == 1:
+        outcomes = [_commit_chunk(db, chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(BULK_WRITE_CONCURRENCY, len(chunks))) as pool:
+            outcomes = list(pool.map(lambda chunk: _commit_chunk(db, chunk), chunks))
+
+    for written, failed in outcomes:
+        result.written += written
+        result.failed.update(failed)
+    if result.failed:
+        print(f"❌ {len(result.failed)} of {len(writes)} writes failed")
+    return result
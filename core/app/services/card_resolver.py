@@ -0,0 +1,116 @@
+import re
+
+# Maps the card_name extracted from a statement to a card in the user's wallet.
+#
+# Built once per upload from the wallet, then each distinct card_name is resolved once:
+#   1. card last-4 (statement `card_last4` == wallet `last4`), when both are known
+#   2. issuer must agree when both names carry one ("Chase ..." never matches an Amex card)
+#   3. product tokens (name minus issuer and filler words, aliases expanded):
+#      - equal token sets match
+#      - one set containing the other ("Sapphire" / "Sapphire Reserve") matches only if
+#        exactly one wallet card qualifies
+# Anything ambiguous resolves to None rather than to the wrong card, so "Sapphire
+# Preferred" spending never counts towards a "Sapphire Reserve" bonus.
+
+_ISSUERS = {
+    "chase": ["chase", "jpmorgan"],
+    "amex": ["american express", "amex", "americanexpress"],
+    "capital_one": ["capital one", "capitalone", "cap one"],
+    "citi": ["citi", "citibank", "citicards"],
+    "discover": ["discover"],
+    "wells_fargo": ["wells fargo"],
+    "bank_of_america": ["bank of america", "bofa"],
+    "us_bank": ["us bank", "u.s. bank"],
+    "barclays": ["barclays", "barclaycard"],
+    "apple": ["apple card"],
+}
+
+# Product shorthands statements and users write
+_ALIASES = {
+    "csr": "sapphire reserve",
+    "csp": "sapphire preferred",
+    "cfu": "freedom unlimited",
+    "cff": "freedom flex",
+    "bcp": "blue cash preferred",
+    "bce": "blue cash everyday",
+    "plat": "platinum",
+}
+
+_FILLER = {"card", "credit", "the", "from", "by", "visa", "mastercard", "signature", "infinite",
+           "world", "elite", "rewards", "account", "r", "tm"}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(name: str) -> tuple[str | None, frozenset]:
+    """(issuer key or None, product tokens) for a card name."""
+    text = (name or "").lower().replace("®", " ").replace("™", " ")
+    issuer = None
+    for key, spellings in _ISSUERS.items():
+        for spelling in spellings:
+            pattern = r"\b" + re.escape(spelling) + r"\b"
+            if re.search(pattern, text):
+                issuer = issuer or key
+                text = re.sub(pattern, " ", text)
+    for short, full in _ALIASES.items():
+        text = re.sub(r"\b" + short + r"\b", full, text)
+    tokens = frozenset(word for word in _WORD.findall(text) if word not in _FILLER)
+    return issuer, tokens
+
+
+class CardResolver:
+    def __init__(self, wallet: list[dict]):
+        self.wallet = wallet
+        self._cards = []
+        for card in wallet:
+            names = [card.get('name') or card.get('card_id') or ""] + list(card.get('aliases') or [])
+            self._cards.append((card, [_normalize(name) for name in names], str(card.get('last4') or "")))
+        self._resolved = {}
+
+    def resolve(self, card_name: str | None, last4: str | None = None) -> dict | None:
+        """The wallet card for an extracted card_name (and last-4 if known), or None."""
+        key = (card_name or "", last4 or "")
+        if key not in self._resolved:
+            self._resolved[key] = self._resolve(*key)
+        return self._resolved[key]
+
+    def _resolve(self, card_name: str, last4: str) -> dict | None:
+        if last4:
+            by_last4 = [card for card, _, card_last4 in self._cards if card_last4 and card_last4 == last4]
+            if len(by_last4) == 1:
+                return by_last4[0]
+
+        issuer, tokens = _normalize(card_name)
+        if not tokens and not issuer:
+            return None
+
+        exact, partial = [], []
+        for card, names, _ in self._cards:
+            for card_issuer, card_tokens in names:
+                if issuer and card_issuer and issuer != card_issuer:
+                    continue
+                if tokens == card_tokens and tokens:
+                    exact.append(card)
+                    break
+                if tokens and card_tokens and (tokens < card_tokens or card_tokens < tokens):
+                    partial.append(card)
+                    break
+                if not tokens and issuer == card_issuer:
+                    # "Chase Credit Card": only if it is the only card from that issuer
+                    partial.append(card)
+                    break
+
+        if len(exact) == 1:
+            return exact[0]
+        if not exact and len(partial) == 1:
+            return partial[0]
+        return None
+
+    def group(self, transactions: list[dict]) -> dict[str, list[dict]]:
+        """card_id -> its transactions, in one pass. Rows that don't resolve are left out."""
+        groups = {}
+        for tx in transactions:
+            card = self.resolve(tx.get('card_name'), tx.get('card_last4'))
+            if card is not None and card.get('card_id'):
+                groups.setdefault(card['card_id'], []).append(tx)
+        return groups
@@ -0,0 +1,143 @@
+import re
+from functools import lru_cache
+import numpy as np
+import auth
+from services import card_resolver
+
+# Server-side cashback for extracted statement transactions.
+#
+# Extraction (Gemini or services/statement_parsers.py) only reads rows. Cashback comes from
+#   - the card's stored catalog benefits (global `cards` docs, via the user's wallet),
+#     turned into a rate per spending category by card_rates(), and
+#   - a merchant -> category mapping (categorize()).
+# All rows of a statement are computed at once with numpy:
+#   cashback = amount * rate[card, category]   (purchases only)
+# so the same transaction on the same card always earns the same amount.
+#
+# Multipliers count as percent back ("3x Dining" -> 3%), as the extraction prompt did.
+
+CATEGORIES = ["Other", "Dining", "Grocery", "Travel", "Gas", "Transit", "Streaming", "Drugstore", "Entertainment"]
+_INDEX = {name: i for i, name in enumerate(CATEGORIES)}
+
+BASE_RATE = 0.01
+# Anything above this in a benefit title is a redemption bonus, not an earning rate
+_MAX_RATE = 0.10
+
+# Words in benefit titles that name a category
+_BENEFIT_KEYWORDS = {
+    "Dining": ["dining", "restaurant", "food delivery", "takeout"],
+    "Grocery": ["grocery", "groceries", "supermarket"],
+    "Travel": ["travel", "flight", "airfare", "airline", "hotel", "car rental", "cruise"],
+    "Gas": ["gas", "fuel", "ev charging"],
+    "Transit": ["transit", "rideshare", "commut", "parking", "tolls"],
+    "Streaming": ["streaming"],
+    "Drugstore": ["drugstore", "pharmac"],
+    "Entertainment": ["entertainment", "concert", "movie", "ticket"],
+}
+_BASE_KEYWORDS = ["all other", "everything", "every purchase", "all purchases", "everywhere", "other purchases"]
+
+# Merchant names / words -> category (checked in order, first hit wins; matched at word starts)
+_MERCHANT_WORDS = [
+    ("Dining", ["uber eats", "doordash", "grubhub", "postmates", "starbucks", "dunkin", "mcdonald", "chipotle",
+                "panera", "subway", "chick-fil-a", "taco bell", "domino", "pizza", "restaurant", "cafe", "coffee",
+                "grill", "bistro", "kitchen", "bar ", "diner", "sushi", "burger", "blue bottle", "sweetgreen"]),
+    ("Grocery", ["whole foods", "trader joe", "kroger", "safeway", "publix", "wegmans", "aldi", "h-e-b", "heb ",
+                 "sprouts", "albertsons", "instacart", "grocery", "market", "supermarket"]),
+    ("Gas", ["shell", "chevron", "exxon", "mobil", "bp ", "arco", "valero", "sunoco", "speedway", "wawa", "fuel", "gas"]),
+    ("Transit", ["uber", "lyft", "mta", "bart", "metro", "transit", "parking", "toll", "amtrak"]),
+    ("Travel", ["airlines", "airline", "air lines", "delta", "united", "american air", "southwest", "jetblue",
+                "alaska air", "marriott", "hilton", "hyatt", "airbnb", "expedia", "booking.com", "hotel",
+                "hertz", "avis", "enterprise rent"]),
+    ("Streaming", ["netflix", "spotify", "hulu", "disney+", "disney plus", "hbo", "max.com", "youtube premium",
+                   "apple music", "paramount+", "peacock"]),
+    ("Drugstore", ["cvs", "walgreens", "rite aid", "pharmacy"]),
+    ("Entertainment", ["ticketmaster", "stubhub", "amc ", "regal", "cinema", "theater", "theatre", "live nation"]),
+]
+
+_MERCHANTS = [
+    (category, re.compile(r"\b(" + "|".join(re.escape(word) for word in words) + ")"))
+    for category, words in _MERCHANT_WORDS
+]
+
+_RATE = re.compile(r"(\d+(?:\.\d+)?)\s*(x|%)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=20000)
+def categorize(retailer: str) -> str:
+    """Spending category for a (cleaned) retailer name; 'Other' if unknown."""
+    name = f"{(retailer or '').lower()} "
+    for category, pattern in _MERCHANTS:
+        if pattern.search(name):
+            return category
+    return "Other"
+
+
+def card_rates(benefits: list | None) -> np.ndarray:
+    """Rate per category (indexed like CATEGORIES) from a card's benefit titles."""
+    base_rates = []
+    bonus = {}
+    for benefit in benefits or []:
+        title = (benefit.get("title") if isinstance(benefit, dict) else getattr(benefit, "title", "")) or ""
+        values = [float(v) / 100 for v, _ in _RATE.findall(title)]
+        values = [v for v in values if v <= _MAX_RATE]
+        if not values:
+            continue
+        rate = max(values)
+        text = title.lower()
+        if any(word in text for word in _BASE_KEYWORDS):
+            base_rates.append(rate)
+            continue
+        for category, words in _BENEFIT_KEYWORDS.items():
+            if any(word in text for word in words):
+                bonus[category] = max(bonus.get(category, 0.0), rate)
+
+    base = max(base_rates) if base_rates else BASE_RATE
+    rates = np.full(len(CATEGORIES), base)
+    for category, rate in bonus.items():
+        rates[_INDEX[category]] = max(rate, base)
+    return rates
+
+
+def compute(amounts, category_index, card_index, rate_matrix) -> np.ndarray:
+    """Cashback for every row at once. Credits and payments (amount <= 0) earn nothing."""
+    amounts = np.asarray(amounts, dtype=float)
+    rates = rate_matrix[np.asarray(card_index, dtype=int), np.asarray(category_index, dtype=int)]
+    return np.where(amounts > 0, np.round(amounts * rates, 2), 0.0)
+
+
+# MARK: - Statements
+
+def _card_key(tx: dict) -> tuple[str, str]:
+    return (tx.get("card_name") or "Credit Card", tx.get("card_last4") or "")
+
+
+def apply(uid: str, transactions: list[dict], wallet: list | None = None) -> list[dict]:
+    """
+    Sets `category` and `cashback_earned` on each transaction from the card's catalog
+    benefits (wallet card, else the global catalog, else the base rate). Blocking reads.
+    """
+    if not transactions:
+        return transactions
+    if wallet is None:
+        wallet = auth.get_user_cards(uid)
+
+    resolver = card_resolver.CardResolver(wallet)
+    # One rate row per distinct (card_name, card_last4): same-named cards can earn differently
+    card_keys = sorted({_card_key(tx) for tx in transactions})
+    rate_matrix = np.empty((len(card_keys), len(CATEGORIES)))
+    for i, (card_name, last4) in enumerate(card_keys):
+        card = resolver.resolve(card_name, last4 or None) or auth.get_global_card(card_name)
+        rate_matrix[i] = card_rates((card or {}).get("benefits"))
+
+    card_slot = {key: i for i, key in enumerate(card_keys)}
+    categories = [categorize(tx.get("retailer") or "") for tx in transactions]
+    cashback = compute(
+        [tx.get("amount") or 0.0 for tx in transactions],
+        [_INDEX[category] for category in categories],
+        [card_slot[_card_key(tx)] for tx in transactions],
+        rate_matrix
+    )
+    for tx, category, earned in zip(transactions, categories, cashback.tolist()):
+        tx["category"] = category
+        tx["cashback_earned"] = earned
+    return transactions
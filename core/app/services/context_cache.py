@@ -0,0 +1,224 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+from dataclasses import dataclass
+from google.genai import errors, types
+import metrics
+
+# Gemini context caching for the static prompt prefixes in services/prompts.py.
+#
+# A call site passes its static rules as `config.system_instruction` plus a `cache_key`.
+# The first call for a (key, model) uploads that prefix (and the tools, which must live
+# in the cache too) with a TTL; later calls send only `cached_content=<name>` + the dynamic
+# prompt, so the prefix is billed at the cached rate and not re-processed.
+#
+# - Caches are re-created automatically shortly before the TTL runs out, when the prefix
+#   text changes (fingerprint), or when Gemini reports the cache as gone.
+# - If creation fails (e.g. the prefix is below the model's minimum cacheable size, or the
+#   API key has no caching quota) we back off for CONTEXT_CACHE_RETRY_SECONDS and send the
+#   prefix inline. Callers never see the difference.
+#
+# GEMINI_CONTEXT_CACHE=off disables it entirely (the prefix is always sent inline).
+
+CONTEXT_CACHE_MODE = os.getenv("GEMINI_CONTEXT_CACHE", "gemini").lower()  # gemini | off
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Re-create this long before expiry so a slow in-flight call never references a dead cache.
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", "120"))
+CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", "900"))
+
+
+@dataclass
+class _Entry:
+    name: str
+    fingerprint: str
+    expires_at: float
+
+
+class GeminiCacheBackend:
+    """Creates real Gemini context caches via client.caches."""
+
+    def create(self, client, model: str, key: str, config: types.GenerateContentConfig, ttl_seconds: int) -> str:
+        return client.caches.create(model=model, config=self._cache_config(key, config, ttl_seconds)).name
+
+    async def acreate(self, client, model: str, key: str, config: types.GenerateContentConfig, ttl_seconds: int) -> str:
+        cache = await client.aio.caches.create(model=model, config=self._cache_config(key, config, ttl_seconds))
+        return cache.name
+
+    @staticmethod
+    def _cache_config(key, config, ttl_seconds):
+        return types.CreateCachedContentConfig(
+            display_name=f"benefits-navigator-{key}",
+            system_instruction=config.system_instruction,
+            tools=config.tools,
+            tool_config=config.tool_config,
+            ttl=f"{ttl_seconds}s"
+        )
+
+
+class LocalCacheBackend:
+    """
+    In-process stand-in for tests: "creating" a cache only records the prefix under a
+    fake name, so hits, expiry and re-creation can be checked without the API.
+    """
+
+    def __init__(self):
+        self.prefixes = {}
+        self.create_calls = 0
+
+    def create(self, client, model, key, config, ttl_seconds) -> str:
+        self.create_calls += 1
+        name = f"cachedContents/local-{key}-{self.create_calls}"
+        self.prefixes[name] = config.system_instruction
+        return name
+
+    async def acreate(self, client, model, key, config, ttl_seconds) -> str:
+        return self.create(client, model, key, config, ttl_seconds)
+
+
+def _fingerprint(config: types.GenerateContentConfig) -> str:
+    return repr((config.system_instruction, config.tools, config.tool_config))
+
+
+def _with_cached_content(config: types.GenerateContentConfig, name: str) -> types.GenerateContentConfig:
+    # system_instruction / tools live in the cache and may not be repeated in the request.
+    return config.model_copy(update={
+        "cached_content": name,
+        "system_instruction": None,
+        "tools": None,
+        "tool_config": None
+    })
+
+
+def is_cache_miss(error: Exception) -> bool:
+    """Gemini answers 403/404 for a cachedContents name that expired or was deleted."""
+    return isinstance(error, errors.ClientError) and error.code in (403, 404)
+
+
+class ContextCache:
+    """Maps (cache_key, model) to a live cached_content name, creating it on demand."""
+
+    def __init__(
+        self,
+        backend,
+        ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+        refresh_margin_seconds: int = CONTEXT_CACHE_REFRESH_MARGIN_SECONDS,
+        retry_seconds: int = CONTEXT_CACHE_RETRY_SECONDS,
+        clock=time.time
+    ):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self._entries = {}
+        self._failed_until = {}
+        self._lock = threading.Lock()
+        self._async_locks = weakref.WeakKeyDictionary()
+
+    # MARK: - Bookkeeping
+
+    def _cacheable(self, config) -> bool:
+        return (
+            self.backend is not None
+            and config is not None
+            and bool(config.system_instruction)
+            and not config.cached_content
+        )
+
+    def _lookup(self, key, model, fingerprint):
+        entry = self._entries.get((key, model))
+        if entry is None or entry.fingerprint != fingerprint:
+            return None
+        if self.clock() >= entry.expires_at - self.refresh_margin_seconds:
+            return None
+        return entry.name
+
+    def _may_create(self, key, model) -> bool:
+        return self._failed_until.get((key, model), 0) <= self.clock()
+
+    def _hit(self, key, name, config):
+        metrics.GEMINI_CONTEXT_CACHE.labels(key, "hit").inc()
+        return _with_cached_content(config, name)
+
+    def _inline(self, key, config):
+        metrics.GEMINI_CONTEXT_CACHE.labels(key, "inline").inc()
+        return config
+
+    def _created(self, key, model, fingerprint, name, config):
+        self._entries[(key, model)] = _Entry(name, fingerprint, self.clock() + self.ttl_seconds)
+        self._failed_until.pop((key, model), None)
+        metrics.GEMINI_CONTEXT_CACHE.labels(key, "created").inc()
+        print(f"🗄️ Context cache ready for {key} on {model}: {name}")
+        return _with_cached_content(config, name)
+
+    def _create_failed(self, key, model, error, config):
+        self._failed_until[(key, model)] = self.clock() + self.retry_seconds
+        metrics.GEMINI_CONTEXT_CACHE.labels(key, "create_failed").inc()
+        print(f"⚠️ Context cache for {key} unavailable, sending prefix inline: {error}")
+        return self._inline(key, config)
+
+    def _async_lock(self):
+        loop = asyncio.get_running_loop()
+        lock = self._async_locks.get(loop)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._async_locks[loop] = lock
+        return lock
+
+    def invalidate(self, key: str, model: str):
+        """Forgets a cache Gemini no longer knows about; the next call re-creates it."""
+        if self._entries.pop((key, model), None) is not None:
+            metrics.GEMINI_CONTEXT_CACHE.labels(key, "invalidated").inc()
+
+    # MARK: - Apply
+
+    def apply(self, client, key: str, model: str, config: types.GenerateContentConfig | None):
+        """
+        Returns the config to send: the static prefix swapped for a cached_content reference,
+        or `config` unchanged when caching is off or unavailable.
+        """
+        if not self._cacheable(config):
+            return config
+        fingerprint = _fingerprint(config)
+        name = self._lookup(key, model, fingerprint)
+        if name:
+            return self._hit(key, name, config)
+
+        with self._lock:
+            # Another thread may have created it while we waited
+            name = self._lookup(key, model, fingerprint)
+            if name:
+                return self._hit(key, name, config)
+            if not self._may_create(key, model):
+                return self._inline(key, config)
+            try:
+                name = self.backend.create(client, model, key, config, self.ttl_seconds)
+            except Exception as e:
+                return self._create_failed(key, model, e, config)
+            return self._created(key, model, fingerprint, name, config)
+
+    async def apply_async(self, client, key: str, model: str, config: types.GenerateContentConfig | None):
+        """apply() for the event loop: a burst of concurrent requests creates ONE cache."""
+        if not self._cacheable(config):
+            return config
+        fingerprint = _fingerprint(config)
+        name = self._lookup(key, model, fingerprint)
+        if name:
+            return self._hit(key, name, config)
+
+        async with self._async_lock():
+            name = self._lookup(key, model, fingerprint)
+            if name:
+                return self._hit(key, name, config)
+            if not self._may_create(key, model):
+                return self._inline(key, config)
+            try:
+                name = await self.backend.acreate(client, model, key, config, self.ttl_seconds)
+            except Exception as e:
+                return self._create_failed(key, model, e, config)
+            return self._created(key, model, fingerprint, name, config)
+
+
+default_cache = ContextCache(GeminiCacheBackend() if CONTEXT_CACHE_MODE != "off" else None)
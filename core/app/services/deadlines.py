@@ -0,0 +1,140 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+import metrics
+
+# Latency control for interactive Gemini calls.
+#
+# Hedging (inside gemini_gateway.generate, for GEMINI_HEDGE_CALL_SITES only):
+#   if an attempt is still running after the call site's recent p<GEMINI_HEDGE_PERCENTILE>
+#   latency, a second identical request is sent and whichever finishes first is used;
+#   the other is cancelled. A tail that hits one request rarely hits both.
+#
+# Deadlines (around a whole endpoint-level operation, see with_deadline):
+#   GEMINI_DEADLINE_<CALL_SITE>_SECONDS bounds how long the user waits. On expiry the
+#   endpoint serves a degraded answer (services/fallbacks.py) instead of waiting on upstream.
+
+GEMINI_HEDGE_CALL_SITES = {
+    site.strip() for site in os.getenv("GEMINI_HEDGE_CALL_SITES", "recommend,search_card,help").split(",") if site.strip()
+}
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "90"))
+# Used until a call site has GEMINI_HEDGE_MIN_SAMPLES latencies recorded
+GEMINI_HEDGE_DEFAULT_SECONDS = float(os.getenv("GEMINI_HEDGE_DEFAULT_SECONDS", "8"))
+GEMINI_HEDGE_MIN_SECONDS = float(os.getenv("GEMINI_HEDGE_MIN_SECONDS", "1"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+
+_DEFAULT_DEADLINES = {
+    "recommend": 20.0,
+    "search_card": 45.0,
+    "help": 20.0,
+}
+
+_WINDOW = 200
+_latencies = {}
+_latency_lock = threading.Lock()
+
+# Operations allowed to outlive their deadline (keep a reference so they aren't GC'd)
+_background = set()
+
+
+class DeadlineExceededError(TimeoutError):
+    """An interactive operation ran past its deadline."""
+
+    def __init__(self, call_site: str, seconds: float):
+        super().__init__(f"{call_site} exceeded its {seconds:g}s deadline")
+        self.call_site = call_site
+        self.seconds = seconds
+
+
+def deadline_for(call_site: str) -> float:
+    override = os.getenv(f"GEMINI_DEADLINE_{call_site.upper()}_SECONDS")
+    if override:
+        return float(override)
+    return _DEFAULT_DEADLINES.get(call_site, 60.0)
+
+
+# MARK: - Latency tracking
+
+def record_latency(call_site: str, seconds: float):
+    with _latency_lock:
+        _latencies.setdefault(call_site, deque(maxlen=_WINDOW)).append(seconds)
+
+
+def hedge_delay(call_site: str) -> float:
+    """Seconds to wait on the first attempt before hedging: the recent latency percentile."""
+    with _latency_lock:
+        samples = sorted(_latencies.get(call_site, ()))
+    if len(samples) < GEMINI_HEDGE_MIN_SAMPLES:
+        return GEMINI_HEDGE_DEFAULT_SECONDS
+    index = min(len(samples) - 1, int(len(samples) * GEMINI_HEDGE_PERCENTILE / 100))
+    return max(GEMINI_HEDGE_MIN_SECONDS, samples[index])
+
+
+async def hedged(call_site: str, attempt):
+    """
+    Awaits `attempt()`; if it is slower than hedge_delay(call_site), starts a second
+    `attempt()` and returns whichever succeeds first. Not hedged for other call sites.
+    """
+    if call_site not in GEMINI_HEDGE_CALL_SITES:
+        return await attempt()
+
+    start = time.perf_counter()
+    first = asyncio.ensure_future(attempt())
+    done, _ = await asyncio.wait({first}, timeout=hedge_delay(call_site))
+    if done:
+        result = first.result()
+        record_latency(call_site, time.perf_counter() - start)
+        return result
+
+    second = asyncio.ensure_future(attempt())
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None or not pending:
+                    winner = "hedge" if task is second else "primary"
+                    metrics.GEMINI_HEDGES.labels(call_site, winner).inc()
+                    result = task.result()  # re-raises if both attempts failed
+                    # Time since the FIRST attempt started: never below the hedge delay, so
+                    # hedging doesn't drag the percentile (and itself) down
+                    record_latency(call_site, time.perf_counter() - start)
+                    return result
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# MARK: - Deadlines
+
+async def with_deadline(call_site: str, awaitable, seconds: float | None = None, keep_running: bool = False):
+    """
+    Awaits `awaitable` for at most `seconds` (default: the call site's deadline).
+    Raises DeadlineExceededError on expiry. With keep_running=True the operation is
+    left to finish in the background (e.g. so its result can still be saved).
+    """
+    seconds = deadline_for(call_site) if seconds is None else seconds
+    task = asyncio.ensure_future(awaitable)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), seconds)
+    except asyncio.TimeoutError:
+        metrics.GEMINI_DEADLINES_EXCEEDED.labels(call_site).inc()
+        if keep_running:
+            _background.add(task)
+            task.add_done_callback(_finish_background)
+        else:
+            task.cancel()
+        raise DeadlineExceededError(call_site, seconds)
+    except asyncio.CancelledError:
+        # The request itself went away (client disconnected)
+        if not keep_running:
+            task.cancel()
+        raise
+
+
+def _finish_background(task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Background completion failed: {task.exception()}")
@@ -0,0 +1,80 @@
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+import metrics
+
+# Per-instance read-through cache for small user-scoped documents:
+#   "profile"     users/{uid}
+#   "agent_state" users/{uid}/public_agent_state/main
+#   "wallet"      users/{uid}/aggregates/wallet, the denormalized wallet view (links merged
+#                 with the global card details, see services/wallet_view.py)
+#
+# /me, /recommend, /agent/state and the agent cycle read these many times a minute.
+# Entries live DOC_CACHE_TTL_SECONDS; every write path in this app calls invalidate()
+# right after its write, so a user never reads back an older version of their own change.
+# Writes made by another instance are picked up when the TTL runs out.
+#
+# Values are deep-copied in and out (callers mutate what they get back), and a load that
+# was already in flight when an invalidation happened is not stored.
+
+DOC_CACHE_TTL_SECONDS = float(os.getenv("DOC_CACHE_TTL_SECONDS", "30"))
+DOC_CACHE_SIZE = int(os.getenv("DOC_CACHE_SIZE", "20000"))
+
+PROFILE = "profile"
+AGENT_STATE = "agent_state"
+WALLET = "wallet"
+KINDS = (PROFILE, AGENT_STATE, WALLET)
+
+_entries = OrderedDict()  # (kind, uid) -> (expires_at, value)
+_lock = threading.Lock()
+# Bumped by every invalidation; a load only lands if no invalidation happened meanwhile
+_epoch = 0
+
+
+def get(kind: str, uid: str, load, fresh: bool = False, keep=None):
+    """
+    Cached value for (kind, uid), else load() (blocking) and cache it.
+    fresh=True skips the lookup but still refreshes the entry. None is never cached,
+    nor is anything keep(value) rejects.
+    """
+    key = (kind, uid)
+    with _lock:
+        entry = _entries.get(key)
+        if not fresh and entry is not None:
+            if entry[0] > time.monotonic():
+                _entries.move_to_end(key)
+                metrics.DOC_CACHE.labels(kind, "hit").inc()
+                return copy.deepcopy(entry[1])
+            del _entries[key]
+        epoch = _epoch
+    metrics.DOC_CACHE.labels(kind, "fresh" if fresh else "miss").inc()
+
+    value = load()
+    if value is None or (keep is not None and not keep(value)):
+        return value
+    with _lock:
+        if epoch == _epoch:
+            _entries[key] = (time.monotonic() + DOC_CACHE_TTL_SECONDS, copy.deepcopy(value))
+            _entries.move_to_end(key)
+            while len(_entries) > DOC_CACHE_SIZE:
+                _entries.popitem(last=False)
+    return value
+
+
+def invalidate(uid: str, *kinds: str):
+    """Drops `uid`'s cached documents of the given kinds (all kinds if none given)."""
+    global _epoch
+    with _lock:
+        _epoch += 1
+        for kind in kinds or KINDS:
+            if _entries.pop((kind, uid), None) is not None:
+                metrics.DOC_CACHE.labels(kind, "invalidated").inc()
+
+
+def clear():
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _entries.clear()
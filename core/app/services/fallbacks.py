@@ -0,0 +1,143 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from models import RecommendationRequest, RecommendationResponse, ActionCenterCategory
+
+# Degraded answers served when an interactive call runs past its deadline
+# (services/deadlines.py). They are deliberately cheap: an in-memory cache of recent
+# good answers, and local heuristics over data the request already carries.
+
+RECENT_RECOMMENDATION_TTL_SECONDS = 24 * 3600
+_RECENT_RECOMMENDATION_MAX = 5000
+
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+# MARK: - Recommendations
+
+def _recommendation_key(uid: str, request: RecommendationRequest):
+    cards = tuple(sorted(card.card_id for card in request.user_cards))
+    return (uid, request.store_name.strip().lower(), request.prioritize_category, cards)
+
+
+def remember_recommendation(uid: str, request: RecommendationRequest, response: RecommendationResponse):
+    key = _recommendation_key(uid, request)
+    with _recent_lock:
+        _recent[key] = (time.time(), response)
+        _recent.move_to_end(key)
+        while len(_recent) > _RECENT_RECOMMENDATION_MAX:
+            _recent.popitem(last=False)
+
+
+def recall_recommendation(uid: str, request: RecommendationRequest) -> RecommendationResponse | None:
+    """The last full answer for the same user, store, priority and wallet, if recent."""
+    with _recent_lock:
+        entry = _recent.get(_recommendation_key(uid, request))
+    if entry and time.time() - entry[0] < RECENT_RECOMMENDATION_TTL_SECONDS:
+        return entry[1]
+    return None
+
+
+_RATE = re.compile(r"(\d+(?:\.\d+)?)\s*(x|%)", re.IGNORECASE)
+
+
+def _best_rate(card, prioritize_category: str | None):
+    """(matches priority, best earning rate, label) from the card's benefit titles."""
+    best, label, matches = 0.0, None, False
+    for benefit in card.benefits or []:
+        text = f"{benefit.title} {benefit.category}"
+        if prioritize_category and prioritize_category.lower() in text.lower():
+            matches = True
+        for value, unit in _RATE.findall(benefit.title):
+            rate = float(value)
+            if rate > best:
+                best, label = rate, f"{value}{unit.lower()}"
+    return matches, best, label
+
+
+def heuristic_recommendation(request: RecommendationRequest) -> RecommendationResponse:
+    """
+    Best guess without the model: the card matching the prioritized category, else the
+    one with the highest earning rate listed in its benefits.
+    """
+    ranked = sorted(
+        request.user_cards,
+        key=lambda card: _best_rate(card, request.prioritize_category)[:2],
+        reverse=True
+    )
+    best = ranked[0] if ranked else None
+    runner_up = ranked[1] if len(ranked) > 1 else None
+
+    if best is None:
+        return RecommendationResponse(
+            best_card_id="",
+            reasoning=["Add a card to your wallet to get recommendations."],
+            estimated_return="—",
+            confidence=0.0
+        )
+
+    _, _, label = _best_rate(best, request.prioritize_category)
+    reasoning = [
+        f"Quick pick: {best.name} has the highest earning rate in your wallet{f' ({label})' if label else ''}.",
+        "We couldn't finish analyzing this store in time. Try again for a store-specific recommendation."
+    ]
+    runner_up_label = _best_rate(runner_up, request.prioritize_category)[2] if runner_up else None
+    return RecommendationResponse(
+        best_card_id=best.card_id,
+        reasoning=reasoning,
+        estimated_return=f"Up to {label}" if label else "Standard rewards",
+        runner_up_id=runner_up.card_id if runner_up else None,
+        runner_up_reasoning=[f"Next highest rate{f' ({runner_up_label})' if runner_up_label else ''}."] if runner_up else None,
+        runner_up_return=f"Up to {runner_up_label}" if runner_up_label else None,
+        corrected_store_name=None,
+        is_valid_store=True,
+        confidence=0.3
+    )
+
+
+# MARK: - Claim help
+
+_GENERIC_HELP = {
+    ActionCenterCategory.CAR_RENTAL: [
+        "Call the number on the back of your card and ask for the **Auto Rental Collision Damage** benefits administrator.",
+        "Report the damage within the deadline (often 60 days) and request a claim form.",
+        "Gather: rental agreement, damage photos, repair estimate or invoice, police report if any, and the card statement showing the rental charge.",
+        "Submit the claim online or by mail and keep your claim number."
+    ],
+    ActionCenterCategory.AIRPORT: [
+        "Call the number on the back of your card and ask about **trip delay / baggage** coverage.",
+        "Keep receipts for meals, lodging and essentials bought during the delay.",
+        "Get written confirmation of the delay or lost bag from the airline.",
+        "File the claim with the benefits administrator, attaching the receipts, airline letter and card statement."
+    ],
+    ActionCenterCategory.WARRANTY: [
+        "Check that the manufacturer's warranty has expired but the item is still within the card's **Extended Warranty** period.",
+        "Call the number on the back of your card and open an Extended Warranty claim.",
+        "Have ready: the purchase receipt, card statement, original warranty and a repair estimate.",
+        "Don't throw the item away until the claim is settled."
+    ],
+    ActionCenterCategory.CELL_PHONE: [
+        "Confirm your monthly phone bill is paid with this card (required for **Cell Phone Protection**).",
+        "File a report with your carrier (and police for theft).",
+        "Call the number on the back of your card to open a claim, usually within 60 days.",
+        "Upload: phone bill statement, repair estimate or proof of loss, and the card statement."
+    ],
+}
+
+_DEFAULT_HELP = [
+    "Call the number on the back of your card and ask for the benefits administrator for this protection.",
+    "Ask for the claim deadline and the list of required documents.",
+    "Collect the receipt, the card statement showing the charge and any supporting evidence.",
+    "Submit the claim and keep your claim number for follow-up."
+]
+
+
+def generic_help_instructions(category: ActionCenterCategory, card_name: str) -> str:
+    """Issuer-agnostic claim steps for a category, used when tailored help isn't ready in time."""
+    steps = _GENERIC_HELP.get(category, _DEFAULT_HELP)
+    lines = [f"**General steps for your {card_name}**", ""]
+    lines += [f"{i}. {step}" for i, step in enumerate(steps, 1)]
+    lines += ["", "_Tailored instructions are still being prepared. Check back in a minute._"]
+    return "\n".join(lines)
@@ -0,0 +1,251 @@
+import os
+import asyncio
+import threading
+import weakref
+import contextlib
+import httpx
+from google import genai
+from google.genai import types
+from services import context_cache, model_backends, usage, deadlines
+import metrics
+
+# Single, process-wide entry point for Gemini.
+# - ONE genai.Client per process (created lazily), so HTTP connections / TLS sessions
+#   are pooled and reused instead of paying a handshake per request.
+# - generate() uses the async `client.aio` API: an in-flight LLM call is just an awaiting
+#   coroutine, not a parked threadpool worker, so async endpoints can run hundreds concurrently.
+# - generate_sync() is for code that already runs off the event loop
+#   (APScheduler jobs, the agent queue worker).
+# Every call goes through metrics.track_gemini(call_site).
+# Passing cache_key= moves config.system_instruction (a static prefix from services/prompts.py)
+# into a Gemini context cache; see services/context_cache.py.
+# GEMINI_BACKEND=record|replay swaps the live API for cassettes; see services/model_backends.py.
+# Passing uid= records the call against that user's daily token budget; see services/usage.py.
+# Interactive call sites are hedged when an attempt is slower than usual; see services/deadlines.py.
+# Large documents are passed via the Files API rather than inline; see document_part().
+
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-3-flash-preview")
+
+# Upper bound on concurrent in-flight calls per instance (async and sync counted separately).
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "256"))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "300"))
+# Documents above this go through the Files API instead of inline request bytes
+GEMINI_INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_MAX_BYTES", str(4 * 1024 * 1024)))
+
+_client = None
+_client_lock = threading.Lock()
+_backend = model_backends.create_backend()
+
+# asyncio primitives are bound to an event loop; keep one semaphore per loop.
+_async_limits = weakref.WeakKeyDictionary()
+_sync_limit = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+
+class GeminiUnavailableError(RuntimeError):
+    """Raised when no GEMINI_API_KEY is configured."""
+
+
+def is_configured() -> bool:
+    return bool(os.getenv("GEMINI_API_KEY")) or not _backend.needs_client
+
+
+def get_client():
+    """Returns the shared genai.Client (or None if GEMINI_API_KEY is not set)."""
+    global _client
+    if _client is not None:
+        return _client
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return None
+
+    with _client_lock:
+        if _client is None:
+            # Size the pools to the concurrency limit so bursts reuse warm connections
+            # rather than opening (and tearing down) new ones.
+            limits = httpx.Limits(
+                max_connections=GEMINI_MAX_CONCURRENCY,
+                max_keepalive_connections=GEMINI_MAX_CONCURRENCY,
+                keepalive_expiry=60
+            )
+            _client = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(
+                    timeout=int(GEMINI_TIMEOUT_SECONDS * 1000),
+                    client_args={"limits": limits},
+                    async_client_args={"limits": limits}
+                )
+            )
+    return _client
+
+
+def _require_client():
+    if not _backend.needs_client:
+        return None
+    client = get_client()
+    if client is None:
+        raise GeminiUnavailableError("AI Service Unavailable")
+    return client
+
+
+def _async_limit():
+    loop = asyncio.get_running_loop()
+    semaphore = _async_limits.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        _async_limits[loop] = semaphore
+    return semaphore
+
+
+def grounded_json_config(**overrides) -> types.GenerateContentConfig:
+    """The config most call sites use: Google Search grounding + JSON output."""
+    params = {
+        "tools": [types.Tool(google_search=types.GoogleSearch())],
+        "response_mime_type": "application/json",
+    }
+    params.update(overrides)
+    return types.GenerateContentConfig(**params)
+
+
+def plain_request(config: types.GenerateContentConfig | None, cache_key: str | None):
+    """Config / cache key without Google Search: the tools are dropped (and so the context cache differs)."""
+    config = config.model_copy(update={"tools": None, "tool_config": None}) if config else types.GenerateContentConfig()
+    return config, f"{cache_key}_plain" if cache_key else None
+
+
+def _budget_request(call_site: str, budget: str, model: str, config, cache_key):
+    """
+    Refuses the call past the hard budget; switches to the cheaper model past the soft one.
+    The budget model can't combine Google Search with JSON output, so downgraded calls run
+    ungrounded. Returns (model, config, cache_key).
+    """
+    if budget == usage.BUDGET_HARD:
+        metrics.GEMINI_BUDGET_EVENTS.labels(call_site, "hard").inc()
+        raise usage.BudgetExceededError()
+    if budget == usage.BUDGET_SOFT:
+        metrics.GEMINI_BUDGET_EVENTS.labels(call_site, "soft").inc()
+        if config is not None and (config.tools or config.tool_config):
+            config, cache_key = plain_request(config, cache_key)
+        return usage.GEMINI_BUDGET_MODEL, config, cache_key
+    return model, config, cache_key
+
+
+async def _call(client, call_site, model, contents, config, uid=None):
+    with metrics.track_gemini(call_site) as call:
+        response = await _backend.agenerate(client, call_site, model, contents, config)
+        call.record_usage(response)
+    if uid:
+        usage.record(uid, call_site, response)
+    return response
+
+
+def _call_sync(client, call_site, model, contents, config, uid=None):
+    with metrics.track_gemini(call_site) as call:
+        response = _backend.generate(client, call_site, model, contents, config)
+        call.record_usage(response)
+    if uid:
+        usage.record(uid, call_site, response)
+    return response
+
+
+async def _attempt(client, call_site, model, contents, config, uid=None):
+    async with _async_limit():
+        return await _call(client, call_site, model, contents, config, uid)
+
+
+async def generate(
+    call_site: str,
+    contents,
+    config: types.GenerateContentConfig | None = None,
+    model: str | None = None,
+    cache_key: str | None = None,
+    uid: str | None = None
+):
+    """Awaitable generate_content on the shared client. Does not occupy a worker thread."""
+    client = _require_client()
+    model = model or DEFAULT_MODEL
+    if uid:
+        model, config, cache_key = _budget_request(call_site, await usage.abudget_status(uid), model, config, cache_key)
+    request_config = config
+    if cache_key and _backend.uses_context_cache:
+        request_config = await context_cache.default_cache.apply_async(client, cache_key, model, config)
+
+    try:
+        return await deadlines.hedged(call_site, lambda: _attempt(client, call_site, model, contents, request_config, uid))
+    except Exception as e:
+        if request_config is config or not context_cache.is_cache_miss(e):
+            raise
+        # Cache expired/deleted server-side: drop it and answer this call inline
+        context_cache.default_cache.invalidate(cache_key, model)
+        return await deadlines.hedged(call_site, lambda: _attempt(client, call_site, model, contents, config, uid))
+
+
+def generate_sync(
+    call_site: str,
+    contents,
+    config: types.GenerateContentConfig | None = None,
+    model: str | None = None,
+    cache_key: str | None = None,
+    uid: str | None = None
+):
+    """Blocking generate_content on the shared client, for scheduler/worker threads only."""
+    client = _require_client()
+    model = model or DEFAULT_MODEL
+    if uid:
+        model, config, cache_key = _budget_request(call_site, usage.budget_status(uid), model, config, cache_key)
+    request_config = config
+    if cache_key and _backend.uses_context_cache:
+        request_config = context_cache.default_cache.apply(client, cache_key, model, config)
+
+    with _sync_limit:
+        try:
+            return _call_sync(client, call_site, model, contents, request_config, uid)
+        except Exception as e:
+            if request_config is config or not context_cache.is_cache_miss(e):
+                raise
+            context_cache.default_cache.invalidate(cache_key, model)
+            return _call_sync(client, call_site, model, contents, config, uid)
+
+
+@contextlib.asynccontextmanager
+async def document_part(fileobj, mime_type: str):
+    """
+    A Part for a document in a seekable binary file. Up to GEMINI_INLINE_MAX_BYTES it is
+    sent inline; larger ones are streamed to the Files API and deleted afterwards, so the
+    document is never held in memory. Record/replay always inline (the local stand-in).
+    """
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    if size <= GEMINI_INLINE_MAX_BYTES or not _backend.uses_file_uploads:
+        yield types.Part(inline_data=types.Blob(mime_type=mime_type, data=fileobj.read()))
+        return
+
+    client = _require_client()
+    uploaded = await client.aio.files.upload(file=fileobj, config=types.UploadFileConfig(mime_type=mime_type))
+    print(f"📤 Uploaded {size // 1024} KB document as {uploaded.name}")
+    try:
+        while uploaded.state == types.FileState.PROCESSING:
+            await asyncio.sleep(1)
+            uploaded = await client.aio.files.get(name=uploaded.name)
+        if uploaded.state == types.FileState.FAILED:
+            raise RuntimeError(f"Gemini could not process uploaded file {uploaded.name}")
+        yield types.Part.from_uri(file_uri=uploaded.uri, mime_type=mime_type)
+    finally:
+        try:
+            await client.aio.files.delete(name=uploaded.name)
+        except Exception as e:
+            print(f"⚠️ Could not delete uploaded file {uploaded.name}: {e}")
+
+
+async def aclose():
+    """Releases pooled connections (called on app shutdown)."""
+    global _client
+    client = _client
+    _client = None
+    if client is not None:
+        try:
+            await client.aio.aclose()
+            client.close()
+        except Exception as e:
+            print(f"Gemini client close error: {e}")
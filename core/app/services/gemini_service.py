@@ -1,37 +1,47 @@
-import os
-import json
+import io
 import base64
-from typing import List, Dict, Any
-from google import genai
+import asyncio
+from typing import List, Dict, Any, BinaryIO
+from fastapi import HTTPException
 from google.genai import types
+from services import gemini_gateway, structured_output, statement_chunks, statement_parsers
+import metrics
+from models import StatementExtraction, StatementProfile
 
 class GeminiService:
     def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+        # Uses the shared process-wide client from gemini_gateway (no client per service)
+        if not gemini_gateway.is_configured():
             print("⚠️ GEMINI_API_KEY not set. Gemini features will fail.")
-        self.client = genai.Client(api_key=self.api_key)
 
-    def process_statement(self, pdf_bytes: bytes) -> List[Dict[str, Any]]:
+    async def process_statement(self, pdf: bytes | BinaryIO, uid: str | None = None) -> List[Dict[str, Any]]:
         """
-        Uploads PDF bytes to Gemini and extracts transaction data.
+        Sends a PDF (bytes, or a seekable file such as a spooled upload) to Gemini and
+        extracts transaction data. Usage is charged to `uid`'s daily token budget when given.
         """
+        if isinstance(pdf, bytes):
+            pdf = io.BytesIO(pdf)
+
+        # Known issuer layouts are read locally; Gemini only sees what they can't parse
+        parsed = await statement_parsers.parse(pdf)
+        if parsed is not None:
+            return await self._process_parsed(parsed, pdf, uid)
+        metrics.STATEMENT_PARSER.labels("unknown", "model").inc()
+
         try:
-            # Optimize: Upload the file contents directly if supported or pass as inline data
-            # For 'gemini-3-pro-preview', passing bytes directly as inline data is often efficient for reasonable sizes.
+            # Small documents go inline, large ones via the Files API (gemini_gateway.document_part)
             
             prompt = """
             Analyze this credit card statement PDF.
             Extract ALL individual transactions from the statement period.
             
             1. **IDENTIFY CARD**: First, identify the exact credit card name from the statement (e.g., "Chase Sapphire Reserve", "Amex Gold").
-            2. **RESEARCH BENEFITS**: Use Google Search to find the OFFICIAL reward structure for this specific card (e.g. "Chase Sapphire Reserve current points multipliers"). Look for categories like Dining, Travel, Grocery, etc.
-            3. **EXTRACT TRANSACTIONS**: For each transaction:
+            2. **EXTRACT TRANSACTIONS**: For each transaction:
                - "date": "YYYY-MM-DD" (The transaction date)
                - "retailer": "String" (CLEAN THE RETAILER NAME. e.g. "CHIPOTLE MEX GR ONLINE" -> "Chipotle", "UBER *RIDE" -> "Uber". If the name is already clean or ambiguous, keep it.)
                - "amount": Number (The transaction amount, positive for purchases, negative for credits/payments).
                - "card_name": "String" (The specific card product name, e.g., "Chase Sapphire Reserve", "Amex Gold". Infer from the statement content. If unknown, use "Credit Card")
-               - "cashback_earned": Number. **CRITICAL**: Calculate this using the RESEARCHED reward structure if the cashback per transaction isn't explicitly stated in the statement. Determine the retailer's category (e.g. Chipotle = Dining) and apply the correct multiplier (e.g. 3x or 3%). If the category is 1x/1%, calculate 1%.
+               - "card_last4": "String" (Last 4 digits of the card / account number if the statement shows them, else null)
             
             Return the result as a strictly formatted JSON object with a "transactions" key containing the list.
             Example:
@@ -41,61 +51,149 @@ class GeminiService:
                         "date": "2023-10-15",
                         "retailer": "Starbucks",
                         "amount": 5.40,
-                        "card_name": "Chase Sapphire Preferred",
-                        "cashback_earned": 0.16
+                        "card_name": "Chase Sapphire Preferred"
                     }
                 ]
             }
             """
 
-            response = self.client.models.generate_content(
-                model='gemini-3-flash-preview',
-                contents=[
-                    types.Content(
-                        parts=[
-                            types.Part(text=prompt),
-                            types.Part(
-                                inline_data=types.Blob(
-                                    mime_type='application/pdf',
-                                    data=pdf_bytes
-                                )
-                            )
-                        ]
-                    )
-                ],
-                config=types.GenerateContentConfig(
-                    tools=[types.Tool(google_search=types.GoogleSearch())],
-                    response_mime_type='application/json'
-                )
-            )
-
-            # Parse Response
-            text = response.text.strip()
-            
-            # Robust JSON extraction: Find the first '{' and last '}'
-            import re
-            
-            # Try to find a JSON code block first
-            match = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
-            if match:
-                json_str = match.group(1)
-            else:
-                # Fallback: Find outermost braces
-                start = text.find('{')
-                end = text.rfind('}') + 1
-                if start != -1 and end != 0:
-                    json_str = text[start:end]
-                else:
-                     # Last resort: just try the whole text
-                    json_str = text
+            # Splitting parses the whole PDF; keep it off the event loop
+            chunks = await asyncio.to_thread(statement_chunks.split, pdf)
+            if len(chunks) > 1:
+                return await self._process_chunked(chunks, uid)
 
             try:
-                data = json.loads(json_str)
-                return data.get("transactions", [])
-            except json.JSONDecodeError:
-                print(f"❌ JSON Decode Error. Raw text: {text}")
+                async with gemini_gateway.document_part(pdf, 'application/pdf') as document:
+                    result = await structured_output.generate_structured(
+                        "process_statement",
+                        contents=[types.Content(parts=[types.Part(text=prompt), document])],
+                        model_cls=StatementExtraction,
+                        # Rows only; cashback is computed from the card catalog (services/cashback.py)
+                        config=gemini_gateway.grounded_json_config(tools=None),
+                        uid=uid
+                    )
+            except structured_output.StructuredOutputError as e:
+                print(f"❌ JSON Decode Error. Raw text: {e.raw_text}")
                 return []
 
+            return [tx.dict() for tx in result.transactions]
+
         except Exception as e:
             print(f"❌ Gemini Processing Error: {e}")
             raise e
+
+    # MARK: - Chunked statements
+
+    async def _process_chunked(self, chunks: list, uid: str | None) -> List[Dict[str, Any]]:
+        """
+        Long statements: one call on the first chunk identifies the card, then every page
+        range is extracted in parallel.
+        """
+        print(f"📄 Statement has {chunks[0].page_count} pages, extracting {len(chunks)} chunks")
+        try:
+            return await self._extract_chunks(chunks, uid)
+        finally:
+            for chunk in chunks:
+                chunk.pdf.close()
+
+    async def _extract_chunks(self, chunks: list, uid: str | None) -> List[Dict[str, Any]]:
+        profile = await self._statement_profile(chunks[0].pdf, uid)
+        return statement_chunks.merge(await self._extract_chunk_results(chunks, profile, uid))
+
+    async def _extract_chunk_results(self, chunks: list, profile: StatementProfile, uid: str | None) -> list:
+        """Transactions per chunk, in chunk order."""
+        semaphore = asyncio.Semaphore(statement_chunks.STATEMENT_CHUNK_CONCURRENCY)
+
+        async def extract(chunk):
+            async with semaphore:
+                for attempt in range(statement_chunks.STATEMENT_CHUNK_RETRIES + 1):
+                    try:
+                        return await self._extract_chunk(chunk, profile, uid)
+                    except HTTPException:
+                        raise
+                    except Exception as e:
+                        if attempt == statement_chunks.STATEMENT_CHUNK_RETRIES:
+                            raise
+                        print(f"⚠️ Statement {chunk.label} failed ({e}), retrying")
+
+        tasks = [asyncio.ensure_future(extract(chunk)) for chunk in chunks]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # Don't leave siblings reading chunk files that are about to be closed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return results
+
+    # MARK: - Locally parsed statements
+
+    async def _process_parsed(self, parsed, pdf: BinaryIO, uid: str | None) -> List[Dict[str, Any]]:
+        """Pages the issuer template read confidently, plus Gemini extraction of the rest."""
+        if not parsed.fallback_pages:
+            print(f"⚡️ Parsed {parsed.issuer} statement locally ({len(parsed.transactions)} transactions)")
+            metrics.STATEMENT_PARSER.labels(parsed.issuer, "local").inc()
+            return parsed.transactions
+
+        print(f"📄 {parsed.issuer} statement: pages {parsed.fallback_pages} need Gemini")
+        metrics.STATEMENT_PARSER.labels(parsed.issuer, "partial").inc()
+        chunks = await asyncio.to_thread(statement_chunks.split_pages, pdf, parsed.fallback_pages)
+        try:
+            # The template already knows the card, so no grounded profile call
+            profile = StatementProfile(card_name=parsed.card_name, card_last4=parsed.card_last4)
+            results = await self._extract_chunk_results(chunks, profile, uid)
+        finally:
+            for chunk in chunks:
+                chunk.pdf.close()
+
+        by_page = [(page, rows) for page, rows in parsed.pages.items()]
+        by_page += [(chunk.first_page, rows) for chunk, rows in zip(chunks, results)]
+        return statement_chunks.merge([rows for _, rows in sorted(by_page, key=lambda item: item[0])])
+
+    async def _statement_profile(self, first_pages: BinaryIO, uid: str | None) -> StatementProfile:
+        prompt = """
+        These are the first pages of a credit card statement.
+        Identify the exact credit card product name (e.g., "Chase Sapphire Reserve", "Amex Gold"). If unknown, use "Credit Card".
+        Also the last 4 digits of the card / account number if shown (else null).
+
+        Return JSON: {"card_name": "...", "card_last4": "1234"}
+        """
+        try:
+            async with gemini_gateway.document_part(first_pages, 'application/pdf') as document:
+                return await structured_output.generate_structured(
+                    "statement_profile",
+                    contents=[types.Content(parts=[types.Part(text=prompt), document])],
+                    model_cls=StatementProfile,
+                    config=gemini_gateway.grounded_json_config(tools=None),
+                    uid=uid
+                )
+        except structured_output.StructuredOutputError:
+            # Chunks can still extract transactions; cashback falls back to the base rate
+            return StatementProfile()
+
+    async def _extract_chunk(self, chunk, profile: StatementProfile, uid: str | None) -> List[Dict[str, Any]]:
+        prompt = f"""
+        These are {chunk.label} of a "{profile.card_name}" credit card statement.
+        Extract ALL individual transactions on these pages, in the order they appear.
+        Skip a row cut off at the very top of the first page if its date or amount is missing.
+
+        For each transaction:
+           - "date": "YYYY-MM-DD" (The transaction date)
+           - "retailer": "String" (CLEAN THE RETAILER NAME. e.g. "CHIPOTLE MEX GR ONLINE" -> "Chipotle", "UBER *RIDE" -> "Uber".)
+           - "amount": Number (positive for purchases, negative for credits/payments).
+           - "card_name": "{profile.card_name}"
+           - "card_last4": Last 4 digits of the card if these pages show them for the row, else null
+
+        Return JSON: {{"transactions": [ ... ]}}
+        """
+        async with gemini_gateway.document_part(chunk.pdf, 'application/pdf') as document:
+            result = await structured_output.generate_structured(
+                "statement_chunk",
+                contents=[types.Content(parts=[types.Part(text=prompt), document])],
+                model_cls=StatementExtraction,
+                config=gemini_gateway.grounded_json_config(tools=None),
+                uid=uid
+            )
+        # Rows keep their own last-4 (statements can list several cards), else the statement's
+        return [{**tx.dict(), "card_last4": tx.card_last4 or profile.card_last4} for tx in result.transactions]
@@ -0,0 +1,126 @@
+import os
+import asyncio
+import random
+import weakref
+import httpx
+from fastapi import HTTPException, status
+import metrics
+
+# Pooled async client for Firebase's password sign-in and token refresh REST endpoints
+# (the Admin SDK can't log users in).
+#
+# One httpx.AsyncClient per event loop keeps connections to Google alive between logins
+# (no TLS handshake per request), every call has a hard timeout, and connection errors,
+# timeouts, 429s and 5xx are retried IDENTITY_RETRIES times with jittered backoff.
+# IDENTITY_TOOLKIT_URL / SECURE_TOKEN_URL point the client at a local stub in tests.
+
+IDENTITY_TOOLKIT_URL = os.getenv("IDENTITY_TOOLKIT_URL", "https://identitytoolkit.googleapis.com")
+SECURE_TOKEN_URL = os.getenv("SECURE_TOKEN_URL", "https://securetoken.googleapis.com")
+IDENTITY_TIMEOUT_SECONDS = float(os.getenv("IDENTITY_TIMEOUT_SECONDS", "5"))
+IDENTITY_RETRIES = int(os.getenv("IDENTITY_RETRIES", "2"))
+IDENTITY_MAX_CONNECTIONS = int(os.getenv("IDENTITY_MAX_CONNECTIONS", "50"))
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+
+class IdentityUnavailableError(HTTPException):
+    def __init__(self, detail: str = "Sign-in service is unavailable. Please try again."):
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
+
+
+def _client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(IDENTITY_TIMEOUT_SECONDS, connect=min(2.0, IDENTITY_TIMEOUT_SECONDS)),
+            limits=httpx.Limits(max_connections=IDENTITY_MAX_CONNECTIONS, max_keepalive_connections=IDENTITY_MAX_CONNECTIONS),
+        )
+        _clients[loop] = client
+    return client
+
+
+def _api_key() -> str:
+    api_key = os.getenv("FIREBASE_WEB_API_KEY")
+    if not api_key:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Server misconfiguration: FIREBASE_WEB_API_KEY not set."
+        )
+    return api_key
+
+
+async def _post(endpoint: str, url: str, payload: dict) -> httpx.Response:
+    """POST with retries on transport errors / 429 / 5xx. Returns the last response."""
+    for attempt in range(IDENTITY_RETRIES + 1):
+        try:
+            response = await _client().post(url, params={"key": _api_key()}, json=payload)
+            if response.status_code not in _RETRY_STATUSES or attempt == IDENTITY_RETRIES:
+                metrics.IDENTITY_REQUESTS.labels(endpoint, str(response.status_code)).inc()
+                return response
+            reason = str(response.status_code)
+        except httpx.TransportError as e:
+            if attempt == IDENTITY_RETRIES:
+                metrics.IDENTITY_REQUESTS.labels(endpoint, "error").inc()
+                print(f"❌ {endpoint} failed: {type(e).__name__}: {e}")
+                raise IdentityUnavailableError()
+            reason = type(e).__name__
+        delay = 0.1 * (2 ** attempt) * (1 + random.random())
+        print(f"⚠️ {endpoint} attempt {attempt + 1} failed ({reason}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+async def sign_in_with_password(email: str, password: str) -> dict:
+    """Logs in via the Identity Toolkit REST API; returns idToken, refreshToken, localId, ..."""
+    response = await _post("sign_in", f"{IDENTITY_TOOLKIT_URL}/v1/accounts:signInWithPassword", {
+        "email": email,
+        "password": password,
+        "returnSecureToken": True
+    })
+    if response.status_code == 200:
+        return response.json()
+
+    print(f"Login failed: {response.status_code} - {response.text}")
+    if response.status_code in _RETRY_STATUSES:
+        raise IdentityUnavailableError()
+    try:
+        error_msg = response.json().get('error', {}).get('message', 'Login failed')
+    except ValueError:
+        raise HTTPException(status_code=500, detail=f"Upstream auth error: {response.status_code}")
+
+    if "INVALID_PASSWORD" in error_msg or "EMAIL_NOT_FOUND" in error_msg or "INVALID_LOGIN_CREDENTIALS" in error_msg:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid email or password"
+        )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Login error: {error_msg}"
+    )
+
+
+async def refresh(refresh_token: str) -> dict:
+    """Exchanges a refresh token for a new ID token (id_token, refresh_token, user_id, expires_in)."""
+    response = await _post("refresh", f"{SECURE_TOKEN_URL}/v1/token", {
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token
+    })
+    if response.status_code == 200:
+        return response.json()
+
+    print(f"Token refresh failed: {response.text}")
+    if response.status_code in _RETRY_STATUSES:
+        raise IdentityUnavailableError()
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not refresh token. Please login again."
+    )
+
+
+async def aclose():
+    """Closes the current loop's pooled connections (called on app shutdown)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
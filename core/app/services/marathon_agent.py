@@ -1,22 +1,16 @@
-import os
-import json
 import time
 from datetime import datetime, date
-from google import genai
-from google.genai import types
 import auth
-from models import AgentPrivateState, AgentPublicState
-from pydantic import ValidationError
+from models import AgentPrivateState, AgentCycleResult
 import services.constraints as constraints
 from firebase_admin import firestore
+from fastapi import HTTPException
+from services import gemini_gateway, structured_output, prompts, usage, model_routing, spending_summary, doc_cache
 
 class MarathonAgent:
     def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
-        else:
-            self.client = None
+        # The Gemini client itself is shared process-wide (services/gemini_gateway.py)
+        if not gemini_gateway.is_configured():
             print("⚠️ MarathonAgent: GEMINI_API_KEY missing.")
 
     def run_agent_cycle(self, user_id: str):
@@ -27,13 +21,14 @@ class MarathonAgent:
         
         try:
             # 1. WAKE UP: Fetch Context & State
-            user_ref = auth.db.collection('users').document(user_id)
-            user_doc = user_ref.get()
-            if not user_doc.exists:
+            # Fresh reads (a trigger may come from another instance); they also refresh this
+            # instance's cache for /me, /recommend and /agent/state.
+            try:
+                user_data = auth.get_user_profile(user_id, fresh=True)
+            except HTTPException:
                 print(f"❌ User {user_id} not found.")
                 return
 
-            user_data = user_doc.to_dict()
             agent_sessions_ref = auth.db.collection('agent_sessions').document(user_id)
             agent_doc = agent_sessions_ref.get()
             
@@ -45,12 +40,16 @@ class MarathonAgent:
             
             # Fetch Wallet & Transactions (Context)
             # We need a snapshot of recent financial activity to "jog the memory"
-            cards = auth.get_user_cards(user_id)
-            # Fetch recent transactions (last 30 days) - simplified for now
-            # In real app, we might want to query subcollection
+            cards = auth.get_user_cards(user_id, fresh=True)
+            # Recent transactions as a fixed-size feature block, not a raw dump (services/spending_summary.py)
+            try:
+                spending_str = spending_summary.summarize(user_id, cards)
+            except Exception as e:
+                print(f"⚠️ Spending summary unavailable: {e}")
+                spending_str = "SPENDING SUMMARY: Unavailable."
             
             # 2. THINK: Call Gemini 3
-            if not self.client:
+            if not gemini_gateway.is_configured():
                 print("❌ No AI Client available.")
                 return
 
@@ -91,11 +90,10 @@ class MarathonAgent:
             # If public state exists, maybe grab goal from there? 
             # Or usually goal is set once. Let's look for it in Public State or User Profile.
             public_ref = auth.db.collection('users').document(user_id).collection('public_agent_state').document('main')
-            public_doc = public_ref.get()
+            data = auth.get_agent_state(user_id, fresh=True)
             
             roadmap_context = "No previous roadmap."
-            if public_doc.exists:
-                data = public_doc.to_dict()
+            if data:
                 current_goal = data.get('target_goal', current_goal)
                 existing_roadmap = data.get('roadmap', [])
                 if existing_roadmap:
@@ -122,13 +120,14 @@ class MarathonAgent:
                 - Details: {user_data.get('financial_details', 'None')}
                 """
 
+            # Rules, task and output format are the static, cached prefix (services/prompts.py)
             prompt = f"""
-            You are 'CreditAgent', a long-term strategist for this user.
             CURRENT GOAL: "{current_goal}"
             
             USER CONTEXT:
             - Current Cards: {cards_str}
             {financial_profile_str}
+            {spending_str}
             {constraints_str}
             
             THOUGHT HISTORY:
@@ -136,150 +135,60 @@ class MarathonAgent:
             
             CURRENT ROADMAP STATUS:
             {roadmap_context}
-            
-            STABILITY RULES (CRITICAL):
-            1. 🛑 PRESERVE EXISTING: Do NOT change the Title or Icon of existing milestones unless the strategy fundamentally changes. If a milestone is 'completed', keep it exactly as is.
-            2. 🛑 ONE CURRENT STEP: Only ONE milestone can be `current` at any time. If multiple tasks are active, pick the most immediate one as `current` and others as `pending`.
-            3. 🛑 ICONS: Use ONLY simple, valid SF Symbols.
-               - SAFE: map.fill, creditcard.fill, airplane, cart.fill, house.fill, star.fill, list.bullet
-               - AVOID: complex symbols or those with multiple dots/badges (e.g. 'creditcard.triangle.badge...').
-               - If unsure, use 'map.fill' or 'star.fill'.
-            
-            TASK:
-            1. 🔍 CHECK USER UPDATES: Scan current milestones for `[USER FEEDBACK: ...]`. 
-               - **CRITICAL**: You MUST prioritize this feedback above all else. The user's input is the source of truth.
-               - If the user requests a change (e.g., "new card", "skip this", "too expensive", "I already did this", "change goal"), you **MUST** modify the roadmap to satisfy their request immediately.
-               - If they ask for a new recommendation, provide a **different** option. Do not ignore their request or double down on the previous one.
-            2. 🌍 DEEP WEB SEARCH: 
-               - If this is a **NEW GOAL** (roadmap empty), search extensively to build the best strategy from scratch.
-               - If this is a **WEEKLY RUN**, search for *new* offers or changes that might accelerate the goal.
-               - Search for solutions to any user roadblocks.
-            3. 🧠 ANALYZE: Review progress, spending habits, and the Current Roadmap against search results.
-            4. 🛣️ UPDATE ROADMAP:
-               - Update milestones based on new findings or user updates.
-               - **IMPORTANT**: If a milestone is "current" but the user says they are stuck, either provide a solution in `description` or replace it with a new step.
-               - **SPLIT TASKS**: When recommending a new card, create TWO separate milestones:
-                 1. "Apply for [Card]" (Status: current. NO `spending_goal`).
-                 2. "Reach [Card] Bonus" (Status: pending. Set `spending_goal` equal to the bonus requirement here).
-            5. ⚔️ SIDE QUESTS (OPTIONAL TASKS):
-               - Identify 2-3 "Side Quests" based on their financial profile or potential bad habits (e.g., "Dining out too much? -> Cook at home", "Unused Subscriptions? -> Cancel").
-               - Also look for "Card Perks" side quests (e.g., "Activate Amex Offers", "Use your $50 Hotel Credit").
-
-            6. ⚖️ PROPORTIONALITY & SANITY CHECK (CRITICAL):
-               - **ANALYZE GOAL SCALE**: Is this a "Small Goal" (e.g. "Buy a burger", "New shoes") or a "Large Goal" (e.g. "Flight to Japan", "Buy a House")?
-               - **SMALL GOALS**: Do NOT recommend opening new credit cards or moving assets. Focus on optimizing *existing* cards or simple savings (e.g. "Use your Gold card for 4x points").
-                 - 🚫 Forbidden: "Open Chase Sapphire" for a $15 burger.
-                 - 🚫 Forbidden: "Move $100k" for a minor purchase.
-               - **LARGE GOALS**: Aggressive strategies (new cards, sign-up bonuses) are allowed but must be realistic.
-                 - 🚫 Forbidden: "Move $1M assets" unless the user's profile explicitly shows they HAVE that much.
-                 - 🚫 Forbidden: recommending "Business Cards" (e.g. Ink, Amex Biz) UNLESS the user implies business activity or the goal is "Business Class Travel" / High Value.
-               - **REALISM**: If the user has low spending or no financial details, assume "Average Consumer" (don't assume they can spend $5k/month for a bonus).
-
-            OUTPUT RULES:
-            - **Google Search**: Verify offers.
-            - **Milestones**: 
-              - Must include `id`, `title`, `description` (REQUIRED for ALL statuses, including 'completed'), `status`, `icon`.
-              - `description` must explain *how* to achieve the milestone (or what was done if completed).
-            - **Optional Tasks**:
-              - `id`: Unique string.
-              - `title`: Short action title.
-              - `description`: Why they should do it.
-              - `impact`: Estimated savings or value (e.g. "$20/mo").
-              - `category`: "Savings" | "Credit Health" | "Lifestyle".
-              - `icon`: SF Symbol (e.g. "fork.knife", "dollarsign.circle", "tag.fill").
-            
-            OUTPUT JSON:
-            {{
-                "thought_signature": "Summary...",
-                "public_plan": {{
-                    "target_goal": "{current_goal}",
-                    "progress_percentage": 50,
-                    "roadmap": [
-                        {{
-                            "id": "ms_1",
-                            "title": "Apply for Card X",
-                            "description": "Go to the bank website and apply. Ensure you have your income details ready.",
-                            "status": "current",
-                            "icon": "creditcard.fill"
-                        }}
-                    ],
-                    "optional_tasks": [
-                        {{
-                            "id": "sq_1",
-                            "title": "Cook Dinner 3x/Week",
-                            "description": "You spent $450 on dining last week. Cooking could save you significantly.",
-                            "impact": "Save ~$200/mo",
-                            "category": "Lifestyle",
-                            "icon": "fork.knife"
-                        }}
-                    ],
-                    "reasoning_summary": "...",
-                    "next_action": "Apply for Citi Strata",
-                    "action_date": "2026-01-16"
-                }}
-            }}
             """
             
-            response = self.client.models.generate_content(
-                model='gemini-3-flash-preview', 
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    tools=[types.Tool(google_search=types.GoogleSearch())],
-                    response_mime_type='application/json'
+            # Runs in the agent queue / scheduler thread, so the blocking call is fine here.
+            # Output is schema-constrained and validated against AgentCycleResult;
+            # target_goal is filled in if the model leaves it out.
+            try:
+                result = model_routing.generate_tiered_sync(
+                    "agent_cycle",
+                    contents=prompt,
+                    model_cls=AgentCycleResult,
+                    config=gemini_gateway.grounded_json_config(system_instruction=prompts.AGENT_STRATEGY_RULES),
+                    defaults={"public_plan": {"target_goal": current_goal}},
+                    cache_key=prompts.AGENT_STRATEGY_RULES_KEY,
+                    uid=user_id
                 )
-            )
-
-            text = response.text.strip()
-            if text.startswith("```json"): text = text[7:]
-            if text.endswith("```"): text = text[:-3]
-            
-            result = json.loads(text)
+            except usage.BudgetExceededError:
+                print(f"🛑 {user_id} is over today's AI budget, skipping agent cycle.")
+                public_ref.set({
+                    "status": "error",
+                    "error_message": "You've reached today's AI usage limit. Please try again tomorrow."
+                }, merge=True)
+                doc_cache.invalidate(user_id, doc_cache.AGENT_STATE)
+                return
+            except structured_output.StructuredOutputError as ve:
+                print(f"❌ DATA VALIDATION ERROR: The agent generated invalid data: {ve}")
+                
+                # Update status to error so the UI shows the message. 
+                # merge=True ensures we preserve the existing roadmap/goal.
+                public_ref.set({
+                    "status": "error",
+                    "error_message": "I encountered an issue generating your plan. Please try again."
+                }, merge=True)
+                doc_cache.invalidate(user_id, doc_cache.AGENT_STATE)
+                return
             
-            new_thought_signature = result.get('thought_signature', "")
-            public_plan = result.get('public_plan', {})
+            public_plan = result.public_plan.dict()
             
             # 3. ACT / SLEEP: Persist State
             
             # Save Private State (The Brain)
             agent_sessions_ref.set({
-                "thought_signature": new_thought_signature,
+                "thought_signature": result.thought_signature,
                 "last_run_date": datetime.now().isoformat(),
                 "next_scheduled_action": public_plan.get('action_date')
             }, merge=True)
             
             # Save Public State (The UI)
-            # Ensure we keep the target_goal if not returned (it might not be)
-            # Validate Public Plan before saving
-            try:
-                # Ensure target_goal is present for validation if it wasn't in the output
-                if 'target_goal' not in public_plan:
-                    public_plan['target_goal'] = current_goal
-                
-                # attempt to validate
-                validated_state = AgentPublicState(**public_plan)
-                
-                # If valid, we can save. 
-                # Note: We might want to use validated_state.dict() to ensure clean data, 
-                # but valid public_plan dict is also fine.
-                
-                # Set status to idle so the UI stops spinning
-                public_plan['status'] = "idle"
-                public_plan['error_message'] = None # Clear any previous error
-                    
-                public_ref.set(public_plan, merge=True)
-                print(f"✅ Agent Cycle Complete. Next Action: {public_plan.get('next_action')}")
-
-            except ValidationError as ve:
-                print(f"❌ DATA VALIDATION ERROR: The agent generated invalid data: {ve}")
+            # Set status to idle so the UI stops spinning
+            public_plan['status'] = "idle"
+            public_plan['error_message'] = None # Clear any previous error
                 
-                # Update status to error so the UI shows the message. 
-                # merge=True ensures we preserve the existing roadmap/goal.
-                public_ref.set({
-                    "status": "error",
-                    "error_message": "I encountered an issue generating your plan. Please try again."
-                }, merge=True)
-
-
+            public_ref.set(public_plan, merge=True)
+            doc_cache.invalidate(user_id, doc_cache.AGENT_STATE)
+            print(f"✅ Agent Cycle Complete. Next Action: {public_plan.get('next_action')}")
 
         except Exception as e:
             print(f"❌ MarathonAgent Error: {e}")
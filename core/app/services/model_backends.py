@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pydantic import BaseModel
+from google.genai import types
+
+# Pluggable backends behind gemini_gateway, selected with GEMINI_BACKEND:
+#
+#   live    (default) real generate_content calls
+#   record  real calls, and every request/response pair is written to a cassette file
+#   replay  no network and no API key: responses are served from cassettes, with
+#           artificial latency, so /recommend, /cards/search, statement upload and the
+#           agent cycle can be load-tested and profiled offline (see scripts/benchmark_replay.py)
+#
+# Cassettes are JSON files under GEMINI_CASSETTE_DIR/<call_site>/<request hash>.json.
+# The hash covers the model, contents and config, so a replayed request must be the
+# same request that was recorded. GEMINI_REPLAY_MATCH=call_site relaxes that to "any
+# recording for this call site", round-robin, for load tests with varied inputs.
+
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "live").lower()
+GEMINI_CASSETTE_DIR = os.getenv(
+    "GEMINI_CASSETTE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "cassettes")
+)
+# Milliseconds per replayed call, or "recorded" to reproduce the latency seen while recording.
+GEMINI_REPLAY_LATENCY_MS = os.getenv("GEMINI_REPLAY_LATENCY_MS", "0")
+GEMINI_REPLAY_MATCH = os.getenv("GEMINI_REPLAY_MATCH", "exact").lower()  # exact | call_site
+
+
+class CassetteMissError(LookupError):
+    """Replay mode found no recording for a request."""
+
+
+# MARK: - Request fingerprint
+
+def _jsonable(value):
+    if isinstance(value, types.Part) and value.inline_data is not None:
+        # Don't copy whole PDFs into the key (or the cassette); a digest identifies them.
+        blob = value.inline_data
+        return {"inline_data": {"mime_type": blob.mime_type, "sha256": hashlib.sha256(blob.data or b"").hexdigest()}}
+    if isinstance(value, types.Content):
+        return {"role": value.role, "parts": [_jsonable(p) for p in value.parts or []]}
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _config_jsonable(config: types.GenerateContentConfig | None) -> dict:
+    if config is None:
+        return {}
+    schema = config.response_schema
+    data = config.model_copy(update={"response_schema": None, "http_options": None}).model_dump(mode="json", exclude_none=True)
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        data["response_schema"] = schema.model_json_schema()
+    elif schema is not None:
+        data["response_schema"] = _jsonable(schema)
+    return data
+
+
+def request_payload(model: str, contents, config: types.GenerateContentConfig | None) -> dict:
+    return {"model": model, "contents": _jsonable(contents), "config": _config_jsonable(config)}
+
+
+def request_key(payload: dict) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def _response_jsonable(response) -> dict:
+    return response.model_dump(mode="json", exclude_none=True, exclude={"parsed", "sdk_http_response"})
+
+
+# MARK: - Backends
+
+class LiveBackend:
+    """Calls Gemini."""
+    name = "live"
+    needs_client = True
+    uses_context_cache = True
+    uses_file_uploads = True
+
+    def generate(self, client, call_site, model, contents, config):
+        return client.models.generate_content(model=model, contents=contents, config=config)
+
+    async def agenerate(self, client, call_site, model, contents, config):
+        return await client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+
+class RecordingBackend(LiveBackend):
+    """Calls Gemini and writes every request/response pair to a cassette."""
+    name = "record"
+    # cached_content names and uploaded file URIs differ per run; recording the inline
+    # prefix / document keeps keys stable
+    uses_context_cache = False
+    uses_file_uploads = False
+
+    def __init__(self, cassette_dir: str = GEMINI_CASSETTE_DIR):
+        self.cassette_dir = cassette_dir
+
+    def _save(self, call_site, model, contents, config, response, latency):
+        payload = request_payload(model, contents, config)
+        key = request_key(payload)
+        folder = os.path.join(self.cassette_dir, call_site)
+        os.makedirs(folder, exist_ok=True)
+        cassette = {
+            "call_site": call_site,
+            "key": key,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "latency_ms": round(latency * 1000, 1),
+            "request": payload,
+            "response": _response_jsonable(response)
+        }
+        with open(os.path.join(folder, f"{key}.json"), "w") as f:
+            json.dump(cassette, f, indent=2)
+        print(f"📼 Recorded {call_site} -> {key}")
+
+    def generate(self, client, call_site, model, contents, config):
+        start = time.perf_counter()
+        response = super().generate(client, call_site, model, contents, config)
+        self._save(call_site, model, contents, config, response, time.perf_counter() - start)
+        return response
+
+    async def agenerate(self, client, call_site, model, contents, config):
+        start = time.perf_counter()
+        response = await super().agenerate(client, call_site, model, contents, config)
+        self._save(call_site, model, contents, config, response, time.perf_counter() - start)
+        return response
+
+
+class ReplayBackend:
+    """Serves recorded responses. Deterministic, offline, no API key needed."""
+    name = "replay"
+    needs_client = False
+    uses_context_cache = False
+    uses_file_uploads = False
+
+    def __init__(
+        self,
+        cassette_dir: str = GEMINI_CASSETTE_DIR,
+        latency_ms: str = GEMINI_REPLAY_LATENCY_MS,
+        match: str = GEMINI_REPLAY_MATCH
+    ):
+        self.cassette_dir = cassette_dir
+        self.latency_ms = str(latency_ms)
+        self.match = match
+        self._loaded = {}
+        self._by_call_site = {}
+        self._turn = {}
+        self._lock = threading.Lock()
+
+    def _load(self, path):
+        cassette = self._loaded.get(path)
+        if cassette is None:
+            with open(path) as f:
+                cassette = json.load(f)
+            self._loaded[path] = cassette
+        return cassette
+
+    def _find(self, call_site, model, contents, config) -> dict:
+        key = request_key(request_payload(model, contents, config))
+        path = os.path.join(self.cassette_dir, call_site, f"{key}.json")
+        with self._lock:
+            if os.path.exists(path):
+                return self._load(path)
+            if self.match == "call_site":
+                folder = os.path.join(self.cassette_dir, call_site)
+                if call_site not in self._by_call_site:
+                    names = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+                    self._by_call_site[call_site] = [os.path.join(folder, n) for n in names if n.endswith(".json")]
+                paths = self._by_call_site[call_site]
+                if paths:
+                    turn = self._turn.get(call_site, 0)
+                    self._turn[call_site] = turn + 1
+                    return self._load(paths[turn % len(paths)])
+        raise CassetteMissError(f"No cassette for {call_site} request {key} in {self.cassette_dir}")
+
+    def _delay(self, cassette) -> float:
+        if self.latency_ms == "recorded":
+            return cassette.get("latency_ms", 0) / 1000
+        return float(self.latency_ms) / 1000
+
+    def generate(self, client, call_site, model, contents, config):
+        cassette = self._find(call_site, model, contents, config)
+        time.sleep(self._delay(cassette))
+        return types.GenerateContentResponse.model_validate(cassette["response"])
+
+    async def agenerate(self, client, call_site, model, contents, config):
+        cassette = self._find(call_site, model, contents, config)
+        await asyncio.sleep(self._delay(cassette))
+        return types.GenerateContentResponse.model_validate(cassette["response"])
+
+
+def create_backend(mode: str = GEMINI_BACKEND):
+    if mode == "record":
+        return RecordingBackend()
+    if mode == "replay":
+        return ReplayBackend()
+    return LiveBackend()
@@ -0,0 +1,179 @@
+import os
+from dataclasses import dataclass
+from pydantic import BaseModel
+from google.genai import types
+from services import gemini_gateway, structured_output, usage
+import metrics
+
+# Model tiering per call site.
+#
+# Each call site declares a tier chain, cheapest first. A structured call runs on the
+# first tier and only moves to the next one when the answer
+#   - still fails schema validation after local repair (StructuredOutputError), or
+#   - reports `confidence` below GEMINI_MIN_CONFIDENCE, or
+#   - fails the call site's own `accept` check (e.g. an ungrounded model calling a
+#     store "invalid" is double-checked with Google Search).
+# The last tier gets the normal structured-output retries; earlier tiers get none,
+# since escalating is the retry.
+#
+# Past the user's soft token budget the gateway runs every call on GEMINI_BUDGET_MODEL,
+# so escalating would only repeat the same call: those users get the first tier only.
+#
+# Chains can be overridden per call site without a deploy, e.g.
+#   GEMINI_TIERS_RECOMMEND="gemini-2.5-flash-lite:plain,gemini-3-flash-preview:grounded"
+# See scripts/compare_gemini_models_* for the quality/speed comparisons behind the defaults.
+
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash-lite")
+PRO_MODEL = os.getenv("GEMINI_PRO_MODEL", "gemini-3-pro-preview")
+GEMINI_MIN_CONFIDENCE = float(os.getenv("GEMINI_MIN_CONFIDENCE", "0.7"))
+
+
+@dataclass(frozen=True)
+class Tier:
+    model: str
+    grounded: bool = True
+
+    @property
+    def label(self) -> str:
+        return f"{self.model}:{'grounded' if self.grounded else 'plain'}"
+
+
+_DEFAULT_CHAINS = {
+    # Store lookup + card choice: most stores are well known, search only when unsure
+    "recommend": [Tier(FAST_MODEL, grounded=False), Tier(gemini_gateway.DEFAULT_MODEL)],
+    # Benefit research needs the official guide, so always grounded; pro when unsure
+    "search_card": [Tier(gemini_gateway.DEFAULT_MODEL), Tier(PRO_MODEL)],
+    "card_update": [Tier(gemini_gateway.DEFAULT_MODEL), Tier(PRO_MODEL)],
+    "agent_cycle": [Tier(gemini_gateway.DEFAULT_MODEL), Tier(PRO_MODEL)],
+}
+
+
+def _parse_chain(spec: str) -> list[Tier]:
+    tiers = []
+    for part in spec.split(","):
+        model, _, mode = part.strip().partition(":")
+        if model:
+            tiers.append(Tier(model, grounded=(mode or "grounded") != "plain"))
+    return tiers
+
+
+def tier_chain(call_site: str) -> list[Tier]:
+    """The tier chain for a call site (env override first), defaulting to one grounded tier."""
+    override = os.getenv(f"GEMINI_TIERS_{call_site.upper()}")
+    if override:
+        chain = _parse_chain(override)
+        if chain:
+            return chain
+    return _DEFAULT_CHAINS.get(call_site, [Tier(gemini_gateway.DEFAULT_MODEL)])
+
+
+def _budget_chain(chain: list[Tier], budget: str) -> list[Tier]:
+    return chain[:1] if budget == usage.BUDGET_SOFT else chain
+
+
+def _tier_request(tier: Tier, config, cache_key):
+    """Config / cache key for a tier: ungrounded tiers drop the search tool (and so need their own cache)."""
+    if tier.grounded:
+        return config, cache_key
+    return gemini_gateway.plain_request(config, cache_key)
+
+
+def _escalation_reason(result: BaseModel, accept) -> str | None:
+    confidence = getattr(result, "confidence", None)
+    if confidence is not None and confidence < GEMINI_MIN_CONFIDENCE:
+        return "low_confidence"
+    if accept is not None and not accept(result):
+        return "rejected"
+    return None
+
+
+def _escalate(call_site, tier, reason):
+    metrics.GEMINI_TIER_ESCALATIONS.labels(call_site, tier.label, reason).inc()
+    print(f"⬆️ Escalating {call_site} past {tier.label} ({reason})")
+
+
+def _answered(call_site, tier, result):
+    metrics.GEMINI_TIER_ANSWERS.labels(call_site, tier.label).inc()
+    return result
+
+
+async def generate_tiered(
+    call_site: str,
+    contents,
+    model_cls: type[BaseModel],
+    config: types.GenerateContentConfig | None = None,
+    defaults: dict | None = None,
+    cache_key: str | None = None,
+    uid: str | None = None,
+    accept=None
+):
+    """structured_output.generate_structured across the call site's tier chain."""
+    chain = tier_chain(call_site)
+    if uid:
+        chain = _budget_chain(chain, await usage.abudget_status(uid))
+    for i, tier in enumerate(chain):
+        last = i == len(chain) - 1
+        tier_config, tier_cache_key = _tier_request(tier, config, cache_key)
+        try:
+            result = await structured_output.generate_structured(
+                call_site,
+                contents=contents,
+                model_cls=model_cls,
+                config=tier_config,
+                model=tier.model,
+                defaults=defaults,
+                max_retries=None if last else 0,
+                cache_key=tier_cache_key,
+                uid=uid
+            )
+        except structured_output.StructuredOutputError:
+            if last:
+                raise
+            _escalate(call_site, tier, "invalid")
+            continue
+        reason = None if last else _escalation_reason(result, accept)
+        if reason:
+            _escalate(call_site, tier, reason)
+            continue
+        return _answered(call_site, tier, result)
+
+
+def generate_tiered_sync(
+    call_site: str,
+    contents,
+    model_cls: type[BaseModel],
+    config: types.GenerateContentConfig | None = None,
+    defaults: dict | None = None,
+    cache_key: str | None = None,
+    uid: str | None = None,
+    accept=None
+):
+    """Blocking generate_tiered for scheduler / worker threads."""
+    chain = tier_chain(call_site)
+    if uid:
+        chain = _budget_chain(chain, usage.budget_status(uid))
+    for i, tier in enumerate(chain):
+        last = i == len(chain) - 1
+        tier_config, tier_cache_key = _tier_request(tier, config, cache_key)
+        try:
+            result = structured_output.generate_structured_sync(
+                call_site,
+                contents=contents,
+                model_cls=model_cls,
+                config=tier_config,
+                model=tier.model,
+                defaults=defaults,
+                max_retries=None if last else 0,
+                cache_key=tier_cache_key,
+                uid=uid
+            )
+        except structured_output.StructuredOutputError:
+            if last:
+                raise
+            _escalate(call_site, tier, "invalid")
+            continue
+        reason = None if last else _escalation_reason(result, accept)
+        if reason:
+            _escalate(call_site, tier, reason)
+            continue
+        return _answered(call_site, tier, result)
@@ -0,0 +1,191 @@
+import os
+from google.api_core import exceptions as gexc
+from firebase_admin import firestore
+import auth
+from services import bulk_writes, doc_cache
+
+# Per-user spending rollups, maintained incrementally so readers never stream `transactions`.
+#
+#   users/{uid}/aggregates/spending
+#     { "totals": {"spend", "cashback", "count"},
+#       "months":     {"2024-03": {"spend", "cashback", "count"}, ...},
+#       "categories": {"Dining": {...}, ...},          # from services/cashback.py
+#       "cards":      {"Amex Gold": {...}, ...},
+#       "top_retailers": [{"retailer", "spend", "count"}, ...],   # TOP_RETAILERS by spend
+#       "updated_at": ... }
+#   users/{uid}/aggregates/retailers
+#     { "retailers": {"Chipotle": {...}, ...},       # read only to rank the top ones
+#       "other": {"spend", "cashback", "count"} }    # retailers folded out of the map
+#
+# Firestore documents are capped at 1 MiB, so the retailers map can't hold every retailer a
+# user ever shopped at. Once it has more than SPENDING_RETAILERS_KEPT entries,
+# refresh_top_retailers() keeps the biggest ones by spend and folds the rest into "other"
+# (a folded retailer that shows up again starts over from its new rows).
+#
+# Writers pass the rows they add (and, for recomputed rows, the stored version with sign=-1)
+# to writes(); the returned Increment writes go into the same commit as the rows. Spend is
+# purchases only; credits and payments count towards `count` and cashback but not spend.
+# Reward rows (sign-on bonuses) add cashback under the "Rewards" category.
+#
+# Users with history from before the rollups existed get them rebuilt once from a full
+# scan (rebuild(), marked "complete") the first time the summary is read.
+
+TOP_RETAILERS = 5
+SPENDING_RETAILERS_KEPT = int(os.getenv("SPENDING_RETAILERS_KEPT", "500"))
+
+
+def _aggregates_ref(uid: str, name: str):
+    return auth.db.collection('users').document(uid).collection('aggregates').document(name)
+
+
+def _key(value) -> str:
+    # Map keys can't be empty
+    return str(value).strip() or "Unknown"
+
+
+def _add(bucket: dict, key: str, spend: float, cashback: float, count: int):
+    entry = bucket.setdefault(_key(key), {"spend": 0.0, "cashback": 0.0, "count": 0})
+    entry["spend"] += spend
+    entry["cashback"] += cashback
+    entry["count"] += count
+
+
+def deltas(transactions: list, sign: int = 1) -> dict:
+    """Rollup changes for adding (sign=1) or removing (sign=-1) transactions, as plain numbers."""
+    result = {"totals": {}, "months": {}, "categories": {}, "cards": {}, "retailers": {}}
+    for tx in transactions:
+        amount = tx.get('amount') or 0.0
+        spend = sign * amount if amount > 0 else 0.0
+        cashback = sign * (tx.get('cashback_earned') or 0.0)
+        reward = tx.get('type') == 'reward'
+        count = 0 if reward else sign
+
+        _add(result["totals"], "all", spend, cashback, count)
+        _add(result["months"], (tx.get('date') or "")[:7], spend, cashback, count)
+        _add(result["categories"], "Rewards" if reward else (tx.get('category') or "Other"), spend, cashback, count)
+        _add(result["cards"], tx.get('card_name') or "Credit Card", spend, cashback, count)
+        if not reward:
+            _add(result["retailers"], tx.get('retailer') or "Unknown", spend, cashback, count)
+    result["totals"] = result["totals"].get("all", {})
+    return result
+
+
+def merge(*parts: dict) -> dict:
+    """Sums several deltas() results."""
+    result = {"totals": {}, "months": {}, "categories": {}, "cards": {}, "retailers": {}}
+    for part in parts:
+        for name, value in part["totals"].items():
+            result["totals"][name] = result["totals"].get(name, 0) + value
+        for group in ("months", "categories", "cards", "retailers"):
+            for key, entry in part[group].items():
+                _add(result[group], key, entry["spend"], entry["cashback"], entry["count"])
+    return result
+
+
+def _increments(entry: dict) -> dict:
+    return {name: firestore.Increment(round(value, 2) if isinstance(value, float) else value)
+            for name, value in entry.items() if value}
+
+
+def writes(uid: str, change: dict) -> list:
+    """bulk_writes operations applying a deltas() result; empty if nothing changes."""
+    spending = {}
+    if _increments(change["totals"]):
+        spending["totals"] = _increments(change["totals"])
+    for group in ("months", "categories", "cards"):
+        values = {key: _increments(entry) for key, entry in change[group].items() if _increments(entry)}
+        if values:
+            spending[group] = values
+    retailers = {key: _increments(entry) for key, entry in change["retailers"].items() if _increments(entry)}
+
+    result = []
+    if spending:
+        spending["updated_at"] = firestore.SERVER_TIMESTAMP
+        result.append(bulk_writes.set_doc(_aggregates_ref(uid, "spending"), spending, merge=True))
+    if retailers:
+        result.append(bulk_writes.set_doc(_aggregates_ref(uid, "retailers"), {"retailers": retailers}, merge=True))
+    return result
+
+
+def _plain(entry: dict) -> dict:
+    return {name: round(value, 2) if isinstance(value, float) else value for name, value in entry.items()}
+
+
+def _ranked(retailers: dict) -> list:
+    return sorted(retailers.items(), key=lambda item: item[1].get("spend", 0.0), reverse=True)
+
+
+def _cap(retailers: dict, other: dict | None = None) -> tuple[dict, dict]:
+    """(the SPENDING_RETAILERS_KEPT biggest retailers, `other` plus everything else)."""
+    ranked = _ranked(retailers)
+    folded = {"spend": 0.0, "cashback": 0.0, "count": 0, **(other or {})}
+    for _, entry in ranked[SPENDING_RETAILERS_KEPT:]:
+        for name in ("spend", "cashback", "count"):
+            folded[name] += entry.get(name, 0)
+    return {name: _plain(entry) for name, entry in ranked[:SPENDING_RETAILERS_KEPT]}, _plain(folded)
+
+
+def rebuild(uid: str) -> dict:
+    """Recomputes both rollup docs from the whole transactions subcollection. Blocking."""
+    transactions = (doc.to_dict() for doc in
+                    auth.db.collection('users').document(uid).collection('transactions').stream())
+    full = deltas(transactions)
+    spending = {"totals": _plain(full["totals"]), "complete": True, "updated_at": firestore.SERVER_TIMESTAMP}
+    for group in ("months", "categories", "cards"):
+        spending[group] = {key: _plain(entry) for key, entry in full[group].items()}
+
+    batch = auth.db.batch()
+    batch.set(_aggregates_ref(uid, "spending"), spending)
+    retailers, other = _cap(full["retailers"])
+    batch.set(_aggregates_ref(uid, "retailers"), {"retailers": retailers, "other": other})
+    batch.commit()
+    refresh_top_retailers(uid)
+    print(f"📊 Rebuilt spending aggregates for {uid}")
+    return spending
+
+
+def _compact(uid: str, snap, retailers: dict, other: dict | None):
+    """Folds the tail of the retailers map into "other", unless the doc changed after `snap` was read."""
+    kept, other = _cap(retailers, other)
+    try:
+        _aggregates_ref(uid, "retailers").update({"retailers": kept, "other": other},
+                                                 option=auth.db.write_option(last_update_time=snap.update_time))
+        print(f"📊 Folded {len(retailers) - len(kept)} retailers into 'other' for {uid}")
+    except gexc.FailedPrecondition as e:
+        # Rows were added meanwhile; the next refresh tries again
+        print(f"⚠️ Retailers for {uid} changed while compacting, keeping them: {e}")
+
+
+def refresh_top_retailers(uid: str):
+    """Re-ranks top retailers from the retailers doc into the spending doc and the profile. Blocking."""
+    snap = _aggregates_ref(uid, "retailers").get()
+    data = (snap.to_dict() or {}) if snap.exists else {}
+    retailers = data.get("retailers", {})
+    if len(retailers) > SPENDING_RETAILERS_KEPT:
+        _compact(uid, snap, retailers, data.get("other"))
+    ranked = _ranked(retailers)
+    top = [{"retailer": name, "spend": round(entry.get("spend", 0.0), 2), "count": entry.get("count", 0)}
+           for name, entry in ranked[:TOP_RETAILERS] if entry.get("spend", 0.0) > 0]
+
+    batch = auth.db.batch()
+    batch.set(_aggregates_ref(uid, "spending"), {"top_retailers": top}, merge=True)
+    if top:
+        batch.update(auth.db.collection('users').document(uid), {"top_retailer": top[0]["retailer"]})
+    batch.commit()
+    doc_cache.invalidate(uid, doc_cache.PROFILE)
+
+
+def get_summary(uid: str) -> dict:
+    """The spending rollup doc (one read, whatever the history length). Blocking."""
+    snap = _aggregates_ref(uid, "spending").get()
+    summary = snap.to_dict() if snap.exists else {}
+    if not summary.get("complete"):
+        rebuild(uid)
+        summary = _aggregates_ref(uid, "spending").get().to_dict() or {}
+    return {
+        "totals": summary.get("totals", {"spend": 0.0, "cashback": 0.0, "count": 0}),
+        "months": summary.get("months", {}),
+        "categories": summary.get("categories", {}),
+        "cards": summary.get("cards", {}),
+        "top_retailers": summary.get("top_retailers", []),
+    }
@@ -0,0 +1,134 @@
+import os
+from datetime import date, timedelta
+import numpy as np
+from services import cashback, transaction_pages
+
+# Fixed-size spending features for the marathon agent prompt.
+#
+# The agent is asked to spot habits ("Dining out too much?") but used to get no
+# transactions at all. summarize() reads a bounded window of recent rows (projected,
+# one paged query) and reduces them with numpy to a few short lines:
+#   - spend per 30-day period and the trend
+#   - category shares
+#   - recurring merchants (same merchant in several months at a steady amount)
+#   - sign-on bonus pace (spend still needed per day vs. the current daily spend on that card)
+# Every section has a fixed number of entries, and format_block() cuts the block at
+# SPENDING_SUMMARY_MAX_CHARS, so the prompt stays the same size however long the history is.
+
+SPENDING_SUMMARY_DAYS = int(os.getenv("SPENDING_SUMMARY_DAYS", "90"))
+SPENDING_SUMMARY_MAX_ROWS = int(os.getenv("SPENDING_SUMMARY_MAX_ROWS", "500"))
+# ~4 characters per token
+SPENDING_SUMMARY_MAX_CHARS = int(os.getenv("SPENDING_SUMMARY_MAX_CHARS", "1200"))
+
+TOP_CATEGORIES = 5
+TOP_RECURRING = 5
+# Coefficient of variation below which repeated charges count as one recurring bill
+_RECURRING_SPREAD = 0.15
+
+_FIELDS = ["date", "retailer", "amount", "card_name", "category", "type"]
+
+
+def recent_transactions(uid: str, today: date | None = None) -> list[dict]:
+    """Purchases and credits from the last SPENDING_SUMMARY_DAYS (newest first, bounded). Blocking."""
+    today = today or date.today()
+    start = (today - timedelta(days=SPENDING_SUMMARY_DAYS)).isoformat()
+    query = transaction_pages.build_query(uid, start_date=start, fields=_FIELDS)
+    rows, _ = transaction_pages.fetch_page(query, SPENDING_SUMMARY_MAX_ROWS)
+    return [row for row in rows if row.get('type') != 'reward']
+
+
+def _features(transactions: list[dict], cards: list[dict], today: date) -> dict:
+    purchases = [tx for tx in transactions if (tx.get('amount') or 0.0) > 0 and tx.get('date')]
+    if not purchases:
+        return {}
+
+    amounts = np.array([tx['amount'] for tx in purchases], dtype=float)
+    age = np.array([(today - date.fromisoformat(tx['date'][:10])).days for tx in purchases])
+    # 30-day periods back from today: 0 = last 30 days
+    period = np.clip(age // 30, 0, SPENDING_SUMMARY_DAYS // 30 - 1)
+    per_period = np.bincount(period, weights=amounts, minlength=SPENDING_SUMMARY_DAYS // 30)
+
+    categories = [tx.get('category') or cashback.categorize(tx.get('retailer') or "") for tx in purchases]
+    category_names, category_index = np.unique(categories, return_inverse=True)
+    per_category = np.bincount(category_index, weights=amounts)
+    order = np.argsort(per_category)[::-1][:TOP_CATEGORIES]
+    shares = [(str(category_names[i]), float(per_category[i] / amounts.sum())) for i in order]
+
+    # Recurring: same retailer in 2+ periods with a steady charge
+    retailers = [(tx.get('retailer') or "").strip() for tx in purchases]
+    retailer_names, retailer_index = np.unique(retailers, return_inverse=True)
+    recurring = []
+    for i, name in enumerate(retailer_names):
+        mask = retailer_index == i
+        if not name or len(np.unique(period[mask])) < 2:
+            continue
+        charges = amounts[mask]
+        if charges.std() / charges.mean() <= _RECURRING_SPREAD:
+            recurring.append((str(name), float(charges.mean())))
+    recurring.sort(key=lambda item: item[1], reverse=True)
+
+    bonuses = []
+    for card in cards:
+        bonus = card.get('sign_on_bonus')
+        if not bonus or not bonus.get('end_date'):
+            continue
+        # Stored as null on some cards
+        remaining = max(0.0, (bonus.get('target_spend') or 0.0) - (bonus.get('current_spend') or 0.0))
+        days_left = (date.fromisoformat(bonus['end_date'][:10]) - today).days
+        name = card.get('name', '')
+        on_card = np.array([name.lower() in (tx.get('card_name') or '').lower() for tx in purchases])
+        recent_daily = float(amounts[on_card & (age < 30)].sum() / 30)
+        bonuses.append({
+            "card": name,
+            "remaining": remaining,
+            "days_left": days_left,
+            # Ends today: the rest is needed today
+            "needed_daily": remaining / max(days_left, 1) if days_left >= 0 else None,
+            "recent_daily": recent_daily,
+        })
+
+    return {
+        "periods": [float(value) for value in per_period],
+        "shares": shares,
+        "recurring": recurring[:TOP_RECURRING],
+        "bonuses": bonuses,
+        "count": len(purchases),
+    }
+
+
+def format_block(features: dict) -> str:
+    """The prompt section for summarize()'s features, capped at SPENDING_SUMMARY_MAX_CHARS."""
+    if not features:
+        return "SPENDING SUMMARY: No recent transactions uploaded."
+
+    periods = features["periods"]
+    lines = [f"SPENDING SUMMARY (last {SPENDING_SUMMARY_DAYS} days, {features['count']} purchases):"]
+    lines.append("- Spend per 30 days, newest first: " + ", ".join(f"${value:,.0f}" for value in periods))
+    if len(periods) > 1 and periods[1] > 0:
+        change = (periods[0] - periods[1]) / periods[1]
+        lines.append(f"- Trend vs previous 30 days: {change:+.0%}")
+    lines.append("- Category shares: " + ", ".join(f"{name} {share:.0%}" for name, share in features["shares"]))
+    if features["recurring"]:
+        lines.append("- Recurring charges: " + ", ".join(f"{name} ~${amount:,.2f}" for name, amount in features["recurring"]))
+    for bonus in features["bonuses"]:
+        if bonus["remaining"] <= 0:
+            continue
+        if bonus["needed_daily"] is None:
+            lines.append(f"- Bonus {bonus['card']}: ${bonus['remaining']:,.0f} short, deadline passed")
+            continue
+        pace = "ON PACE" if bonus["recent_daily"] >= bonus["needed_daily"] else "BEHIND"
+        lines.append(f"- Bonus {bonus['card']}: ${bonus['remaining']:,.0f} left in {bonus['days_left']} days "
+                     f"(needs ${bonus['needed_daily']:,.0f}/day, recent ${bonus['recent_daily']:,.0f}/day, {pace})")
+
+    block = ""
+    for line in lines:
+        if len(block) + len(line) + 1 > SPENDING_SUMMARY_MAX_CHARS:
+            break
+        block += line + "\n"
+    return block.rstrip()
+
+
+def summarize(uid: str, cards: list[dict], today: date | None = None) -> str:
+    """Prompt block for `uid`'s recent spending. Blocking."""
+    today = today or date.today()
+    return format_block(_features(recent_transactions(uid, today), cards, today))
@@ -0,0 +1,107 @@
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PyPdfError
+from services import uploads
+
+# Page-range splitting for statement extraction.
+#
+# Long or multi-month statements are split into chunks of STATEMENT_PAGES_PER_CHUNK
+# pages, each extracted by its own Gemini call (see GeminiService.process_statement),
+# at most STATEMENT_CHUNK_CONCURRENCY at a time. A failed chunk is retried on its own
+# up to STATEMENT_CHUNK_RETRIES times. Statements that fit in one chunk keep the
+# single-request path.
+#
+# Chunks don't overlap, but a row cut by a page break can still be read by both
+# neighbours, so merge() drops repeats where one chunk's tail meets the next one's head.
+
+STATEMENT_PAGES_PER_CHUNK = int(os.getenv("STATEMENT_PAGES_PER_CHUNK", "3"))
+STATEMENT_CHUNK_CONCURRENCY = int(os.getenv("STATEMENT_CHUNK_CONCURRENCY", "4"))
+STATEMENT_CHUNK_RETRIES = int(os.getenv("STATEMENT_CHUNK_RETRIES", "2"))
+
+# How many transactions at each side of a boundary are compared
+_BOUNDARY_WINDOW = 5
+
+
+@dataclass
+class PageChunk:
+    first_page: int  # 1-based, inclusive
+    last_page: int
+    page_count: int  # of the whole statement
+    pdf: BinaryIO     # seekable; spooled to disk past uploads.UPLOAD_SPOOL_BYTES
+
+    @property
+    def label(self) -> str:
+        return f"pages {self.first_page}-{self.last_page} of {self.page_count}"
+
+
+def split(pdf: BinaryIO, pages_per_chunk: int | None = None) -> list[PageChunk]:
+    """
+    Splits a PDF file into page-range chunks, each in its own spooled temp file (the
+    caller closes them). A single chunk is the original file.
+    """
+    pages_per_chunk = max(1, pages_per_chunk or STATEMENT_PAGES_PER_CHUNK)
+    try:
+        pdf.seek(0)
+        reader = PdfReader(pdf)
+        total = len(reader.pages)
+    except PyPdfError as e:
+        # Let the model have a go at the file as a whole
+        print(f"⚠️ Could not split statement PDF: {e}")
+        return [PageChunk(1, 1, 0, pdf)]
+    if total <= pages_per_chunk:
+        return [PageChunk(1, max(total, 1), total, pdf)]
+
+    return [
+        _write_chunk(reader, start + 1, min(start + pages_per_chunk, total))
+        for start in range(0, total, pages_per_chunk)
+    ]
+
+
+def split_pages(pdf: BinaryIO, page_numbers: list[int], pages_per_chunk: int | None = None) -> list[PageChunk]:
+    """Chunks for just the given 1-based pages: runs of consecutive pages, at most pages_per_chunk each."""
+    pages_per_chunk = max(1, pages_per_chunk or STATEMENT_PAGES_PER_CHUNK)
+    pdf.seek(0)
+    reader = PdfReader(pdf)
+    chunks, run = [], []
+    for number in sorted(page_numbers):
+        if run and (number != run[-1] + 1 or len(run) == pages_per_chunk):
+            chunks.append(_write_chunk(reader, run[0], run[-1]))
+            run = []
+        run.append(number)
+    if run:
+        chunks.append(_write_chunk(reader, run[0], run[-1]))
+    return chunks
+
+
+def _write_chunk(reader: PdfReader, first_page: int, last_page: int) -> PageChunk:
+    writer = PdfWriter()
+    for index in range(first_page - 1, last_page):
+        writer.add_page(reader.pages[index])
+    spool = tempfile.SpooledTemporaryFile(max_size=uploads.UPLOAD_SPOOL_BYTES)
+    writer.write(spool)
+    return PageChunk(first_page, last_page, len(reader.pages), spool)
+
+
+def _key(tx: dict):
+    return (tx.get("date"), (tx.get("retailer") or "").strip().lower(), round(float(tx.get("amount") or 0), 2))
+
+
+def merge(chunk_results: list[list[dict]]) -> list[dict]:
+    """Concatenates per-chunk transactions in page order, dropping repeats at chunk boundaries."""
+    merged = []
+    for transactions in chunk_results:
+        tail = [_key(tx) for tx in merged[-_BOUNDARY_WINDOW:]]
+        start = 0
+        for tx in transactions[:_BOUNDARY_WINDOW]:
+            key = _key(tx)
+            if key not in tail:
+                break
+            tail.remove(key)
+            start += 1
+        if start:
+            print(f"🔗 Dropped {start} transaction(s) repeated across a page boundary")
+        merged.extend(transactions[start:])
+    return merged
@@ -0,0 +1,77 @@
+import re
+import hashlib
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+from firebase_admin import firestore
+import auth
+from services import statement_jobs
+
+# Re-upload detection for statements.
+#
+# Every accepted upload is remembered under two fingerprints:
+#   content_<sha256 of the file bytes>   - the exact same file
+#   text_<sha256 of the normalized text> - same statement, different bytes (a re-downloaded
+#                                          PDF with a new creation date / producer / IDs)
+# Layout: users/{uid}/statement_hashes/{fingerprint} -> { "job_id": ..., "filename": ..., "created_at": ... }
+#
+# A matching upload gets the earlier job back instead of a new Gemini extraction: its
+# stored result if done, or its live status if still running. Failed jobs don't count.
+# Scanned statements have no text layer and only get the content fingerprint.
+
+_READ_CHUNK = 64 * 1024
+
+
+def _hashes_ref(uid: str):
+    return auth.db.collection('users').document(uid).collection('statement_hashes')
+
+
+def _normalized_text(pdf) -> str:
+    try:
+        pdf.seek(0)
+        reader = PdfReader(pdf)
+        text = " ".join(page.extract_text() or "" for page in reader.pages)
+    except PyPdfError as e:
+        print(f"⚠️ Could not read statement text: {e}")
+        return ""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def fingerprints(pdf) -> list[str]:
+    """Content and (if there is a text layer) text fingerprints of a statement file. Blocking."""
+    pdf.seek(0)
+    content = hashlib.sha256()
+    for chunk in iter(lambda: pdf.read(_READ_CHUNK), b""):
+        content.update(chunk)
+    keys = [f"content_{content.hexdigest()}"]
+
+    text = _normalized_text(pdf)
+    if text:
+        keys.append(f"text_{hashlib.sha256(text.encode()).hexdigest()}")
+    pdf.seek(0)
+    return keys
+
+
+def find_previous(uid: str, keys: list[str]) -> tuple[dict, str] | None:
+    """(job, matched kind) for an earlier upload of the same statement that didn't fail, else None. Blocking."""
+    refs = [_hashes_ref(uid).document(key) for key in keys]
+    matches = {snap.id: snap.to_dict() for snap in auth.db.get_all(refs) if snap.exists}
+    for key in keys:  # exact match first
+        entry = matches.get(key)
+        if not entry:
+            continue
+        job = statement_jobs.get_job(uid, entry["job_id"])
+        if job and job["status"] != statement_jobs.STATUS_FAILED:
+            return job, key.split("_", 1)[0]
+    return None
+
+
+def remember(uid: str, keys: list[str], job_id: str, filename: str):
+    """Points the statement's fingerprints at its job. Blocking."""
+    batch = auth.db.batch()
+    for key in keys:
+        batch.set(_hashes_ref(uid).document(key), {
+            "job_id": job_id,
+            "filename": filename,
+            "created_at": firestore.SERVER_TIMESTAMP
+        })
+    batch.commit()
@@ -0,0 +1,146 @@
+import os
+import uuid
+import asyncio
+import weakref
+from datetime import datetime, timedelta, timezone
+from firebase_admin import firestore
+import auth
+import metrics
+import services.agent_queue as agent_queue
+from services import cashback, statement_store
+from services.gemini_service import GeminiService
+
+# Statement ingestion as a background pipeline.
+#
+# POST /transactions/upload spools the file, creates a job and answers 202 right away.
+# The job then runs on the event loop as an asyncio task:
+#
+#   queued -> extracting (Gemini, async) -> saving (Firestore, worker thread) -> done | failed
+#
+# Job layout: users/{uid}/statement_jobs/{job_id}
+# {
+#     "status": "queued" | "extracting" | "saving" | "done" | "failed",
+#     "filename": "march.pdf",
+#     "created_at": <timestamp>, "updated_at": <timestamp>,
+#     "result": { "message": ..., "count": 42, "completed_bonuses": [...] },  # when done
+#     "error": "..."                                                          # when failed
+# }
+#
+# Clients poll GET /transactions/jobs/{job_id} or follow /events (SSE). Both read the
+# job document, so any instance can answer. Jobs live in the instance that accepted the
+# upload; one that stops updating for STATEMENT_JOB_STALE_SECONDS (instance shut down)
+# is reported as failed.
+
+STATEMENT_JOB_CONCURRENCY = int(os.getenv("STATEMENT_JOB_CONCURRENCY", "4"))
+STATEMENT_JOB_STALE_SECONDS = float(os.getenv("STATEMENT_JOB_STALE_SECONDS", "900"))
+
+STATUS_QUEUED = "queued"
+STATUS_EXTRACTING = "extracting"
+STATUS_SAVING = "saving"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+TERMINAL_STATUSES = {STATUS_DONE, STATUS_FAILED}
+
+gemini_service = GeminiService()
+
+# Running pipelines by job ID (also keeps a reference so they aren't GC'd)
+_running = {}
+_limits = weakref.WeakKeyDictionary()
+
+
+def _job_ref(uid: str, job_id: str):
+    return auth.db.collection('users').document(uid).collection('statement_jobs').document(job_id)
+
+
+def _limit():
+    # asyncio primitives are bound to an event loop; keep one semaphore per loop
+    loop = asyncio.get_running_loop()
+    semaphore = _limits.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(STATEMENT_JOB_CONCURRENCY)
+        _limits[loop] = semaphore
+    return semaphore
+
+
+def create_job(uid: str, filename: str) -> str:
+    """Creates a queued job document and returns its ID (blocking Firestore write)."""
+    job_id = uuid.uuid4().hex
+    _job_ref(uid, job_id).set({
+        "status": STATUS_QUEUED,
+        "filename": filename,
+        "created_at": firestore.SERVER_TIMESTAMP,
+        "updated_at": firestore.SERVER_TIMESTAMP
+    })
+    return job_id
+
+
+def _update(uid: str, job_id: str, **fields):
+    fields["updated_at"] = firestore.SERVER_TIMESTAMP
+    _job_ref(uid, job_id).update(fields)
+
+
+def get_job(uid: str, job_id: str) -> dict | None:
+    """The job's public status, or None if it doesn't exist (blocking Firestore read)."""
+    snap = _job_ref(uid, job_id).get()
+    if not snap.exists:
+        return None
+    job = snap.to_dict()
+    updated_at = job.get("updated_at")
+    if (
+        job.get("status") not in TERMINAL_STATUSES
+        and updated_at
+        and datetime.now(timezone.utc) - updated_at > timedelta(seconds=STATEMENT_JOB_STALE_SECONDS)
+    ):
+        job["status"] = STATUS_FAILED
+        job["error"] = "Processing was interrupted. Please upload the statement again."
+    return {
+        "job_id": job_id,
+        "status": job.get("status"),
+        "filename": job.get("filename"),
+        "result": job.get("result"),
+        "error": job.get("error")
+    }
+
+
+# MARK: - Pipeline
+
+def start(uid: str, job_id: str, pdf, filename: str):
+    """Schedules the pipeline for a spooled statement file (closed when the job ends)."""
+    task = asyncio.ensure_future(_run(uid, job_id, pdf, filename))
+    _running[job_id] = task
+    task.add_done_callback(lambda _: _running.pop(job_id, None))
+    return task
+
+
+async def _run(uid: str, job_id: str, pdf, filename: str):
+    try:
+        async with _limit():
+            await asyncio.to_thread(_update, uid, job_id, status=STATUS_EXTRACTING)
+            transactions = await gemini_service.process_statement(pdf, uid=uid)
+
+            if not transactions:
+                result = {"message": "No transactions found or processing failed.", "count": 0, "completed_bonuses": []}
+            else:
+                await asyncio.to_thread(_update, uid, job_id, status=STATUS_SAVING)
+                transactions = await asyncio.to_thread(cashback.apply, uid, transactions)
+                result = await asyncio.to_thread(statement_store.save_statement, uid, transactions, filename)
+                if result.get("new_count") != 0:
+                    # Queue Agent to analyze new spending (debounced with other triggers)
+                    await asyncio.to_thread(agent_queue.enqueue_agent_run, uid, "statement_upload")
+
+            # The transactions themselves are read back through GET /transactions;
+            # a long statement would not fit in the job document
+            result.pop("data", None)
+            await asyncio.to_thread(_update, uid, job_id, status=STATUS_DONE, result=result)
+            metrics.STATEMENT_JOBS.labels(STATUS_DONE).inc()
+
+    except Exception as e:
+        print(f"❌ Statement job {job_id} failed: {e}")
+        metrics.STATEMENT_JOBS.labels(STATUS_FAILED).inc()
+        detail = getattr(e, "detail", None) or str(e)
+        try:
+            await asyncio.to_thread(_update, uid, job_id, status=STATUS_FAILED, error=detail)
+        except Exception as update_error:
+            print(f"❌ Could not mark statement job {job_id} failed: {update_error}")
+    finally:
+        pdf.close()
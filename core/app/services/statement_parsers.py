@@ -0,0 +1,288 @@
+import io
+import os
+import re
+import asyncio
+import threading
+import multiprocessing
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+
+# Local statement extraction for known issuer layouts.
+#
+# Most uploads come from a few issuers whose statements have a stable text layer, so
+# transactions can be read with a regex per layout instead of a multimodal Gemini call:
+#
+#   text layer (pypdf) -> detect issuer -> per-page row regex -> transactions
+#
+# Each page gets a confidence: the share of transaction-looking lines (a date at the
+# start, an amount after it) that the template actually parsed. Pages below
+# STATEMENT_PARSER_MIN_CONFIDENCE are sent to Gemini by GeminiService.process_statement;
+# unknown issuers and scanned statements (no text layer) go to Gemini whole.
+#
+# Parsing is CPU-bound pure Python, so it runs in a process pool
+# (STATEMENT_PARSER_WORKERS) rather than on the event loop or a GIL-bound thread.
+# Workers are spawned, not forked: forking a process with live gRPC, scheduler and server
+# threads can deadlock the child. This module imports only the stdlib and pypdf, so a
+# worker starts without touching Firebase.
+
+STATEMENT_PARSER_ENABLED = os.getenv("STATEMENT_PARSER_ENABLED", "true").lower() != "false"
+STATEMENT_PARSER_WORKERS = int(os.getenv("STATEMENT_PARSER_WORKERS", str(min(4, os.cpu_count() or 1))))
+STATEMENT_PARSER_MIN_CONFIDENCE = float(os.getenv("STATEMENT_PARSER_MIN_CONFIDENCE", "0.9"))
+# Bigger files are sent to the process pool as bytes, so keep them off this path
+STATEMENT_PARSER_MAX_BYTES = int(os.getenv("STATEMENT_PARSER_MAX_BYTES", str(10 * 1024 * 1024)))
+
+_AMOUNT = r"(?P<amount>-?\s?\$?-?[\d,]+\.\d{2})(?:\s?(?P<credit>CR))?"
+
+# A line that looks like a transaction in any layout: a date first, an amount somewhere
+_CANDIDATE = re.compile(r"^\s*(\d{1,2}/\d{1,2}(/\d{2,4})?|[A-Z][a-z]{2} \d{1,2})\s.*\$?[\d,]+\.\d{2}\b")
+
+
+@dataclass(frozen=True)
+class IssuerTemplate:
+    name: str
+    detect: re.Pattern           # matched against the first page
+    row: re.Pattern              # named groups: date, description, amount (credit optional)
+    date_format: str             # strptime format of the `date` group
+    closing_date: re.Pattern     # statement closing date, for the year of MM/DD rows
+    closing_format: str
+    card_names: tuple = ()       # (pattern, product name), first match wins
+    default_card_name: str = "Credit Card"
+
+
+TEMPLATES = [
+    IssuerTemplate(
+        name="chase",
+        detect=re.compile(r"chase\.com|JPMorgan Chase", re.IGNORECASE),
+        row=re.compile(r"^\s*(?P<date>\d{2}/\d{2})\s+(?P<description>.+?)\s+" + _AMOUNT + r"\s*$"),
+        date_format="%m/%d",
+        closing_date=re.compile(r"Opening/Closing Date\s+\d{2}/\d{2}/\d{2}\s*-\s*(\d{2}/\d{2}/\d{2})"),
+        closing_format="%m/%d/%y",
+        card_names=(
+            (re.compile(r"Sapphire Reserve", re.IGNORECASE), "Chase Sapphire Reserve"),
+            (re.compile(r"Sapphire Preferred", re.IGNORECASE), "Chase Sapphire Preferred"),
+            (re.compile(r"Freedom Unlimited", re.IGNORECASE), "Chase Freedom Unlimited"),
+            (re.compile(r"Freedom Flex", re.IGNORECASE), "Chase Freedom Flex"),
+        ),
+        default_card_name="Chase Credit Card",
+    ),
+    IssuerTemplate(
+        name="amex",
+        detect=re.compile(r"americanexpress\.com|American Express", re.IGNORECASE),
+        row=re.compile(r"^\s*(?P<date>\d{2}/\d{2}/\d{2})\*?\s+(?P<description>.+?)\s+" + _AMOUNT + r"\s*$"),
+        date_format="%m/%d/%y",
+        closing_date=re.compile(r"Closing Date\s+(\d{2}/\d{2}/\d{2})"),
+        closing_format="%m/%d/%y",
+        card_names=(
+            (re.compile(r"Platinum Card", re.IGNORECASE), "American Express Platinum Card"),
+            (re.compile(r"Gold Card", re.IGNORECASE), "American Express Gold Card"),
+            (re.compile(r"Blue Cash Preferred", re.IGNORECASE), "Blue Cash Preferred Card from American Express"),
+            (re.compile(r"Blue Cash Everyday", re.IGNORECASE), "Blue Cash Everyday Card from American Express"),
+        ),
+        default_card_name="American Express Card",
+    ),
+    IssuerTemplate(
+        name="capital_one",
+        detect=re.compile(r"capitalone\.com|Capital One", re.IGNORECASE),
+        # Trans date, post date, description, amount
+        row=re.compile(r"^\s*(?P<date>[A-Z][a-z]{2} \d{1,2})\s+[A-Z][a-z]{2} \d{1,2}\s+(?P<description>.+?)\s+" + _AMOUNT + r"\s*$"),
+        date_format="%b %d",
+        closing_date=re.compile(r"[A-Z][a-z]{2} \d{1,2}, \d{4}\s*-\s*([A-Z][a-z]{2} \d{1,2}, \d{4})"),
+        closing_format="%b %d, %Y",
+        card_names=(
+            (re.compile(r"Venture X", re.IGNORECASE), "Capital One Venture X"),
+            (re.compile(r"Venture", re.IGNORECASE), "Capital One Venture"),
+            (re.compile(r"Savor", re.IGNORECASE), "Capital One Savor"),
+            (re.compile(r"Quicksilver", re.IGNORECASE), "Capital One Quicksilver"),
+        ),
+        default_card_name="Capital One Card",
+    ),
+    IssuerTemplate(
+        name="citi",
+        detect=re.compile(r"citicards\.com|citi\.com|Citibank", re.IGNORECASE),
+        # Sale date, post date, description, amount
+        row=re.compile(r"^\s*(?P<date>\d{2}/\d{2})\s+\d{2}/\d{2}\s+(?P<description>.+?)\s+" + _AMOUNT + r"\s*$"),
+        date_format="%m/%d",
+        closing_date=re.compile(r"Billing Period:\s*\d{2}/\d{2}/\d{2}\s*-\s*(\d{2}/\d{2}/\d{2})"),
+        closing_format="%m/%d/%y",
+        card_names=(
+            (re.compile(r"Double Cash", re.IGNORECASE), "Citi Double Cash"),
+            (re.compile(r"Custom Cash", re.IGNORECASE), "Citi Custom Cash"),
+            (re.compile(r"Strata Premier", re.IGNORECASE), "Citi Strata Premier"),
+        ),
+        default_card_name="Citi Card",
+    ),
+]
+
+
+@dataclass
+class ParsedStatement:
+    issuer: str
+    card_name: str
+    page_count: int
+    card_last4: str | None = None
+    # page number (1-based) -> transactions parsed on it, for confident pages only
+    pages: dict = field(default_factory=dict)
+    # 1-based page numbers the template couldn't read reliably
+    fallback_pages: list = field(default_factory=list)
+
+    @property
+    def transactions(self) -> list[dict]:
+        return [tx for page in sorted(self.pages) for tx in self.pages[page]]
+
+
+# MARK: - Parsing (runs in worker processes)
+
+_PREFIXES = re.compile(r"^(SQ|TST|SP|PAYPAL|PP|GOOGLE|APL|AMZN MKTP US)\s?\*\s?", re.IGNORECASE)
+
+
+def clean_retailer(description: str) -> str:
+    """'SQ *BLUE BOTTLE 0423 OAKLAND CA' -> 'Blue Bottle', 'UBER *RIDE' -> 'Uber'."""
+    name = _PREFIXES.sub("", description.strip())
+    name = name.split("*")[0]
+    name = re.sub(r"#?\d{3,}.*$", "", name)           # store numbers and everything after
+    name = re.sub(r"\s{2,}.*$", "", name)              # column gap before city / state
+    name = re.sub(r"\s+[A-Z]{2}$", "", name.strip())   # trailing state code
+    name = re.sub(r"\s+", " ", name).strip(" -.,")
+    return name.title() if name.isupper() else name or description.strip()
+
+
+def _amount(match) -> float:
+    text = match.group("amount").replace("$", "").replace(",", "").replace(" ", "")
+    negative = text.count("-") % 2 == 1 or bool(match.group("credit"))
+    return -float(text.replace("-", "")) if negative else float(text.replace("-", ""))
+
+
+def _closing_date(template: IssuerTemplate, text: str) -> date:
+    match = template.closing_date.search(text)
+    if match:
+        try:
+            return datetime.strptime(match.group(1), template.closing_format).date()
+        except ValueError:
+            pass
+    return date.today()
+
+
+def _row_date(template: IssuerTemplate, value: str, closing: date) -> str:
+    if "%y" in template.date_format or "%Y" in template.date_format:
+        return datetime.strptime(value, template.date_format).date().isoformat()
+    # Parsed against a leap year so 02/29 is valid
+    parsed = datetime.strptime(f"{value} 2000", f"{template.date_format} %Y")
+    # No year on the row: the statement closing date's, or the year before for rows
+    # from December on a January statement
+    year = closing.year if parsed.month <= closing.month else closing.year - 1
+    return date(year, parsed.month, parsed.day).isoformat()
+
+
+_LAST4 = re.compile(r"(?:ending in|Account (?:Number|Ending)[:\s]*(?:[X\*\-]+\s?)*)\s*(\d{4})\b", re.IGNORECASE)
+
+
+def _card_last4(text: str) -> str | None:
+    match = _LAST4.search(text)
+    return match.group(1) if match else None
+
+
+def _card_name(template: IssuerTemplate, text: str) -> str:
+    for pattern, name in template.card_names:
+        if pattern.search(text):
+            return name
+    return template.default_card_name
+
+
+def parse_pages(page_texts: list[str]) -> ParsedStatement | None:
+    """Parses a statement's page texts. None for unknown issuers or no text layer."""
+    if not page_texts or not "".join(page_texts).strip():
+        return None
+    first = page_texts[0]
+    template = next((t for t in TEMPLATES if t.detect.search(first)), None)
+    if template is None:
+        return None
+
+    closing = _closing_date(template, "\n".join(page_texts[:2]))
+    card_name = _card_name(template, first)
+    card_last4 = _card_last4(first)
+    result = ParsedStatement(issuer=template.name, card_name=card_name, page_count=len(page_texts), card_last4=card_last4)
+
+    for number, text in enumerate(page_texts, 1):
+        rows, candidates = [], 0
+        for line in text.splitlines():
+            if _CANDIDATE.match(line):
+                candidates += 1
+            match = template.row.match(line)
+            if not match:
+                continue
+            try:
+                tx_date = _row_date(template, match.group("date"), closing)
+            except ValueError:
+                continue
+            amount = _amount(match)
+            rows.append({
+                "date": tx_date,
+                "retailer": clean_retailer(match.group("description")),
+                "amount": amount,
+                "card_name": card_name,
+                "card_last4": card_last4,
+                # Filled in from the card's catalog benefits by services/cashback.py
+                "cashback_earned": 0.0
+            })
+        confidence = len(rows) / candidates if candidates else 1.0
+        if confidence < STATEMENT_PARSER_MIN_CONFIDENCE:
+            result.fallback_pages.append(number)
+        else:
+            result.pages[number] = rows
+    return result
+
+
+def parse_pdf_bytes(pdf_bytes: bytes) -> ParsedStatement | None:
+    """Text layer + parse_pages. Entry point for the process pool."""
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        page_texts = [page.extract_text() or "" for page in reader.pages]
+    except PyPdfError as e:
+        print(f"⚠️ Could not read statement text: {e}")
+        return None
+    return parse_pages(page_texts)
+
+
+# MARK: - Process pool
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=STATEMENT_PARSER_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def parse(pdf) -> ParsedStatement | None:
+    """Parses a statement file in the process pool; None if it needs Gemini as a whole."""
+    if not STATEMENT_PARSER_ENABLED:
+        return None
+    pdf.seek(0, os.SEEK_END)
+    size = pdf.tell()
+    pdf.seek(0)
+    if size > STATEMENT_PARSER_MAX_BYTES:
+        return None
+    pdf_bytes = await asyncio.to_thread(pdf.read)
+    pdf.seek(0)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), parse_pdf_bytes, pdf_bytes)
+    except Exception as e:
+        print(f"⚠️ Local statement parsing failed, using Gemini: {e}")
+        return None
+
+
+def shutdown():
+    """Stops the worker processes (called on app shutdown)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
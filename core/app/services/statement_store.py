@@ -0,0 +1,193 @@
+import hashlib
+from firebase_admin import firestore
+import auth
+from services import bulk_writes, card_resolver, spending_aggregates, doc_cache, wallet_view
+
+# Persistence step of statement ingestion (see services/statement_jobs.py).
+# Blocking Firestore calls throughout, so it runs in a worker thread.
+#
+# One pass per statement:
+#   1. hash every row once (deterministic ID) and read the existing docs in chunked get_all calls
+#   2. classify rows: new / changed (e.g. recomputed cashback) / unchanged
+#   3. write only new and changed rows (services/bulk_writes.py: parallel batches, any size)
+#   4. compute the cashback delta and sign-on bonus progress from the rows that were stored
+#   5. write bonus updates, rewards, one total_cashback increment and the spending rollups
+#      (services/spending_aggregates.py) for the same set of rows
+# Nothing is written before the reads, so re-uploads can't make rows look existing.
+
+# Keys of get_all calls per round trip
+_READ_CHUNK = 300
+
+# Fields that make a stored row out of date when they differ
+_COMPARED_FIELDS = ("retailer", "amount", "card_name", "cashback_earned", "category")
+
+
+def transaction_id(tx: dict) -> str:
+    """Deterministic ID: Hash(date + retailer + amount), so a re-upload maps to the same doc."""
+    unique_str = f"{tx.get('date')}_{tx.get('retailer')}_{tx.get('amount')}"
+    return hashlib.md5(unique_str.encode()).hexdigest()
+
+
+def _existing(db, transactions_ref, tx_ids: list[str]) -> dict:
+    """Stored transaction docs for `tx_ids` (id -> data), read in chunks."""
+    existing = {}
+    for start in range(0, len(tx_ids), _READ_CHUNK):
+        refs = [transactions_ref.document(tx_id) for tx_id in tx_ids[start:start + _READ_CHUNK]]
+        for snap in db.get_all(refs):
+            if snap.exists:
+                existing[snap.id] = snap.to_dict()
+    return existing
+
+
+def _is_changed(tx: dict, stored: dict) -> bool:
+    return any(tx.get(key) != stored.get(key) for key in _COMPARED_FIELDS if key in tx)
+
+
+def _bonus_progress(bonus: dict, card_transactions: list) -> tuple[float, str | None]:
+    """(spend to add, latest transaction date) for a card's sign-on bonus from that card's rows."""
+    # None = track from the beginning; otherwise only transactions after the last update count
+    last_updated = bonus.get('last_updated')
+    relevant_amount = 0.0
+    max_tx_date = last_updated
+    for tx in card_transactions:
+        tx_date = tx.get('date')  # YYYY-MM-DD
+        if last_updated and tx_date <= last_updated:
+            continue
+        relevant_amount += tx.get('amount', 0.0)
+        if not max_tx_date or tx_date > max_tx_date:
+            max_tx_date = tx_date
+    return relevant_amount, max_tx_date
+
+
+def save_statement(uid: str, transactions: list, filename: str) -> dict:
+    """
+    Saves extracted transactions to users/{uid}/transactions and updates the user's
+    cashback total and bonus progress. Returns the upload result for the client.
+    """
+    db = auth.db
+    user_ref = db.collection('users').document(uid)
+    transactions_ref = user_ref.collection('transactions')
+
+    # 1. One ID per row; a row repeated within the statement is stored once
+    rows = {}
+    for tx in transactions:
+        tx['source_file'] = filename
+        rows[transaction_id(tx)] = tx
+    existing = _existing(db, transactions_ref, list(rows))
+
+    # 2. Classify
+    new_rows = {tx_id: tx for tx_id, tx in rows.items() if tx_id not in existing}
+    changed_rows = {tx_id: tx for tx_id, tx in rows.items() if tx_id in existing and _is_changed(tx, existing[tx_id])}
+    print(f"Incremental Stats: {len(new_rows)} new, {len(changed_rows)} changed, "
+          f"{len(rows) - len(new_rows) - len(changed_rows)} unchanged of {len(transactions)} uploaded.")
+
+    # 3. Rows: only the new or out of date ones, in parallel batches
+    row_writes = []
+    for tx_id, tx in {**new_rows, **changed_rows}.items():
+        # Copy so the response doesn't carry the non-serializable sentinels
+        tx_db = tx.copy()
+        tx_db['updated_at'] = firestore.SERVER_TIMESTAMP
+        if tx_id in new_rows:
+            tx_db['created_at'] = firestore.SERVER_TIMESTAMP
+        row_writes.append(bulk_writes.set_doc(transactions_ref.document(tx_id), tx_db, merge=True))
+    written = bulk_writes.commit(db, row_writes)
+
+    # Totals only count rows that were stored; failed ones are new again on the next upload
+    if written.failed:
+        failed_ids = {path.rsplit('/', 1)[-1] for path in written.failed}
+        new_rows = {tx_id: tx for tx_id, tx in new_rows.items() if tx_id not in failed_ids}
+        changed_rows = {tx_id: tx for tx_id, tx in changed_rows.items() if tx_id not in failed_ids}
+    new_transactions = list(new_rows.values())
+
+    # 4. Deltas: full cashback for new rows, the difference for recomputed ones
+    cashback_delta = sum(tx.get('cashback_earned', 0.0) for tx in new_transactions)
+    cashback_delta += sum(tx.get('cashback_earned', 0.0) - (existing[tx_id].get('cashback_earned') or 0.0)
+                          for tx_id, tx in changed_rows.items())
+
+    stat_writes = []
+    rewards = []
+    completed_bonuses = []
+    view_bonuses = {}  # card_id -> new bonus (None = completed), one wallet view write
+    if new_transactions:
+        wallet = auth.get_user_cards(uid)
+        # current_spend is read-modify-written below: read it from the links, not the view
+        links = wallet_view.read_links(uid)
+        # Each extracted card_name resolved once; rows grouped by wallet card in one pass
+        by_card = card_resolver.CardResolver(wallet).group(new_transactions)
+        for card in wallet:
+            card_doc_id = card.get('card_id')  # doc ID in the user's cards subcollection
+            bonus = (links.get(card_doc_id) or {}).get('sign_on_bonus')
+            if not bonus or not card_doc_id:
+                continue
+            relevant_amount, max_tx_date = _bonus_progress(bonus, by_card.get(card_doc_id, []))
+            if relevant_amount <= 0:
+                continue
+
+            print(f"Adding ${relevant_amount} to bonus for {card.get('name')}")
+            card_ref = user_ref.collection('cards').document(card_doc_id)
+            new_spend = bonus.get('current_spend', 0.0) + relevant_amount
+            bonus['current_spend'] = new_spend
+            bonus['last_updated'] = max_tx_date
+
+            if new_spend < bonus.get('target_spend', 0.0):
+                stat_writes.append(bulk_writes.update_doc(card_ref, {"sign_on_bonus": bonus}))
+                view_bonuses[card_doc_id] = bonus
+                continue
+
+            bonus_val = bonus.get('bonus_value', 0.0)
+            print(f"Goal Reached! Adding bonus ${bonus_val}")
+            # Visible 'Reward' transaction, then the bonus is removed from the card
+            reward_id = hashlib.md5(f"REWARD_{card_doc_id}_{max_tx_date}".encode()).hexdigest()
+            reward_tx = {
+                "date": max_tx_date,
+                "retailer": f"Reward: {card.get('name')} Bonus",
+                "amount": 0.0,
+                "cashback_earned": bonus_val,
+                "card_name": card.get('name'),
+                "type": "reward"
+            }
+            rewards.append(reward_tx)
+            stat_writes.append(bulk_writes.set_doc(transactions_ref.document(reward_id),
+                                                   {**reward_tx, "created_at": firestore.SERVER_TIMESTAMP}))
+            stat_writes.append(bulk_writes.update_doc(card_ref, {"sign_on_bonus": firestore.DELETE_FIELD}))
+            view_bonuses[card_doc_id] = None
+            cashback_delta += bonus_val
+            completed_bonuses.append({
+                "card_name": card.get('name'),
+                "earned": bonus_val,
+                "type": bonus.get('bonus_type', 'Status')
+            })
+
+    if view_bonuses:
+        stat_writes += wallet_view.bonus_writes(uid, view_bonuses)
+
+    cashback_delta = round(cashback_delta, 2)
+    if cashback_delta:
+        stat_writes.append(bulk_writes.update_doc(user_ref, {"total_cashback": firestore.Increment(cashback_delta)}))
+        print(f"Added ${cashback_delta} to user total.")
+
+    stat_writes += spending_aggregates.writes(uid, spending_aggregates.merge(
+        spending_aggregates.deltas(new_transactions + rewards),
+        spending_aggregates.deltas(list(changed_rows.values())),
+        spending_aggregates.deltas([existing[tx_id] for tx_id in changed_rows], sign=-1),
+    ))
+
+    # 5. Bonus progress, rewards, the total and the rollups: one batch
+    stats = bulk_writes.commit(db, stat_writes)
+    doc_cache.invalidate(uid, doc_cache.PROFILE, doc_cache.WALLET)
+    failed = {**written.failed, **stats.failed}
+    if new_transactions:
+        try:
+            spending_aggregates.refresh_top_retailers(uid)
+        except Exception as e:
+            print(f"⚠️ Could not refresh top retailers: {e}")
+
+    return {
+        "message": "Statement processed successfully" if new_rows else "Statement processed. No new transactions found.",
+        "count": len(rows),
+        "new_count": len(new_rows),
+        "updated_count": len(changed_rows),
+        "failed_count": len(failed),
+        "data": transactions,
+        "completed_bonuses": completed_bonuses
+    }
@@ -0,0 +1,256 @@
+import os
+import json
+import typing
+from pydantic import BaseModel, ValidationError
+from google.genai import types
+from services import gemini_gateway
+import metrics
+
+# Shared structured-output layer for Gemini JSON responses.
+#
+# 1. The request carries `response_schema` derived from the Pydantic model, so the model
+#    is constrained to the exact shape we validate against.
+# 2. The reply is validated with that same model. Before paying for another (grounded)
+#    call we try cheap LOCAL repairs of the usual defects:
+#       - markdown fences / prose before or after the JSON ("```json ... ``` Hope this helps!")
+#       - list-vs-object mix-ups ([{...}] for {...}, or a bare list for {"transactions": [...]})
+#       - nulls / missing keys where the model declares a default
+#       - individual invalid rows in a list of objects (dropped instead of failing the whole reply)
+# 3. Only if that fails is the call retried (STRUCTURED_OUTPUT_MAX_RETRIES), and every
+#    repair / retry / final failure is counted in /metrics.
+
+STRUCTURED_OUTPUT_MAX_RETRIES = int(os.getenv("STRUCTURED_OUTPUT_MAX_RETRIES", "1"))
+
+
+class StructuredOutputError(ValueError):
+    """The model's reply could not be turned into the requested schema (even after repair)."""
+
+    def __init__(self, message: str, raw_text: str | None = None):
+        super().__init__(message)
+        self.raw_text = raw_text
+
+
+# MARK: - Local repair
+
+def extract_json_text(text: str) -> str:
+    """
+    Returns the first complete JSON value in `text`, dropping code fences and any
+    leading/trailing prose. Falls back to the stripped text if nothing parses.
+    """
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else text[3:]
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+        text = text.strip()
+
+    decoder = json.JSONDecoder()
+    for i, ch in enumerate(text):
+        if ch not in "{[":
+            continue
+        try:
+            _, end = decoder.raw_decode(text, i)
+            return text[i:end]
+        except json.JSONDecodeError:
+            continue
+    return text
+
+
+def _list_item_model(annotation):
+    """For `list[SomeModel]` (optionally `| None`) returns SomeModel, else None."""
+    for candidate in (annotation, *typing.get_args(annotation)):
+        if typing.get_origin(candidate) is list:
+            args = typing.get_args(candidate)
+            if args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+                return args[0]
+    return None
+
+
+def _nested_model(annotation):
+    for candidate in (annotation, *typing.get_args(annotation)):
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+
+def _accepts_none(field) -> bool:
+    return type(None) in typing.get_args(field.annotation) or field.annotation is type(None)
+
+
+def _deep_setdefault(data: dict, defaults: dict):
+    for key, value in defaults.items():
+        if isinstance(value, dict) and isinstance(data.get(key), dict):
+            _deep_setdefault(data[key], value)
+        elif data.get(key) is None:
+            data[key] = value
+
+
+def coerce_to_model(data, model_cls: type[BaseModel], repairs: list[str]):
+    """Best-effort shape fixes so `data` validates against `model_cls`. Records applied repairs."""
+    if isinstance(data, list):
+        list_fields = [name for name, f in model_cls.model_fields.items() if _list_item_model(f.annotation)]
+        looks_like_rows = False
+        if len(list_fields) == 1:
+            item_fields = set(_list_item_model(model_cls.model_fields[list_fields[0]].annotation).model_fields)
+            first = data[0] if data else {}
+            keys = set(first) if isinstance(first, dict) else set()
+            looks_like_rows = not data or len(keys & item_fields) > len(keys & set(model_cls.model_fields))
+        if looks_like_rows:
+            # Bare list of rows for a {"rows": [...]} wrapper
+            data = {list_fields[0]: data}
+            repairs.append("wrap_list")
+        elif data and isinstance(data[0], dict):
+            data = data[0]
+            repairs.append("unwrap_list")
+        else:
+            data = {}
+            repairs.append("empty_list")
+
+    if not isinstance(data, dict):
+        return data
+
+    for name, field in model_cls.model_fields.items():
+        if name not in data:
+            continue
+        value = data[name]
+
+        # null where the field has a non-null default -> use the default
+        if value is None and not _accepts_none(field) and not field.is_required():
+            del data[name]
+            repairs.append("null_default")
+            continue
+
+        item_model = _list_item_model(field.annotation)
+        if item_model and isinstance(value, dict):
+            value = [value]
+            data[name] = value
+            repairs.append("object_to_list")
+        if item_model and isinstance(value, list):
+            kept = []
+            for item in value:
+                if isinstance(item, dict):
+                    item = coerce_to_model(item, item_model, repairs)
+                try:
+                    item_model.model_validate(item)
+                    kept.append(item)
+                except ValidationError:
+                    repairs.append("drop_invalid_item")
+            data[name] = kept
+            continue
+
+        nested = _nested_model(field.annotation)
+        if nested and isinstance(value, (dict, list)):
+            data[name] = coerce_to_model(value, nested, repairs)
+
+    return data
+
+
+def parse_structured(text: str, model_cls: type[BaseModel], defaults: dict | None = None, call_site: str = "unknown"):
+    """
+    Validates model text against `model_cls`, applying local repairs when the strict
+    parse fails. Raises StructuredOutputError if the reply is unusable.
+    """
+    # Fast path: already exactly right
+    try:
+        data = json.loads(text)
+        if defaults and isinstance(data, dict):
+            _deep_setdefault(data, defaults)
+        return model_cls.model_validate(data)
+    except (json.JSONDecodeError, ValidationError, TypeError):
+        pass
+
+    repairs = []
+    cleaned = extract_json_text(text)
+    if cleaned != (text or "").strip():
+        repairs.append("extract_json")
+    try:
+        data = json.loads(cleaned)
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"Unparseable JSON: {e}", raw_text=text)
+
+    data = coerce_to_model(data, model_cls, repairs)
+    if defaults and isinstance(data, dict):
+        _deep_setdefault(data, defaults)
+
+    try:
+        result = model_cls.model_validate(data)
+    except ValidationError as e:
+        raise StructuredOutputError(f"Schema validation failed: {e}", raw_text=text)
+
+    for repair in set(repairs):
+        metrics.GEMINI_STRUCTURED_REPAIRS.labels(call_site, repair).inc()
+    print(f"🩹 Repaired {call_site} output locally: {sorted(set(repairs))}")
+    return result
+
+
+# MARK: - Calls
+
+def structured_config(model_cls: type[BaseModel], config: types.GenerateContentConfig | None = None) -> types.GenerateContentConfig:
+    """Adds JSON mode + a response_schema derived from `model_cls` to `config` (or a fresh config)."""
+    config = config.model_copy() if config else types.GenerateContentConfig()
+    config.response_mime_type = "application/json"
+    config.response_schema = model_cls
+    return config
+
+
+def _from_response(response, model_cls, defaults, call_site):
+    parsed = getattr(response, "parsed", None)
+    if isinstance(parsed, model_cls) and not defaults:
+        return parsed
+    return parse_structured(response.text or "", model_cls, defaults=defaults, call_site=call_site)
+
+
+async def generate_structured(
+    call_site: str,
+    contents,
+    model_cls: type[BaseModel],
+    config: types.GenerateContentConfig | None = None,
+    model: str | None = None,
+    defaults: dict | None = None,
+    max_retries: int | None = None,
+    cache_key: str | None = None,
+    uid: str | None = None
+):
+    """Async Gemini call returning a validated `model_cls` instance."""
+    max_retries = STRUCTURED_OUTPUT_MAX_RETRIES if max_retries is None else max_retries
+    config = structured_config(model_cls, config)
+    last_error = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            metrics.GEMINI_STRUCTURED_RETRIES.labels(call_site).inc()
+            print(f"🔁 Retrying {call_site} after invalid structured output ({attempt}/{max_retries})")
+        response = await gemini_gateway.generate(call_site, contents=contents, config=config, model=model, cache_key=cache_key, uid=uid)
+        try:
+            return _from_response(response, model_cls, defaults, call_site)
+        except StructuredOutputError as e:
+            last_error = e
+    metrics.GEMINI_STRUCTURED_FAILURES.labels(call_site).inc()
+    raise last_error
+
+
+def generate_structured_sync(
+    call_site: str,
+    contents,
+    model_cls: type[BaseModel],
+    config: types.GenerateContentConfig | None = None,
+    model: str | None = None,
+    defaults: dict | None = None,
+    max_retries: int | None = None,
+    cache_key: str | None = None,
+    uid: str | None = None
+):
+    """Blocking variant of generate_structured for scheduler / worker threads."""
+    max_retries = STRUCTURED_OUTPUT_MAX_RETRIES if max_retries is None else max_retries
+    config = structured_config(model_cls, config)
+    last_error = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            metrics.GEMINI_STRUCTURED_RETRIES.labels(call_site).inc()
+            print(f"🔁 Retrying {call_site} after invalid structured output ({attempt}/{max_retries})")
+        response = gemini_gateway.generate_sync(call_site, contents=contents, config=config, model=model, cache_key=cache_key, uid=uid)
+        try:
+            return _from_response(response, model_cls, defaults, call_site)
+        except StructuredOutputError as e:
+            last_error = e
+    metrics.GEMINI_STRUCTURED_FAILURES.labels(call_site).inc()
+    raise last_error
@@ -0,0 +1,116 @@
+import os
+import re
+import json
+import base64
+import binascii
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from google.cloud.firestore_v1.field_path import FieldPath
+from firebase_admin import firestore
+import auth
+
+# Paged reads of users/{uid}/transactions for GET /transactions.
+#
+# Order is (date DESC, document ID DESC) so every row has a stable position; a page's
+# cursor is that position for its last row, encoded as an opaque URL-safe token. Each
+# page is one query with start_after + limit, so its cost doesn't depend on how much
+# history comes before it. Filters:
+#   start_date / end_date (YYYY-MM-DD, inclusive) - range on the ordered field, no extra index
+#   card_name (exact)                              - composite index (core/firestore.indexes.json)
+# `fields` projects list views down to the fields they show (the ID is always included).
+
+TRANSACTIONS_PAGE_MAX = int(os.getenv("TRANSACTIONS_PAGE_MAX", "500"))
+
+PROJECTABLE_FIELDS = {
+    "date", "retailer", "amount", "card_name", "cashback_earned", "category", "type", "source_file"
+}
+
+
+def encode_cursor(date: str, doc_id: str) -> str:
+    raw = json.dumps({"d": date, "id": doc_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json.loads(raw)
+        if not isinstance(data["d"], str) or not isinstance(data["id"], str) or not data["id"]:
+            raise ValueError("cursor fields")
+        return {"date": data["d"], "id": data["id"]}
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def _check_date(name: str, value: str | None):
+    if value and not _DATE.match(value):
+        raise HTTPException(status_code=400, detail=f"{name} must be YYYY-MM-DD")
+
+
+def parse_fields(fields: str | None) -> list[str] | None:
+    """Comma separated projection -> field list (always with `date`, needed for the cursor)."""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(names) - PROJECTABLE_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return sorted(set(names) | {"date"})
+
+
+def build_query(uid: str, start_date: str | None = None, end_date: str | None = None,
+                card_name: str | None = None, fields: list[str] | None = None):
+    _check_date("start_date", start_date)
+    _check_date("end_date", end_date)
+    query = auth.db.collection('users').document(uid).collection('transactions')
+    if card_name:
+        query = query.where('card_name', '==', card_name)
+    if start_date:
+        query = query.where('date', '>=', start_date)
+    if end_date:
+        query = query.where('date', '<=', end_date)
+    query = query.order_by('date', direction=firestore.Query.DESCENDING)
+    query = query.order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+    if fields:
+        query = query.select(fields)
+    return query
+
+
+def _row(doc) -> dict:
+    data = doc.to_dict()
+    data['id'] = doc.id
+    return data
+
+
+def fetch_page(query, limit: int, cursor: str | None = None) -> tuple[list[dict], str | None]:
+    """(rows, next cursor or None) for one page. Blocking."""
+    limit = max(1, min(limit, TRANSACTIONS_PAGE_MAX))
+    if cursor:
+        position = decode_cursor(cursor)
+        query = query.start_after({"date": position["date"], "__name__": position["id"]})
+    # One extra row tells whether there is a next page
+    rows = [_row(doc) for doc in query.limit(limit + 1).stream()]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].get('date'), rows[-1]['id'])
+
+
+def stream_all(query):
+    """
+    Every matching row as a JSON array, produced chunk by chunk while paging through the
+    query, so the whole history is never held in memory. Blocking generator.
+    """
+    yield "["
+    cursor, first = None, True
+    while True:
+        rows, cursor = fetch_page(query, TRANSACTIONS_PAGE_MAX, cursor)
+        for row in rows:
+            yield ("" if first else ",") + json.dumps(jsonable_encoder(row))
+            first = False
+        if cursor is None:
+            break
+    yield "]"
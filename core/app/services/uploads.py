@@ -0,0 +1,109 @@
+import os
+import json
+import shutil
+import tempfile
+from fastapi import HTTPException
+
+# Size limits for uploaded documents.
+#
+# Uploads are never read into memory whole: Starlette spools multipart files to a
+# SpooledTemporaryFile (in memory up to 1 MB, then on disk) and handlers pass that file
+# object on. Statement PDFs over GEMINI_INLINE_MAX_BYTES then go to Gemini through the
+# Files API instead of inline bytes (gemini_gateway.document_part).
+#
+# UploadSizeLimitMiddleware rejects a request whose Content-Length is already over the
+# limit before the body is read. For chunked uploads (no Content-Length) it counts the
+# body as it arrives and answers 413 as soon as the count passes the limit, so an
+# oversized body is never spooled whole (/tmp is memory-backed on Cloud Run).
+
+STATEMENT_MAX_UPLOAD_BYTES = int(os.getenv("STATEMENT_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+# Spool size for files we write ourselves (e.g. statement page chunks)
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+
+# Multipart framing on top of the file itself
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLargeError(HTTPException):
+    """The uploaded document is over the size limit."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(status_code=413, detail=f"File is too large. The limit is {max_bytes // (1024 * 1024)} MB.")
+
+
+def ensure_upload_size(file, max_bytes: int = STATEMENT_MAX_UPLOAD_BYTES):
+    """Raises UploadTooLargeError (413) if a spooled UploadFile is over max_bytes."""
+    size = file.size
+    if size is None:
+        file.file.seek(0, os.SEEK_END)
+        size = file.file.tell()
+        file.file.seek(0)
+    if size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+
+
+def spool_copy(fileobj):
+    """Copies a file into a new SpooledTemporaryFile (blocking; run in a thread)."""
+    fileobj.seek(0)
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    shutil.copyfileobj(fileobj, spool, 64 * 1024)
+    spool.seek(0)
+    return spool
+
+
+class UploadSizeLimitMiddleware:
+    """Answers 413 for oversized uploads to the given path prefixes without reading the body."""
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] in ("POST", "PUT"):
+            max_bytes = next((limit for prefix, limit in self.limits.items() if scope["path"].startswith(prefix)), None)
+            if max_bytes is not None:
+                length = dict(scope["headers"]).get(b"content-length")
+                if length and length.isdigit() and int(length) > max_bytes + _MULTIPART_OVERHEAD_BYTES:
+                    await self._reject(send, max_bytes)
+                    return
+                await self._limited(scope, receive, send, max_bytes)
+                return
+        await self.app(scope, receive, send)
+
+    async def _limited(self, scope, receive, send, max_bytes):
+        """Runs the app on a receive() that stops at the limit: 413, then a disconnect for the app."""
+        state = {"received": 0, "started": False, "rejected": False}
+
+        async def limited_receive():
+            if state["rejected"]:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > max_bytes + _MULTIPART_OVERHEAD_BYTES and not state["started"]:
+                    state["rejected"] = True
+                    await self._reject(send, max_bytes)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if state["rejected"]:
+                return
+            state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            # The app sees a client disconnect (e.g. ClientDisconnect from the form parser)
+            if not state["rejected"]:
+                raise
+
+    async def _reject(self, send, max_bytes):
+        body = json.dumps({"detail": UploadTooLargeError(max_bytes).detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,215 @@
+import os
+import asyncio
+import threading
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from firebase_admin import firestore
+import metrics
+
+# Per-user, per-day Gemini token accounting and budgets.
+#
+# Every gateway call made on behalf of a user (uid=...) adds its usage_metadata counts
+# (prompt / output / thoughts / cached / grounding) to users/{uid}/usage/{YYYY-MM-DD}:
+#
+#   { "calls": 12, "total_tokens": 48210, "prompt": ..., "output": ...,
+#     "by_call_site": { "recommend": { "calls": 9, "prompt": ..., ... }, ... } }
+#
+# Counts are accumulated in memory and written with Firestore Increments by the
+# `flush_usage` job (and on shutdown), so a model call never waits on an extra write.
+# Budget checks read the in-memory total: the flushed total from Firestore (which includes
+# every instance's flushed calls) plus this instance's unflushed ones. After each flush the
+# totals of users who made calls here are re-read, and those of users who didn't are
+# dropped and re-read on their next check, so what other instances spent is picked up
+# within about one flush interval on each of them.
+#
+#   soft budget -> the call runs on GEMINI_BUDGET_MODEL without Google Search (tiered call
+#                  sites don't escalate), and call sites with a cached answer (e.g. claim
+#                  help) return that instead
+#   hard budget -> BudgetExceededError (HTTP 429)
+#
+# A budget of 0 disables that limit.
+
+GEMINI_DAILY_SOFT_TOKEN_BUDGET = int(os.getenv("GEMINI_DAILY_SOFT_TOKEN_BUDGET", "200000"))
+GEMINI_DAILY_HARD_TOKEN_BUDGET = int(os.getenv("GEMINI_DAILY_HARD_TOKEN_BUDGET", "500000"))
+GEMINI_BUDGET_MODEL = os.getenv("GEMINI_BUDGET_MODEL", "gemini-2.5-flash-lite")
+USAGE_FLUSH_SECONDS = int(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+
+BUDGET_OK = "ok"
+BUDGET_SOFT = "soft"
+BUDGET_HARD = "hard"
+
+# Firestore batches are capped at 500 writes
+_FLUSH_BATCH_SIZE = 400
+
+_lock = threading.Lock()
+_totals = {}   # (uid, day) -> billable tokens used today, flushed + pending
+_pending = {}  # (uid, day) -> counts not yet written to Firestore
+# (uid, day) -> token of the read that loaded (or is loading) the flushed total into _totals
+_seeded = {}
+
+
+class BudgetExceededError(HTTPException):
+    """The user used up today's hard token budget."""
+
+    def __init__(self):
+        super().__init__(status_code=429, detail="Daily AI usage limit reached. Please try again tomorrow.")
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _db():
+    # Imported lazily: the gateway (and so this module) is imported by code and tests
+    # that never touch Firebase.
+    import auth
+    return auth.db
+
+
+def _usage_ref(uid: str, day: str):
+    return _db().collection('users').document(uid).collection('usage').document(day)
+
+
+def billable_tokens(counts: dict) -> int:
+    """Tokens counted against the budget. Cached prefix tokens are billed at a fraction, so they are left out."""
+    return (
+        counts.get("prompt", 0) - counts.get("cached", 0)
+        + counts.get("output", 0) + counts.get("thoughts", 0) + counts.get("grounding", 0)
+    )
+
+
+# MARK: - Budgets
+
+def _seed(uid: str, day: str):
+    """Adds the flushed total to _totals, once until flush() drops or re-reads it (blocking Firestore read)."""
+    key = (uid, day)
+    with _lock:
+        # Concurrent first calls: only one of them adds the flushed total
+        if key in _seeded:
+            return
+        token = _seeded[key] = object()
+    total = 0
+    try:
+        doc = _usage_ref(uid, day).get()
+        if doc.exists:
+            total = (doc.to_dict() or {}).get("total_tokens", 0)
+    except Exception as e:
+        print(f"⚠️ Could not load usage for {uid}: {e}")
+    with _lock:
+        # Dropped or re-read by flush() meanwhile: that value wins
+        if _seeded.get(key) is not token:
+            return
+        # Calls recorded while we were reading are already in _totals; add, don't overwrite
+        _totals[key] = _totals.get(key, 0) + total
+
+
+def _status(total: int) -> str:
+    if GEMINI_DAILY_HARD_TOKEN_BUDGET and total >= GEMINI_DAILY_HARD_TOKEN_BUDGET:
+        return BUDGET_HARD
+    if GEMINI_DAILY_SOFT_TOKEN_BUDGET and total >= GEMINI_DAILY_SOFT_TOKEN_BUDGET:
+        return BUDGET_SOFT
+    return BUDGET_OK
+
+
+def budget_status(uid: str) -> str:
+    """'ok', 'soft' or 'hard' for today. May block on a Firestore read when the total isn't loaded."""
+    key = (uid, _today())
+    if key not in _seeded:
+        _seed(*key)
+    return _status(_totals.get(key, 0))
+
+
+async def abudget_status(uid: str) -> str:
+    """budget_status() for the event loop; the one-off Firestore read runs in a thread."""
+    key = (uid, _today())
+    if key not in _seeded:
+        await asyncio.to_thread(_seed, *key)
+    return _status(_totals.get(key, 0))
+
+
+def ensure_within_budget(uid: str):
+    """Raises BudgetExceededError (429) if the user is past the hard budget."""
+    if budget_status(uid) == BUDGET_HARD:
+        raise BudgetExceededError()
+
+
+# MARK: - Recording
+
+def record(uid: str, call_site: str, response):
+    """Adds a response's usage_metadata to the user's counters for today."""
+    counts = metrics.usage_counts(response)
+    tokens = billable_tokens(counts)
+    key = (uid, _today())
+    with _lock:
+        _totals[key] = _totals.get(key, 0) + tokens
+        pending = _pending.setdefault(key, {"calls": 0, "total_tokens": 0, "by_call_site": {}})
+        site = pending["by_call_site"].setdefault(call_site, {"calls": 0})
+        pending["calls"] += 1
+        pending["total_tokens"] += tokens
+        site["calls"] += 1
+        for kind, value in counts.items():
+            pending[kind] = pending.get(kind, 0) + value
+            site[kind] = site.get(kind, 0) + value
+
+
+def _increments(counts: dict) -> dict:
+    return {
+        name: _increments(value) if isinstance(value, dict) else firestore.Increment(value)
+        for name, value in counts.items()
+    }
+
+
+def flush():
+    """Writes pending counters to Firestore (one Increment merge per user/day)."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+        # No calls here since the last flush (or from a previous day): forget the total, the
+        # next check re-reads it with whatever other instances flushed meanwhile
+        for key in (set(_totals) | set(_seeded)) - set(pending):
+            _totals.pop(key, None)
+            _seeded.pop(key, None)
+    if not pending:
+        return 0
+
+    items = list(pending.items())
+    for start in range(0, len(items), _FLUSH_BATCH_SIZE):
+        chunk = items[start:start + _FLUSH_BATCH_SIZE]
+        batch = _db().batch()
+        for (uid, day), counts in chunk:
+            data = _increments(counts)
+            data["updated_at"] = firestore.SERVER_TIMESTAMP
+            batch.set(_usage_ref(uid, day), data, merge=True)
+        try:
+            batch.commit()
+        except Exception as e:
+            print(f"❌ Usage flush failed, will retry: {e}")
+            with _lock:
+                for key, counts in chunk:
+                    _merge(_pending.setdefault(key, {}), counts)
+            continue
+        _refresh([key for key, _ in chunk])
+    return len(items)
+
+
+def _refresh(keys: list):
+    """Re-reads flushed totals (all instances' calls) after a flush; adds what is still pending here."""
+    try:
+        docs = _db().get_all([_usage_ref(uid, day) for uid, day in keys])
+        flushed = {(doc.reference.parent.parent.id, doc.id): (doc.to_dict() or {}).get("total_tokens", 0)
+                   for doc in docs if doc.exists}
+    except Exception as e:
+        print(f"⚠️ Could not re-read usage totals: {e}")
+        return
+    with _lock:
+        for key, total in flushed.items():
+            _totals[key] = total + _pending.get(key, {}).get("total_tokens", 0)
+            _seeded[key] = object()
+
+
+def _merge(target: dict, counts: dict):
+    for name, value in counts.items():
+        if isinstance(value, dict):
+            _merge(target.setdefault(name, {}), value)
+        else:
+            target[name] = target.get(name, 0) + value
@@ -0,0 +1,192 @@
+from google.api_core import exceptions as gexc
+from google.cloud.firestore_v1.field_path import FieldPath
+from firebase_admin import firestore
+import auth
+from services import bulk_writes, doc_cache
+
+# Denormalized wallet, so reading a wallet is one document read instead of streaming the
+# links and get_all-ing the global cards on every /me/cards, upload and agent cycle.
+#
+#   users/{uid}/aggregates/wallet
+#     { "cards": {card_id: {...global card details, "card_id", "sign_on_bonus"?, "last4"?}},
+#       "card_ids": [...],      # every linked card (also orphans), for the global-card fan-out
+#       "complete": True,       # set by rebuild(); a doc without it is rebuilt on read
+#       "updated_at": ... }
+#
+# The links in users/{uid}/cards stay the source of truth. Every link write goes into the
+# same batch as the matching view write (add_writes / remove_writes / bonus_writes); a changed
+# global card is copied into every wallet holding it by refresh_card(). Each card entry is
+# replaced as a whole (merge on the `cards.<id>` path), so no stale fields are left behind.
+# check_all() (scheduled in jobs.py) compares every view with its links and repairs drift.
+# Full rewrites are conditional on the view not having changed since it was read (it is
+# read before the links), so they never undo a card added or removed meanwhile.
+# Read-modify-writes of link fields (bonus progress) read the links, never the view.
+
+_LINK_FIELDS = ("sign_on_bonus", "last4")
+
+
+def ref(uid: str):
+    return auth.db.collection('users').document(uid).collection('aggregates').document('wallet')
+
+
+def _entry(card_id: str, global_card: dict, link: dict) -> dict:
+    entry = dict(global_card)
+    entry['card_id'] = card_id
+    for name in _LINK_FIELDS:
+        if link.get(name):
+            entry[name] = link[name]
+    return entry
+
+
+def build(links: dict, global_cards: dict) -> dict:
+    """View body for {card_id: link data} and {card_id: global card}. Links without a global card are skipped."""
+    cards = {}
+    for card_id, link in links.items():
+        if card_id not in global_cards:
+            print(f"Warning: orphaned card {card_id}")
+            continue
+        cards[card_id] = _entry(card_id, global_cards[card_id], link)
+    return {"cards": cards, "card_ids": sorted(links), "complete": True}
+
+
+def card_list(view: dict) -> list[dict]:
+    """The wallet as get_user_cards returns it (ordered by card ID)."""
+    cards = view.get('cards') or {}
+    return [cards[card_id] for card_id in sorted(cards)]
+
+
+def read_links(uid: str) -> dict:
+    """{card_id: link data} from users/{uid}/cards, the source of truth. Blocking."""
+    user_ref = auth.db.collection('users').document(uid)
+    return {doc.id: doc.to_dict() for doc in user_ref.collection('cards').stream()}
+
+
+def _replace(uid: str, view: dict, snap) -> bool:
+    """Writes the full view unless it changed after `snap` was read. Blocking."""
+    data = {**view, "updated_at": firestore.SERVER_TIMESTAMP}
+    try:
+        if snap.exists:
+            ref(uid).update(data, option=auth.db.write_option(last_update_time=snap.update_time))
+        else:
+            ref(uid).create(data)
+        return True
+    except (gexc.FailedPrecondition, gexc.Conflict) as e:
+        print(f"⚠️ Wallet view for {uid} changed while rebuilding, keeping it: {e}")
+        return False
+
+
+def rebuild(uid: str, snap=None) -> dict:
+    """Recomputes the view from the links and the global cards. Blocking."""
+    snap = snap or ref(uid).get()
+    links = read_links(uid)
+    global_cards = {}
+    if links:
+        refs = [auth.db.collection('cards').document(card_id) for card_id in links]
+        global_cards = {doc.id: doc.to_dict() for doc in auth.db.get_all(refs) if doc.exists}
+    view = build(links, global_cards)
+    _replace(uid, view, snap)
+    return view
+
+
+def read(uid: str) -> list[dict]:
+    """The user's wallet: one document read (rebuilt first if missing or partial). Blocking."""
+    snap = ref(uid).get()
+    view = snap.to_dict() if snap.exists else None
+    if not view or not view.get('complete'):
+        print(f"🔧 Building wallet view for {uid}")
+        view = rebuild(uid, snap)
+    return card_list(view)
+
+
+# MARK: - Maintenance
+
+def add_writes(uid: str, card_id: str, link: dict) -> list[bulk_writes.Write]:
+    """View write for a newly linked card (reads the global card). Commit with the link write."""
+    snap = auth.db.collection('cards').document(card_id).get()
+    data = {"card_ids": firestore.ArrayUnion([card_id]), "updated_at": firestore.SERVER_TIMESTAMP}
+    merge = [FieldPath("card_ids"), FieldPath("updated_at")]
+    if snap.exists:
+        data["cards"] = {card_id: _entry(card_id, snap.to_dict(), link)}
+        merge.append(FieldPath("cards", card_id))
+    return [bulk_writes.set_doc(ref(uid), data, merge=merge)]
+
+
+def remove_writes(uid: str, card_id: str) -> list[bulk_writes.Write]:
+    return [bulk_writes.set_doc(ref(uid), {
+        "cards": {card_id: firestore.DELETE_FIELD},
+        "card_ids": firestore.ArrayRemove([card_id]),
+        "updated_at": firestore.SERVER_TIMESTAMP,
+    }, merge=True)]
+
+
+def bonus_writes(uid: str, bonuses: dict) -> list[bulk_writes.Write]:
+    """
+    View write mirroring links' sign_on_bonus, {card_id: bonus or None (removed)}. Reads the
+    view: cards it has no entry for (orphaned, or not added yet) are left to rebuild / check_all,
+    since merging only the bonus path would leave a partial entry behind.
+    """
+    snap = ref(uid).get()
+    present = ((snap.to_dict() if snap.exists else None) or {}).get('cards') or {}
+    bonuses = {card_id: bonus for card_id, bonus in bonuses.items() if card_id in present}
+    if not bonuses:
+        return []
+    return [bulk_writes.set_doc(ref(uid), {
+        "cards": {card_id: {"sign_on_bonus": bonus if bonus else firestore.DELETE_FIELD}
+                  for card_id, bonus in bonuses.items()}
+    }, merge=[FieldPath("cards", card_id, "sign_on_bonus") for card_id in bonuses])]
+
+
+def refresh_card(card_id: str) -> int:
+    """Copies global card `card_id` into every wallet view that links it. Blocking; returns views written."""
+    snap = auth.db.collection('cards').document(card_id).get()
+    if not snap.exists:
+        return 0
+    global_card = snap.to_dict()
+
+    writes, uids = [], []
+    views = auth.db.collection_group('aggregates').where('card_ids', 'array_contains', card_id).stream()
+    for view in views:
+        if view.id != 'wallet':
+            continue
+        uid = view.reference.parent.parent.id
+        current = (view.to_dict().get('cards') or {}).get(card_id)
+        if current is None:
+            # Was orphaned until now: link fields aren't in the view, rebuild it from the links
+            writes.append(bulk_writes.update_doc(view.reference, {"complete": False}))
+        else:
+            writes.append(bulk_writes.set_doc(view.reference, {
+                "cards": {card_id: _entry(card_id, global_card, current)},
+                "updated_at": firestore.SERVER_TIMESTAMP,
+            }, merge=[FieldPath("cards", card_id), FieldPath("updated_at")]))
+        uids.append(uid)
+
+    result = bulk_writes.commit(auth.db, writes)
+    for uid in uids:
+        doc_cache.invalidate(uid, doc_cache.WALLET)
+    if result.failed:
+        print(f"⚠️ {len(result.failed)} wallet views not refreshed for {card_id}; check_all() will repair them")
+    return result.written
+
+
+def check_all() -> dict:
+    """
+    Compares every user's wallet view with their links and the global cards and rewrites
+    the ones that drifted. Blocking; global cards are read once for the whole run.
+    """
+    global_cards = {doc.id: doc.to_dict() for doc in auth.db.collection('cards').stream()}
+    counts = {"checked": 0, "repaired": 0}
+    for user in auth.db.collection('users').select([]).stream():
+        snap = ref(user.id).get()
+        links = read_links(user.id)
+        counts["checked"] += 1
+        if not links and not snap.exists:
+            continue
+        expected = build(links, global_cards)
+        current = snap.to_dict() if snap.exists else {}
+        if all(current.get(name) == value for name, value in expected.items()):
+            continue
+        print(f"🔧 Repairing wallet view for {user.id}")
+        if _replace(user.id, expected, snap):
+            doc_cache.invalidate(user.id, doc_cache.WALLET)
+            counts["repaired"] += 1
+    return counts
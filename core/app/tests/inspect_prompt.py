@@ -12,6 +12,10 @@ mock_auth_module.auth = MagicMock()
 sys.modules['auth'] = mock_auth_module
 
 from services.marathon_agent import MarathonAgent
+from services import context_cache
+
+# Send the static prefix inline so it shows up in the intercepted request
+context_cache.default_cache = context_cache.ContextCache(None)
 
 # Patch os.getenv to return a dummy key so Agent initializes
 with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy_key"}):
@@ -56,7 +60,9 @@ with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy_key"}):
         call_args = mock_generate.call_args
         if call_args:
             kwargs = call_args[1]
-            contents = kwargs.get('contents')
+            # Static rules travel as the system instruction, the rest as contents
+            config = kwargs.get('config')
+            contents = (config.system_instruction if config else "") + kwargs.get('contents')
             print("\n----- GENERATED PROMPT SNIPPET -----\n")
             if "PROPORTIONALITY & SANITY CHECK" in contents:
                 print("✅ Found 'PROPORTIONALITY & SANITY CHECK' section!")
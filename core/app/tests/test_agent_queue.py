@@ -0,0 +1,57 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# agent_queue imports 'auth' (Firebase init). Swap in a mock only while importing
+# so other test modules that install their own 'auth' mock are not affected.
+with patch.dict(sys.modules, {'auth': MagicMock()}):
+    import services.agent_queue as agent_queue
+
+NOW = datetime(2026, 1, 15, 12, 0, 0, tzinfo=timezone.utc)
+
+def test_compute_run_after_debounces():
+    print("Testing compute_run_after...")
+
+    # 1. First trigger of a burst -> now + debounce
+    run_after = agent_queue.compute_run_after(NOW, NOW, debounce_seconds=30, max_delay_seconds=120)
+    assert run_after == NOW + timedelta(seconds=30)
+    print("✅ First trigger debounced")
+
+    # 2. Later trigger in the same burst pushes the run back
+    later = NOW + timedelta(seconds=20)
+    run_after = agent_queue.compute_run_after(later, NOW, debounce_seconds=30, max_delay_seconds=120)
+    assert run_after == later + timedelta(seconds=30)
+    print("✅ Burst coalesced")
+
+    # 3. Never pushed past first_requested_at + max_delay
+    much_later = NOW + timedelta(seconds=110)
+    run_after = agent_queue.compute_run_after(much_later, NOW, debounce_seconds=30, max_delay_seconds=120)
+    assert run_after == NOW + timedelta(seconds=120)
+    print("✅ Max delay caps the debounce")
+
+    # 4. Zero debounce runs immediately
+    assert agent_queue.compute_run_after(NOW, NOW, debounce_seconds=0, max_delay_seconds=120) == NOW
+    print("✅ Zero debounce")
+
+def test_is_claimable():
+    print("\nTesting is_claimable...")
+
+    assert agent_queue.is_claimable({"status": "pending", "run_after": NOW - timedelta(seconds=1)}, NOW)
+    assert not agent_queue.is_claimable({"status": "pending", "run_after": NOW + timedelta(seconds=1)}, NOW)
+    print("✅ Pending entries claimable only once due")
+
+    # A live lease blocks other workers; an expired one (crashed instance) does not
+    assert not agent_queue.is_claimable({"status": "running", "lease_expires_at": NOW + timedelta(seconds=60)}, NOW)
+    assert agent_queue.is_claimable({"status": "running", "lease_expires_at": NOW - timedelta(seconds=1)}, NOW)
+    print("✅ Expired leases are reclaimed after a restart")
+
+    assert not agent_queue.is_claimable({}, NOW)
+    print("✅ Unknown status ignored")
+
+if __name__ == "__main__":
+    test_compute_run_after_debounces()
+    test_is_claimable()
+    print("\n🎉 All Agent Queue Tests Passed!")
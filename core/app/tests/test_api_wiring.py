@@ -28,13 +28,10 @@ app.dependency_overrides[main_get_user] = mock_get_current_user
 def test_start_agent():
     print("Testing POST /agent/start...")
     
-    with patch("routers.agent.MarathonAgent") as MockAgent, \
+    with patch("routers.agent.agent_queue") as mock_queue, \
+         patch("routers.agent.usage.budget_status", return_value="ok"), \
          patch("routers.agent.auth.db") as mock_db: # Mock DB to avoid Firestore calls
         
-        # Setup Mock Agent
-        mock_instance = MockAgent.return_value
-        mock_instance.run_agent_cycle = MagicMock()
-        
         # Setup Mock DB
         mock_user_ref = MagicMock()
         mock_public_ref = MagicMock()
@@ -47,19 +44,10 @@ def test_start_agent():
         assert response.json()["status"] == "started"
         print("✅ /agent/start success")
         
-        # Verify Background Task was added (TestClient runs bg tasks synchronously unless configured otherwise? 
-        # TestClient actually executes background tasks).
-        # But we patched MarathonAgent class.
-        # Wait, inside `start_agent`:
-        # agent = MarathonAgent()
-        # background_tasks.add_task(agent.run_agent_cycle, uid)
-        
-        # Verify instantiation
-        MockAgent.assert_called_once()
-        # Verify run_agent_cycle calls
-        # Since TestClient executes bg tasks, it should have been called.
-        mock_instance.run_agent_cycle.assert_called_with("test_user_123")
-        print("✅ Background task triggered")
+        # The run is no longer a BackgroundTask: it is written to the durable
+        # agent run queue and drained by the scheduler.
+        mock_queue.enqueue_agent_run.assert_called_once_with("test_user_123", reason="start", debounce_seconds=0)
+        print("✅ Agent run queued")
 
 def test_trigger_agent_debug():
     print("\nTesting POST /actions/trigger-agent...")
@@ -0,0 +1,99 @@
+import sys
+import os
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from google.api_core import exceptions as gexc
+from firebase_admin import firestore
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import bulk_writes
+
+class FakeDB:
+    """Batches that record their size; `fail` decides per commit (list of paths) what raises."""
+    def __init__(self, fail=lambda paths: None):
+        self.fail = fail
+        self.commits = []
+        self.lock = threading.Lock()
+
+    def batch(self):
+        writes = []
+        batch = MagicMock()
+        batch.set.side_effect = lambda ref, data, merge=False: writes.append(ref.path)
+        batch.update.side_effect = lambda ref, data: writes.append(ref.path)
+
+        def commit():
+            error = self.fail(list(writes))
+            with self.lock:
+                self.commits.append((len(writes), error is None))
+            if error:
+                raise error
+        batch.commit.side_effect = commit
+        return batch
+
+def _writes(count):
+    return [bulk_writes.set_doc(SimpleNamespace(path=f"users/u1/transactions/tx{i}"), {"amount": i}) for i in range(count)]
+
+def test_chunks():
+    print("Testing chunked writes...")
+    db = FakeDB()
+    result = bulk_writes.commit(db, _writes(2000))
+    assert result.ok and result.written == 2000 and result.chunks == 5
+    assert sorted(size for size, _ in db.commits) == [400] * 5
+    print("✅ 2,000 writes in 5 batches under the 500 limit")
+
+    assert bulk_writes.commit(db, [], chunk_size=10).chunks == 0
+    assert bulk_writes.commit(FakeDB(), _writes(10), chunk_size=1000).chunks == 1
+    print("✅ Chunk size capped at 500")
+
+def test_retries_and_failures():
+    print("\nTesting contention and failures...")
+    attempts = []
+
+    def contended(paths):
+        attempts.append(1)
+        return gexc.Aborted("contention") if len(attempts) < 3 else None
+
+    with patch.object(bulk_writes.time, "sleep"):
+        result = bulk_writes.commit(FakeDB(contended), _writes(10))
+    assert result.ok and len(attempts) == 3
+    print("✅ Aborted batches retried with backoff")
+
+    bad = "users/u1/transactions/tx3"
+    db = FakeDB(lambda paths: gexc.InvalidArgument("bad value") if bad in paths else None)
+    result = bulk_writes.commit(db, _writes(10))
+    assert result.written == 9 and list(result.failed) == [bad]
+    print("✅ Failed batch replayed per document; only the bad one reported")
+
+def test_increments_not_applied_twice():
+    print("\nTesting non-idempotent batches...")
+    writes = _writes(3) + [bulk_writes.update_doc(SimpleNamespace(path="users/u1"),
+                                                  {"total_cashback": firestore.Increment(4.5)})]
+
+    db = FakeDB(lambda paths: gexc.DeadlineExceeded("timeout"))
+    with patch.object(bulk_writes.time, "sleep"):
+        result = bulk_writes.commit(db, writes)
+    assert len(db.commits) == 1
+    assert result.written == 0 and len(result.failed) == 4
+    print("✅ Ambiguous failure: no retry, no per-document replay, all reported failed")
+
+    attempts = []
+    def contended(paths):
+        attempts.append(1)
+        return gexc.Aborted("contention") if len(attempts) < 2 else None
+    with patch.object(bulk_writes.time, "sleep"):
+        assert bulk_writes.commit(FakeDB(contended), writes).ok
+    assert len(attempts) == 2
+    print("✅ Aborted (never applied) is still retried")
+
+    with patch.object(bulk_writes.time, "sleep"):
+        result = bulk_writes.commit(FakeDB(lambda paths: gexc.DeadlineExceeded("t") if len(paths) > 1 else None), _writes(3))
+    assert result.ok
+    print("✅ Idempotent batches keep retrying and replaying")
+
+if __name__ == "__main__":
+    test_chunks()
+    test_retries_and_failures()
+    test_increments_not_applied_twice()
+    print("\n🎉 All Bulk Write Tests Passed!")
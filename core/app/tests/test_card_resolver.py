@@ -0,0 +1,49 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.card_resolver import CardResolver
+
+WALLET = [
+    {"card_id": "csr", "name": "Chase Sapphire Reserve"},
+    {"card_id": "cfu", "name": "Chase Freedom Unlimited", "last4": "4321"},
+    {"card_id": "gold", "name": "American Express Gold Card"},
+    {"card_id": "bcp", "name": "Blue Cash Preferred Card from American Express", "aliases": ["Amex BCP"]},
+]
+
+def _id(card):
+    return card["card_id"] if card else None
+
+def test_resolve():
+    print("Testing card resolution...")
+    resolver = CardResolver(WALLET)
+    assert _id(resolver.resolve("Chase Sapphire Reserve")) == "csr"
+    assert _id(resolver.resolve("Amex Gold")) == "gold"
+    assert _id(resolver.resolve("Blue Cash Preferred®")) == "bcp"
+    assert _id(resolver.resolve("CSR")) == "csr"
+    print("✅ Issuer spellings, filler words and aliases")
+
+    assert _id(resolver.resolve("Chase Sapphire")) == "csr"
+    assert resolver.resolve("Chase Sapphire Preferred") is None
+    assert resolver.resolve("Citi Gold") is None
+    assert resolver.resolve("Chase Credit Card") is None
+    print("✅ Near-identical products and other issuers don't match; ambiguous -> None")
+
+    assert _id(resolver.resolve("Credit Card", "4321")) == "cfu"
+    print("✅ Last-4 wins when the statement has it")
+
+def test_group():
+    print("\nTesting grouping...")
+    resolver = CardResolver(WALLET)
+    rows = [{"card_name": "Amex Gold", "amount": 10.0}, {"card_name": "Chase Sapphire Preferred", "amount": 5.0},
+            {"card_name": "American Express Gold Card", "amount": 7.0}, {"card_name": "Amex Gold", "amount": 3.0}]
+    groups = resolver.group(rows)
+    assert list(groups) == ["gold"] and [tx["amount"] for tx in groups["gold"]] == [10.0, 7.0, 3.0]
+    assert len(resolver._resolved) == 3
+    print("✅ Rows grouped by card; each card_name resolved once")
+
+if __name__ == "__main__":
+    test_resolve()
+    test_group()
+    print("\n🎉 All Card Resolver Tests Passed!")
@@ -0,0 +1,73 @@
+import sys
+import os
+from unittest.mock import MagicMock, patch
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# cashback imports auth (Firebase); tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import cashback
+
+GOLD_BENEFITS = [
+    {"title": "4x Points at Restaurants & U.S. Supermarkets"},
+    {"title": "3x Points on Flights booked directly with airlines"},
+    {"title": "1x on all other purchases"},
+    {"title": "$120 Uber Cash"},
+]
+
+def _rate(rates, category):
+    return rates[cashback.CATEGORIES.index(category)]
+
+def test_categorize():
+    print("Testing merchant categories...")
+    assert cashback.categorize("Starbucks Store") == "Dining"
+    assert cashback.categorize("Uber Eats") == "Dining"
+    assert cashback.categorize("Uber") == "Transit"
+    assert cashback.categorize("Whole Foods") == "Grocery"
+    assert cashback.categorize("Delta Air Lines") == "Travel"
+    assert cashback.categorize("Las Vegas Hotel") == "Travel"
+    assert cashback.categorize("Barnes & Noble") == "Other"
+    print("✅ Known merchants, word-start matching, unknown -> Other")
+
+def test_card_rates():
+    print("\nTesting benefit rates...")
+    rates = cashback.card_rates(GOLD_BENEFITS)
+    assert _rate(rates, "Dining") == 0.04
+    assert _rate(rates, "Grocery") == 0.04
+    assert _rate(rates, "Travel") == 0.03
+    assert _rate(rates, "Gas") == 0.01
+    print("✅ Multipliers per category, base rate elsewhere")
+
+    flat = cashback.card_rates([{"title": "2% cash back on everything"}, {"title": "25% more value when redeemed for travel"}])
+    assert np.allclose(flat, 0.02)
+    print("✅ Flat-rate card; redemption bonuses ignored")
+
+    assert np.allclose(cashback.card_rates(None), cashback.BASE_RATE)
+    print("✅ Unknown card earns the base rate")
+
+def test_apply():
+    print("\nTesting statement cashback...")
+    wallet = [{"name": "American Express Gold Card", "benefits": GOLD_BENEFITS}]
+    transactions = [
+        {"date": "2024-01-02", "retailer": "Chipotle", "amount": 20.00, "card_name": "American Express Gold Card", "cashback_earned": 0.0},
+        {"date": "2024-01-03", "retailer": "Delta", "amount": 300.00, "card_name": "American Express Gold Card", "cashback_earned": 0.0},
+        {"date": "2024-01-04", "retailer": "Payment Thank You", "amount": -500.00, "card_name": "American Express Gold Card", "cashback_earned": 0.0},
+        {"date": "2024-01-05", "retailer": "Shell", "amount": 40.00, "card_name": "Citi Double Cash", "cashback_earned": 0.0},
+    ]
+    global_card = {"name": "Citi Double Cash", "benefits": [{"title": "2% on every purchase"}]}
+
+    with patch.object(cashback.auth, "get_global_card", return_value=global_card) as lookup:
+        cashback.apply("u1", transactions, wallet=wallet)
+
+    assert [tx["cashback_earned"] for tx in transactions] == [0.8, 9.0, 0.0, 0.8]
+    assert [tx["category"] for tx in transactions] == ["Dining", "Travel", "Other", "Gas"]
+    lookup.assert_called_once_with("Citi Double Cash")
+    print("✅ Wallet card, catalog fallback, payments earn nothing")
+
+if __name__ == "__main__":
+    test_categorize()
+    test_card_rates()
+    test_apply()
+    print("\n🎉 All Cashback Tests Passed!")
@@ -0,0 +1,147 @@
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from google.genai import errors
+from prometheus_client import REGISTRY
+from services import context_cache, gemini_gateway, prompts
+
+class FakeModels:
+    """Records the config of every generate_content call."""
+    def __init__(self, fail_first_with=None):
+        self.configs = []
+        self.fail_first_with = fail_first_with
+
+    def generate_content(self, model, contents, config=None):
+        self.configs.append(config)
+        if self.fail_first_with and len(self.configs) == 1:
+            raise self.fail_first_with
+        return SimpleNamespace(text="{}", usage_metadata=None)
+
+    async def agenerate_content(self, model, contents, config=None):
+        await asyncio.sleep(0.01)
+        return self.generate_content(model, contents, config)
+
+def _fake_client(models):
+    client = MagicMock()
+    client.models.generate_content = models.generate_content
+    client.aio.models.generate_content = models.agenerate_content
+    return client
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def _config():
+    return gemini_gateway.grounded_json_config(system_instruction=prompts.CARD_BENEFIT_RULES)
+
+def test_static_prefix_is_cached():
+    print("Testing cache hits with the local backend...")
+
+    backend = context_cache.LocalCacheBackend()
+    models = FakeModels()
+    with patch.object(gemini_gateway, "_client", _fake_client(models)), \
+         patch.object(context_cache, "default_cache", context_cache.ContextCache(backend)):
+
+        for name in ["Amex Gold", "Chase Sapphire", "Citi Strata"]:
+            gemini_gateway.generate_sync("card_update", contents=name, config=_config(), cache_key="test_rules")
+
+    assert backend.create_calls == 1
+    sent = models.configs[-1]
+    assert sent.cached_content == "cachedContents/local-test_rules-1"
+    # The prefix and tools live in the cache, not in the request
+    assert sent.system_instruction is None and sent.tools is None
+    assert backend.prefixes[sent.cached_content] == prompts.CARD_BENEFIT_RULES
+    assert REGISTRY.get_sample_value("gemini_context_cache_total", {"key": "test_rules", "result": "hit"}) == 2
+    print("✅ One cache created, later calls hit it")
+
+def test_recreated_before_ttl_and_on_prompt_change():
+    print("\nTesting TTL refresh...")
+
+    clock = Clock()
+    backend = context_cache.LocalCacheBackend()
+    cache = context_cache.ContextCache(backend, ttl_seconds=600, refresh_margin_seconds=60, clock=clock)
+
+    first = cache.apply(None, "ttl_rules", "model", _config()).cached_content
+    clock.now += 500
+    assert cache.apply(None, "ttl_rules", "model", _config()).cached_content == first
+
+    # Inside the refresh margin -> a new cache, before the old one actually expires
+    clock.now += 50
+    second = cache.apply(None, "ttl_rules", "model", _config()).cached_content
+    assert second != first
+
+    # Prefix text changed (e.g. a deploy) -> new cache
+    changed = gemini_gateway.grounded_json_config(system_instruction="New rules")
+    assert cache.apply(None, "ttl_rules", "model", changed).cached_content != second
+    assert backend.create_calls == 3
+    print("✅ Re-created near expiry and when the prefix changes")
+
+def test_expired_cache_falls_back_inline():
+    print("\nTesting server-side cache miss...")
+
+    backend = context_cache.LocalCacheBackend()
+    models = FakeModels(fail_first_with=errors.ClientError(403, {"error": {"message": "CachedContent not found", "status": "PERMISSION_DENIED"}}))
+    cache = context_cache.ContextCache(backend)
+    with patch.object(gemini_gateway, "_client", _fake_client(models)), \
+         patch.object(context_cache, "default_cache", cache):
+        gemini_gateway.generate_sync("agent_cycle", contents="x", config=_config(), cache_key="miss_rules")
+        gemini_gateway.generate_sync("agent_cycle", contents="y", config=_config(), cache_key="miss_rules")
+
+    assert models.configs[0].cached_content is not None
+    # Retried with the prefix inline
+    assert models.configs[1].system_instruction == prompts.CARD_BENEFIT_RULES
+    # ...and the next call created a fresh cache
+    assert models.configs[2].cached_content == "cachedContents/local-miss_rules-2"
+    print("✅ Invalidated, answered inline, re-created")
+
+def test_create_failure_backs_off():
+    print("\nTesting create failure...")
+
+    clock = Clock()
+    backend = MagicMock()
+    backend.create.side_effect = errors.ClientError(400, {"error": {"message": "Cached content is too small", "status": "INVALID_ARGUMENT"}})
+    cache = context_cache.ContextCache(backend, retry_seconds=300, clock=clock)
+
+    config = _config()
+    assert cache.apply(None, "small_rules", "model", config) is config
+    assert cache.apply(None, "small_rules", "model", config) is config
+    assert backend.create.call_count == 1
+    clock.now += 301
+    cache.apply(None, "small_rules", "model", config)
+    assert backend.create.call_count == 2
+    print("✅ Prefix sent inline, creation retried after back-off")
+
+def test_async_burst_creates_one_cache():
+    print("\nTesting concurrent async calls...")
+
+    backend = context_cache.LocalCacheBackend()
+    models = FakeModels()
+    with patch.object(gemini_gateway, "_client", _fake_client(models)), \
+         patch.object(context_cache, "default_cache", context_cache.ContextCache(backend)):
+
+        async def burst():
+            await asyncio.gather(*[
+                gemini_gateway.generate("recommend", contents=str(i), config=_config(), cache_key="burst_rules")
+                for i in range(50)
+            ])
+        asyncio.run(burst())
+
+    assert backend.create_calls == 1
+    assert all(c.cached_content for c in models.configs)
+    print("✅ 50 concurrent calls share one cache")
+
+if __name__ == "__main__":
+    test_static_prefix_is_cached()
+    test_recreated_before_ttl_and_on_prompt_change()
+    test_expired_cache_falls_back_inline()
+    test_create_failure_backs_off()
+    test_async_burst_creates_one_cache()
+    print("\n🎉 All Context Cache Tests Passed!")
@@ -0,0 +1,105 @@
+import sys
+import os
+import asyncio
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import deadlines, fallbacks
+from models import RecommendationRequest, RecommendationResponse, UserCard, Benefit, ActionCenterCategory
+
+def _card(card_id, *titles):
+    return UserCard(
+        card_id=card_id, name=card_id.replace("_", " ").title(), brand="Test",
+        benefits=[Benefit(category="Dining", title=title, description="") for title in titles]
+    )
+
+def test_hedge_beats_slow_attempt():
+    print("Testing hedged requests...")
+    delays = iter([1.0, 0.01])
+    started = []
+
+    async def attempt():
+        delay = next(delays)
+        started.append(delay)
+        await asyncio.sleep(delay)
+        return delay
+
+    with patch.object(deadlines, "hedge_delay", return_value=0.05):
+        result = asyncio.run(deadlines.hedged("recommend", attempt))
+    assert result == 0.01
+    assert started == [1.0, 0.01]
+    print("✅ Hedge answered while the first attempt was stuck")
+
+    calls = []
+    async def single():
+        calls.append(1)
+        return "ok"
+    assert asyncio.run(deadlines.hedged("card_update", single)) == "ok"
+    assert len(calls) == 1
+    print("✅ Non-interactive call sites are not hedged")
+
+def test_hedge_delay_percentile():
+    print("\nTesting hedge delay...")
+    deadlines._latencies.pop("test_site", None)
+    assert deadlines.hedge_delay("test_site") == deadlines.GEMINI_HEDGE_DEFAULT_SECONDS
+    for i in range(1, 101):
+        deadlines.record_latency("test_site", float(i))
+    assert deadlines.hedge_delay("test_site") == 91.0
+    print("✅ Delay follows the recent p90 once there are enough samples")
+
+def test_deadline_keeps_running():
+    print("\nTesting deadlines...")
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        finished.append(True)
+        return "saved"
+
+    async def scenario(keep_running):
+        try:
+            await deadlines.with_deadline("help", slow(), seconds=0.01, keep_running=keep_running)
+            assert False, "expected DeadlineExceededError"
+        except deadlines.DeadlineExceededError as e:
+            assert e.call_site == "help"
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario(keep_running=False))
+    assert finished == []
+    print("✅ Expired operation is cancelled by default")
+
+    asyncio.run(scenario(keep_running=True))
+    assert finished == [True]
+    print("✅ keep_running lets it finish in the background")
+
+def test_recommendation_fallbacks():
+    print("\nTesting degraded recommendations...")
+    request = RecommendationRequest(store_name="Starbucks", user_cards=[
+        _card("freedom", "1.5% Cash Back on everything"),
+        _card("amex_gold", "4x Points on Dining", "1x on other purchases"),
+    ])
+
+    guess = fallbacks.heuristic_recommendation(request)
+    assert guess.best_card_id == "amex_gold"
+    assert guess.runner_up_id == "freedom"
+    assert guess.confidence < 0.5
+    print("✅ Heuristic picks the highest listed rate")
+
+    assert fallbacks.recall_recommendation("u1", request) is None
+    full = RecommendationResponse(best_card_id="freedom", reasoning=["..."], estimated_return="3%")
+    fallbacks.remember_recommendation("u1", request, full)
+    assert fallbacks.recall_recommendation("u1", request) is full
+    assert fallbacks.recall_recommendation("u2", request) is None
+    print("✅ Recent answers are recalled per user, store and wallet")
+
+    help_text = fallbacks.generic_help_instructions(ActionCenterCategory.CAR_RENTAL, "Sapphire Reserve")
+    assert "Sapphire Reserve" in help_text and "Auto Rental" in help_text
+    print("✅ Generic claim steps per category")
+
+if __name__ == "__main__":
+    test_hedge_beats_slow_attempt()
+    test_hedge_delay_percentile()
+    test_deadline_keeps_running()
+    test_recommendation_fallbacks()
+    print("\n🎉 All Deadline Tests Passed!")
@@ -0,0 +1,86 @@
+import sys
+import os
+import time
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# dependencies imports auth (Firebase); tests never verify real tokens
+sys.modules.setdefault('auth', MagicMock())
+
+import dependencies
+
+def _decoded(uid, exp_in=3600, iat_ago=60):
+    now = time.time()
+    return {"uid": uid, "exp": now + exp_in, "iat": int(now - iat_ago)}
+
+def _verify(tokens):
+    verify = MagicMock(side_effect=lambda token, check_revoked=False: tokens[token])
+    return patch.object(dependencies.auth.auth, "verify_id_token", verify), verify
+
+def test_cache_hits():
+    print("Testing token cache...")
+    dependencies._tokens.clear()
+    patcher, verify = _verify({"tok-a": _decoded("alice")})
+    with patcher:
+        for _ in range(5):
+            assert asyncio.run(dependencies.get_current_user("tok-a"))["uid"] == "alice"
+    assert verify.call_count == 1
+    assert "tok-a" not in dependencies._tokens
+    print("✅ One Firebase verification per token, keyed by hash")
+
+    patcher, verify = _verify({"tok-b": _decoded("bob", exp_in=10)})
+    with patcher:
+        asyncio.run(dependencies.get_current_user("tok-b"))
+        asyncio.run(dependencies.get_current_user("tok-b"))
+    assert verify.call_count == 2
+    print("✅ Tokens near exp are verified again")
+
+    with patch.object(dependencies.auth.auth, "verify_id_token", side_effect=ValueError("expired")):
+        try:
+            asyncio.run(dependencies.get_current_user("bad"))
+            assert False, "expected 401"
+        except HTTPException as e:
+            assert e.status_code == 401
+    print("✅ Invalid tokens -> 401")
+
+def test_lru_bound():
+    print("\nTesting cache bound...")
+    dependencies._tokens.clear()
+    tokens = {f"tok-{i}": _decoded(f"user{i}") for i in range(5)}
+    patcher, _ = _verify(tokens)
+    with patcher, patch.object(dependencies, "AUTH_TOKEN_CACHE_SIZE", 3):
+        for token in tokens:
+            asyncio.run(dependencies.get_current_user(token))
+    assert len(dependencies._tokens) == 3
+    assert dependencies._key("tok-4") in dependencies._tokens and dependencies._key("tok-0") not in dependencies._tokens
+    print("✅ Least recently used tokens evicted")
+
+def test_revocation_refresh():
+    print("\nTesting revocation refresh...")
+    dependencies._tokens.clear()
+    tokens = {"tok-a": _decoded("alice", iat_ago=600), "tok-b": _decoded("bob"), "tok-c": _decoded("carol")}
+    patcher, _ = _verify(tokens)
+    with patcher:
+        for token in tokens:
+            asyncio.run(dependencies.get_current_user(token))
+
+    now_ms = time.time() * 1000
+    users = SimpleNamespace(
+        users=[SimpleNamespace(uid="alice", disabled=False, tokens_valid_after_timestamp=now_ms - 300_000),
+               SimpleNamespace(uid="bob", disabled=False, tokens_valid_after_timestamp=now_ms - 3_600_000)],
+        not_found=[SimpleNamespace(uid="carol")]
+    )
+    with patch.object(dependencies.auth.auth, "get_users", return_value=users):
+        assert dependencies.refresh_revocations() == 2
+    assert list(dependencies._tokens) == [dependencies._key("tok-b")]
+    print("✅ Revoked and deleted users dropped; others stay cached")
+
+if __name__ == "__main__":
+    test_cache_hits()
+    test_lru_bound()
+    test_revocation_refresh()
+    print("\n🎉 All Dependency Tests Passed!")
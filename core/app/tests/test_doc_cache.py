@@ -0,0 +1,86 @@
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import doc_cache
+
+def _loader(*values):
+    return MagicMock(side_effect=list(values))
+
+def test_read_through():
+    print("Testing read-through...")
+    doc_cache.clear()
+    load = _loader({"first_name": "Ada", "cards": ["a"]}, {"first_name": "Grace"})
+    first = doc_cache.get(doc_cache.PROFILE, "u1", load)
+    first["cards"].append("mutated")
+    second = doc_cache.get(doc_cache.PROFILE, "u1", load)
+    assert load.call_count == 1
+    assert second == {"first_name": "Ada", "cards": ["a"]}
+    print("✅ One load, callers get their own copies")
+
+    assert doc_cache.get(doc_cache.PROFILE, "u1", load, fresh=True)["first_name"] == "Grace"
+    assert doc_cache.get(doc_cache.PROFILE, "u1", load)["first_name"] == "Grace"
+    assert load.call_count == 2
+    print("✅ fresh=True bypasses and refreshes the entry")
+
+    with patch.object(doc_cache.time, "monotonic", return_value=doc_cache.time.monotonic() + doc_cache.DOC_CACHE_TTL_SECONDS + 1):
+        load = _loader({"first_name": "Expired"})
+        assert doc_cache.get(doc_cache.PROFILE, "u1", load)["first_name"] == "Expired"
+    print("✅ Entries expire after the TTL")
+
+def test_invalidation():
+    print("Testing invalidation...")
+    doc_cache.clear()
+    doc_cache.get(doc_cache.WALLET, "u1", _loader({"card": {}}))
+    doc_cache.get(doc_cache.PROFILE, "u1", _loader({"first_name": "Ada"}))
+    doc_cache.get(doc_cache.PROFILE, "u2", _loader({"first_name": "Bob"}))
+    doc_cache.invalidate("u1", doc_cache.WALLET)
+    load = _loader({})
+    assert doc_cache.get(doc_cache.WALLET, "u1", load) == {}
+    assert load.call_count == 1
+    load = _loader({"first_name": "new"})
+    assert doc_cache.get(doc_cache.PROFILE, "u1", load)["first_name"] == "Ada"
+    print("✅ Only the invalidated kind is reloaded")
+
+    doc_cache.invalidate("u1")
+    assert doc_cache.get(doc_cache.PROFILE, "u1", load)["first_name"] == "new"
+    assert doc_cache.get(doc_cache.PROFILE, "u2", _loader({"first_name": "other"}))["first_name"] == "Bob"
+    print("✅ No kinds = all of the user's entries, other users untouched")
+
+    # A write lands (and invalidates) while a read of the old version is in flight
+    def slow_load():
+        doc_cache.invalidate("u3", doc_cache.PROFILE)
+        return {"first_name": "stale"}
+    assert doc_cache.get(doc_cache.PROFILE, "u3", slow_load)["first_name"] == "stale"
+    load = _loader({"first_name": "current"})
+    assert doc_cache.get(doc_cache.PROFILE, "u3", load)["first_name"] == "current"
+    print("✅ A load overtaken by an invalidation is not cached")
+
+def test_not_cached():
+    print("Testing values that are not cached...")
+    doc_cache.clear()
+    load = _loader(None, {"first_name": "Ada"})
+    assert doc_cache.get(doc_cache.PROFILE, "u1", load) is None
+    assert doc_cache.get(doc_cache.PROFILE, "u1", load) == {"first_name": "Ada"}
+    print("✅ Missing documents are not cached")
+
+    keep = lambda state: state.get("status") != "thinking"
+    load = _loader({"status": "thinking"}, {"status": "idle"}, {"status": "never"})
+    assert doc_cache.get(doc_cache.AGENT_STATE, "u1", load, keep=keep)["status"] == "thinking"
+    assert doc_cache.get(doc_cache.AGENT_STATE, "u1", load, keep=keep)["status"] == "idle"
+    assert doc_cache.get(doc_cache.AGENT_STATE, "u1", load, keep=keep)["status"] == "idle"
+    print("✅ keep() can refuse transient states")
+
+    with patch.object(doc_cache, "DOC_CACHE_SIZE", 2):
+        for uid in ("a", "b", "c"):
+            doc_cache.get(doc_cache.PROFILE, uid, _loader({"uid": uid}))
+        assert len(doc_cache._entries) == 2
+    print("✅ Bounded by DOC_CACHE_SIZE")
+
+if __name__ == "__main__":
+    test_read_through()
+    test_invalidation()
+    test_not_cached()
+    print("\n🎉 All Doc Cache Tests Passed!")
@@ -0,0 +1,82 @@
+import sys
+import os
+import time
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import gemini_gateway
+
+class FakeAsyncModels:
+    """Stands in for client.aio.models: each call just awaits, like a slow upstream."""
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return SimpleNamespace(text=f"{model}:{contents}", usage_metadata=None)
+
+def _fake_client(delay=0.05):
+    client = MagicMock()
+    client.aio.models = FakeAsyncModels(delay)
+    return client
+
+def test_client_is_shared():
+    print("Testing shared client...")
+
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy_key"}), \
+         patch.object(gemini_gateway, "_client", None), \
+         patch.object(gemini_gateway.genai, "Client") as MockClient:
+
+        first = gemini_gateway.get_client()
+        second = gemini_gateway.get_client()
+
+        assert first is second
+        MockClient.assert_called_once()
+        print("✅ One genai.Client per process")
+
+def test_missing_key_raises_unavailable():
+    print("\nTesting missing API key...")
+
+    with patch.dict(os.environ, {"GEMINI_API_KEY": ""}), \
+         patch.object(gemini_gateway, "_client", None):
+        assert not gemini_gateway.is_configured()
+        try:
+            asyncio.run(gemini_gateway.generate("help", contents="hi"))
+            assert False, "Expected GeminiUnavailableError"
+        except gemini_gateway.GeminiUnavailableError:
+            print("✅ GeminiUnavailableError raised")
+
+def test_concurrent_calls_do_not_serialize():
+    print("\nTesting concurrent async calls...")
+
+    client = _fake_client(delay=0.05)
+    with patch.object(gemini_gateway, "_client", client):
+
+        async def burst():
+            return await asyncio.gather(*[
+                gemini_gateway.generate("help", contents=str(i)) for i in range(300)
+            ])
+
+        start = time.perf_counter()
+        results = asyncio.run(burst())
+        elapsed = time.perf_counter() - start
+
+        assert len(results) == 300
+        # 300 x 50ms sequentially would be 15s; awaiting concurrently stays near one round trip
+        assert elapsed < 2.0, elapsed
+        assert client.aio.models.max_in_flight > 200
+        print(f"✅ 300 calls in {elapsed:.2f}s (max in flight: {client.aio.models.max_in_flight})")
+
+if __name__ == "__main__":
+    test_client_is_shared()
+    test_missing_key_raises_unavailable()
+    test_concurrent_calls_do_not_serialize()
+    print("\n🎉 All Gateway Tests Passed!")
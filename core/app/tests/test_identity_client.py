@@ -0,0 +1,158 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from fastapi import HTTPException
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import identity_client
+
+# Local stand-in for identitytoolkit / securetoken: each test queues (status, body, delay) replies
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    replies = []
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubHandler.requests.append((self.path, body, self.client_address[1]))
+        status, reply, *rest = StubHandler.replies.pop(0) if StubHandler.replies else (200, {})
+        delay = rest[0] if rest else 0
+        time.sleep(delay)
+        data = reply.encode() if isinstance(reply, str) else json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+def _stub(replies):
+    StubHandler.replies = list(replies)
+    StubHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    patches = [
+        patch.object(identity_client, "IDENTITY_TOOLKIT_URL", url),
+        patch.object(identity_client, "SECURE_TOKEN_URL", url),
+        patch.object(identity_client, "IDENTITY_TIMEOUT_SECONDS", 0.5),
+        patch.dict(os.environ, {"FIREBASE_WEB_API_KEY": "test-key"}),
+        patch.object(identity_client.asyncio, "sleep", _no_sleep),
+    ]
+    for p in patches:
+        p.start()
+    return server, patches
+
+def _stop(server, patches):
+    for p in patches:
+        p.stop()
+    server.shutdown()
+    server.server_close()
+
+async def _no_sleep(_):
+    return None
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await identity_client.aclose()
+    return asyncio.run(main())
+
+def _status(coro) -> int:
+    try:
+        _run(coro)
+    except HTTPException as e:
+        return e.status_code
+    raise AssertionError("expected HTTPException")
+
+def test_sign_in_and_refresh():
+    print("Testing sign-in / refresh against the stub...")
+    server, patches = _stub([
+        (200, {"idToken": "id", "localId": "alice", "email": "a@x.com", "refreshToken": "r", "expiresIn": "3600"}),
+        (200, {"id_token": "id2", "user_id": "alice", "refresh_token": "r2", "expires_in": "3600"}),
+    ])
+    try:
+        async def both():
+            login = await identity_client.sign_in_with_password("a@x.com", "pw")
+            refreshed = await identity_client.refresh("r")
+            return login, refreshed
+        login, refreshed = _run(both())
+        assert login["localId"] == "alice" and refreshed["id_token"] == "id2"
+        (sign_in_path, sign_in_body, port_a), (refresh_path, refresh_body, port_b) = StubHandler.requests
+        assert sign_in_path == "/v1/accounts:signInWithPassword?key=test-key"
+        assert sign_in_body == {"email": "a@x.com", "password": "pw", "returnSecureToken": True}
+        assert refresh_path == "/v1/token?key=test-key"
+        assert refresh_body == {"grant_type": "refresh_token", "refresh_token": "r"}
+        assert port_a == port_b
+        print("✅ Both endpoints called with the same payloads as before, over one kept-alive connection")
+    finally:
+        _stop(server, patches)
+
+def test_error_mapping():
+    print("Testing error mapping...")
+    server, patches = _stub([
+        (400, {"error": {"message": "INVALID_LOGIN_CREDENTIALS"}}),
+        (400, {"error": {"message": "USER_DISABLED"}}),
+        (400, "not json"),
+        (400, {"error": {"message": "TOKEN_EXPIRED"}}),
+    ])
+    try:
+        assert _status(identity_client.sign_in_with_password("a@x.com", "bad")) == 401
+        assert _status(identity_client.sign_in_with_password("a@x.com", "pw")) == 400
+        assert _status(identity_client.sign_in_with_password("a@x.com", "pw")) == 500
+        assert _status(identity_client.refresh("old")) == 401
+        assert len(StubHandler.requests) == 4
+        print("✅ 4xx answers are mapped without retries")
+    finally:
+        _stop(server, patches)
+
+    with patch.dict(os.environ, {"FIREBASE_WEB_API_KEY": ""}):
+        assert _status(identity_client.refresh("r")) == 500
+    print("✅ Missing API key is a 500")
+
+def test_retries():
+    print("Testing bounded retries...")
+    server, patches = _stub([(503, {}, 0), (200, {"idToken": "id"}, 0)])
+    try:
+        assert _run(identity_client.sign_in_with_password("a@x.com", "pw"))["idToken"] == "id"
+        assert len(StubHandler.requests) == 2
+        print("✅ 503 retried, then succeeded")
+    finally:
+        _stop(server, patches)
+
+    server, patches = _stub([(503, {}, 0)] * 5)
+    try:
+        assert _status(identity_client.refresh("r")) == 503
+        assert len(StubHandler.requests) == identity_client.IDENTITY_RETRIES + 1
+        print("✅ Gives up after IDENTITY_RETRIES with a 503")
+    finally:
+        _stop(server, patches)
+
+    server, patches = _stub([(200, {}, 1.0)] * 5)
+    try:
+        started = time.monotonic()
+        assert _status(identity_client.sign_in_with_password("a@x.com", "pw")) == 503
+        assert time.monotonic() - started < 3
+        assert len(StubHandler.requests) == identity_client.IDENTITY_RETRIES + 1
+        print("✅ Slow upstream hits the timeout and is retried, bounded")
+    finally:
+        _stop(server, patches)
+
+if __name__ == "__main__":
+    test_sign_in_and_refresh()
+    test_error_mapping()
+    test_retries()
+    print("\n🎉 All Identity Client Tests Passed!")
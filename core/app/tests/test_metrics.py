@@ -0,0 +1,97 @@
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+import metrics
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels)
+
+def test_http_middleware_uses_route_template():
+    print("Testing HTTP latency middleware...")
+
+    app = FastAPI()
+    app.middleware("http")(metrics.http_metrics_middleware)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: str):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = _sample("http_request_duration_seconds_count", labels) or 0
+
+    client.get("/items/a")
+    client.get("/items/b")
+
+    # Both raw paths collapse into ONE low-cardinality series
+    assert _sample("http_request_duration_seconds_count", labels) == before + 2
+    print("✅ Route template label")
+
+def test_track_gemini_records_tokens_and_errors():
+    print("\nTesting track_gemini...")
+
+    response = SimpleNamespace(usage_metadata=SimpleNamespace(
+        prompt_token_count=100,
+        candidates_token_count=20,
+        thoughts_token_count=None,
+        cached_content_token_count=0,
+        tool_use_prompt_token_count=7
+    ))
+    prompt_before = _sample("gemini_tokens_total", {"call_site": "test_site", "kind": "prompt"}) or 0
+
+    with metrics.track_gemini("test_site") as call:
+        call.record_usage(response)
+
+    assert _sample("gemini_tokens_total", {"call_site": "test_site", "kind": "prompt"}) == prompt_before + 100
+    assert _sample("gemini_tokens_total", {"call_site": "test_site", "kind": "grounding"}) >= 7
+    assert _sample("gemini_call_duration_seconds_count", {"call_site": "test_site", "outcome": "ok"}) >= 1
+    print("✅ Tokens counted")
+
+    try:
+        with metrics.track_gemini("test_site"):
+            raise TimeoutError("upstream slow")
+    except TimeoutError:
+        pass
+    assert _sample("gemini_errors_total", {"call_site": "test_site", "error": "TimeoutError"}) == 1
+    print("✅ Errors counted by exception type")
+
+def test_timed_job():
+    print("\nTesting timed_job...")
+
+    @metrics.timed_job("test_job")
+    def job():
+        metrics.job_item("test_job", "updated", count=3)
+
+    job()
+    assert _sample("job_duration_seconds_count", {"job": "test_job", "outcome": "ok"}) == 1
+    assert _sample("job_items_processed_total", {"job": "test_job", "outcome": "updated"}) == 3
+    print("✅ Job duration and items recorded")
+
+def test_scrape_token():
+    print("\nTesting /metrics auth...")
+
+    with patch.object(metrics, "METRICS_TOKEN", ""):
+        assert not metrics.scrape_authorized("Bearer ")
+    print("✅ Closed when no METRICS_TOKEN is configured")
+
+    with patch.object(metrics, "METRICS_TOKEN", "s3cret"):
+        assert metrics.scrape_authorized("Bearer s3cret")
+        assert metrics.scrape_authorized("bearer s3cret")
+        assert not metrics.scrape_authorized(None)
+        assert not metrics.scrape_authorized("Bearer wrong")
+        assert not metrics.scrape_authorized("Basic s3cret")
+    print("✅ Only the configured bearer token is accepted")
+
+if __name__ == "__main__":
+    test_http_middleware_uses_route_template()
+    test_track_gemini_records_tokens_and_errors()
+    test_timed_job()
+    test_scrape_token()
+    print("\n🎉 All Metrics Tests Passed!")
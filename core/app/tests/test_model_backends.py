@@ -0,0 +1,102 @@
+import sys
+import os
+import time
+import asyncio
+import tempfile
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from google.genai import types
+from services import gemini_gateway, model_backends, structured_output, prompts
+from models import RecommendationResponse
+
+RECORDED_TEXT = '{"best_card_id": "amex_gold", "reasoning": ["4x on dining"], "estimated_return": "4x Points", "corrected_store_name": "Starbucks"}'
+
+def _live_response():
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=RECORDED_TEXT)]))],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=812, candidates_token_count=64)
+    )
+
+def _config():
+    return gemini_gateway.grounded_json_config(system_instruction=prompts.RECOMMENDATION_STRATEGY)
+
+def _record(cassette_dir, contents):
+    client = MagicMock()
+    client.models.generate_content.return_value = _live_response()
+    with patch.object(gemini_gateway, "_client", client), \
+         patch.object(gemini_gateway, "_backend", model_backends.RecordingBackend(cassette_dir)):
+        gemini_gateway.generate_sync("recommend", contents=contents, config=structured_output.structured_config(RecommendationResponse, _config()), cache_key=prompts.RECOMMENDATION_STRATEGY_KEY)
+    # Recording sends the prefix inline so the cassette key is stable across runs
+    assert client.models.generate_content.call_args.kwargs["config"].system_instruction == prompts.RECOMMENDATION_STRATEGY
+
+def test_record_then_replay_offline():
+    print("Testing record -> replay...")
+
+    with tempfile.TemporaryDirectory() as cassette_dir:
+        _record(cassette_dir, "Store: Starbucks")
+        assert len(os.listdir(os.path.join(cassette_dir, "recommend"))) == 1
+
+        # Replay: no API key, no client, same request path as /recommend
+        with patch.dict(os.environ, {"GEMINI_API_KEY": ""}), \
+             patch.object(gemini_gateway, "_client", None), \
+             patch.object(gemini_gateway, "_backend", model_backends.ReplayBackend(cassette_dir)):
+            assert gemini_gateway.is_configured()
+            result = asyncio.run(structured_output.generate_structured(
+                "recommend",
+                contents="Store: Starbucks",
+                model_cls=RecommendationResponse,
+                config=_config(),
+                cache_key=prompts.RECOMMENDATION_STRATEGY_KEY
+            ))
+
+    assert result.best_card_id == "amex_gold"
+    assert result.corrected_store_name == "Starbucks"
+    print("✅ Recorded response served offline")
+
+def test_replay_miss_and_call_site_match():
+    print("\nTesting replay matching...")
+
+    with tempfile.TemporaryDirectory() as cassette_dir:
+        _record(cassette_dir, "Store: Starbucks")
+
+        with patch.object(gemini_gateway, "_backend", model_backends.ReplayBackend(cassette_dir)):
+            try:
+                gemini_gateway.generate_sync("recommend", contents="Store: Delta", config=_config())
+                assert False, "Expected CassetteMissError"
+            except model_backends.CassetteMissError:
+                print("✅ Unrecorded request fails loudly")
+
+        with patch.object(gemini_gateway, "_backend", model_backends.ReplayBackend(cassette_dir, match="call_site")):
+            response = gemini_gateway.generate_sync("recommend", contents="Store: Delta", config=_config())
+            assert response.text == RECORDED_TEXT
+            print("✅ call_site matching serves any recording for the call site")
+
+def test_replay_latency():
+    print("\nTesting artificial latency...")
+
+    with tempfile.TemporaryDirectory() as cassette_dir:
+        _record(cassette_dir, "Store: Starbucks")
+        backend = model_backends.ReplayBackend(cassette_dir, latency_ms="100", match="call_site")
+
+        with patch.object(gemini_gateway, "_backend", backend):
+            async def burst():
+                return await asyncio.gather(*[
+                    gemini_gateway.generate("recommend", contents=str(i), config=_config()) for i in range(20)
+                ])
+            start = time.perf_counter()
+            responses = asyncio.run(burst())
+            elapsed = time.perf_counter() - start
+
+    assert len(responses) == 20
+    # Latency is awaited, not slept on a thread: 20 calls ~ one delay
+    assert 0.1 <= elapsed < 1.0, elapsed
+    assert responses[0].usage_metadata.prompt_token_count == 812
+    print(f"✅ 20 replayed calls in {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    test_record_then_replay_offline()
+    test_replay_miss_and_call_site_match()
+    test_replay_latency()
+    print("\n🎉 All Model Backend Tests Passed!")
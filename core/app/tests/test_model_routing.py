@@ -0,0 +1,91 @@
+import sys
+import os
+import asyncio
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import model_routing, structured_output, gemini_gateway, usage
+from models import RecommendationResponse
+
+def _rec(confidence=0.9, valid=True):
+    return RecommendationResponse(best_card_id="amex_gold", reasoning=["4x dining"], estimated_return="4x", is_valid_store=valid, confidence=confidence)
+
+def _run(replies, **kwargs):
+    """Runs generate_tiered('recommend') with one scripted reply per tier; returns (result, calls)."""
+    calls = []
+    replies = iter(replies)
+
+    async def fake_structured(call_site, contents, model_cls, config=None, model=None, defaults=None, max_retries=None, cache_key=None, uid=None):
+        calls.append({"model": model, "config": config, "cache_key": cache_key, "max_retries": max_retries})
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    with patch.object(structured_output, "generate_structured", fake_structured):
+        result = asyncio.run(model_routing.generate_tiered(
+            "recommend", "Store: Starbucks", RecommendationResponse,
+            config=gemini_gateway.grounded_json_config(system_instruction="rules"),
+            cache_key="recommendation_strategy",
+            **kwargs
+        ))
+    return result, calls
+
+def test_confident_fast_answer_stops_early():
+    print("Testing fast tier answer...")
+
+    result, calls = _run([_rec(confidence=0.95)])
+    assert len(calls) == 1
+    assert calls[0]["model"] == model_routing.FAST_MODEL
+    # Ungrounded tier: no search tool, separate context cache, no retries
+    assert calls[0]["config"].tools is None
+    assert calls[0]["cache_key"] == "recommendation_strategy_plain"
+    assert calls[0]["max_retries"] == 0
+    assert result.confidence == 0.95
+    print("✅ One cheap ungrounded call")
+
+def test_escalation_reasons():
+    print("\nTesting escalation...")
+
+    _, calls = _run([_rec(confidence=0.4), _rec(confidence=0.5)])
+    assert [c["model"] for c in calls] == [model_routing.FAST_MODEL, gemini_gateway.DEFAULT_MODEL]
+    assert calls[1]["config"].tools  # grounded
+    assert calls[1]["cache_key"] == "recommendation_strategy"
+    print("✅ Low confidence escalates; last tier answers regardless")
+
+    _, calls = _run([structured_output.StructuredOutputError("bad"), _rec()])
+    assert len(calls) == 2
+    print("✅ Invalid output escalates")
+
+    _, calls = _run([_rec(valid=False), _rec()], accept=lambda rec: rec.is_valid_store)
+    assert len(calls) == 2
+    print("✅ Call-site accept check escalates")
+
+def test_no_escalation_past_soft_budget():
+    print("\nTesting soft budget...")
+
+    async def soft(uid):
+        return usage.BUDGET_SOFT
+    with patch.object(usage, "abudget_status", soft):
+        result, calls = _run([_rec(confidence=0.4)], uid="heavy_user")
+    assert len(calls) == 1 and result.confidence == 0.4
+    # The only tier left is the last one, so it keeps the normal retries
+    assert calls[0]["max_retries"] is None
+    print("✅ Soft-limited users get one tier (every tier would run on the budget model)")
+
+def test_chain_override():
+    print("\nTesting env override...")
+
+    with patch.dict(os.environ, {"GEMINI_TIERS_HELP": "m-lite:plain, m-pro"}):
+        chain = model_routing.tier_chain("help")
+    assert chain == [model_routing.Tier("m-lite", grounded=False), model_routing.Tier("m-pro", grounded=True)]
+    assert model_routing.tier_chain("price_check") == [model_routing.Tier(gemini_gateway.DEFAULT_MODEL)]
+    print("✅ GEMINI_TIERS_<CALL_SITE> parsed")
+
+if __name__ == "__main__":
+    test_confident_fast_answer_stops_early()
+    test_escalation_reasons()
+    test_no_escalation_past_soft_budget()
+    test_chain_override()
+    print("\n🎉 All Model Routing Tests Passed!")
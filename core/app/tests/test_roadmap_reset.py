@@ -75,11 +75,9 @@ def test_start_agent_resets_roadmap():
     # .collection('public_agent_state').document('main')
     start_doc.collection.return_value.document.return_value = mock_public_ref
     
-    # Patch MarathonAgent to avoid actual AI/Background calls
-    with patch("routers.agent.MarathonAgent") as MockAgent:
-        
-        mock_instance = MockAgent.return_value
-        mock_instance.run_agent_cycle = MagicMock()
+    # Patch the agent run queue to avoid actual AI/Background calls
+    with patch("routers.agent.agent_queue") as mock_queue, \
+         patch("routers.agent.usage.budget_status", return_value="ok"):
         
         response = client.post("/agent/start", json={"goal": "Fly to Tokyo"})
         
@@ -96,6 +94,7 @@ def test_start_agent_resets_roadmap():
             "reasoning_summary": "Agent is starting...",
             "optional_tasks": []
         }, merge=True)
+        mock_queue.enqueue_agent_run.assert_called_once_with("test_user_123", reason="start", debounce_seconds=0)
         
         print("✅ Roadmap reset verified")
 
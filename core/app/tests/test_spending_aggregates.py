@@ -0,0 +1,92 @@
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# spending_aggregates imports auth (Firebase); tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import spending_aggregates
+
+ROWS = [
+    {"date": "2024-03-02", "retailer": "Chipotle", "amount": 20.0, "card_name": "Amex Gold", "category": "Dining", "cashback_earned": 0.8},
+    {"date": "2024-03-09", "retailer": "Chipotle", "amount": 15.0, "card_name": "Amex Gold", "category": "Dining", "cashback_earned": 0.6},
+    {"date": "2024-04-01", "retailer": "Shell", "amount": 40.0, "card_name": "Citi Double Cash", "category": "Gas", "cashback_earned": 0.8},
+    {"date": "2024-04-03", "retailer": "Payment Thank You", "amount": -500.0, "card_name": "Amex Gold", "category": "Other", "cashback_earned": 0.0},
+    {"date": "2024-04-05", "retailer": "Reward: Amex Gold Bonus", "amount": 0.0, "card_name": "Amex Gold", "cashback_earned": 60.0, "type": "reward"},
+]
+
+def test_deltas():
+    print("Testing rollup deltas...")
+    change = spending_aggregates.deltas(ROWS)
+    assert change["totals"] == {"spend": 75.0, "cashback": 62.2, "count": 4}
+    assert change["months"]["2024-03"] == {"spend": 35.0, "cashback": 1.4, "count": 2}
+    assert change["categories"]["Rewards"]["cashback"] == 60.0
+    assert change["cards"]["Amex Gold"]["spend"] == 35.0
+    assert "Reward: Amex Gold Bonus" not in change["retailers"]
+    print("✅ Purchases count as spend, rewards as cashback only")
+
+    recomputed = dict(ROWS[2], category="Transit", cashback_earned=1.2)
+    net = spending_aggregates.merge(spending_aggregates.deltas([recomputed]), spending_aggregates.deltas([ROWS[2]], sign=-1))
+    assert net["totals"]["count"] == 0 and round(net["totals"]["cashback"], 2) == 0.4
+    assert net["categories"]["Gas"]["spend"] == -40.0 and net["categories"]["Transit"]["spend"] == 40.0
+    print("✅ Recomputed rows move between categories")
+
+    writes = spending_aggregates.writes("u1", net)
+    spending = writes[0].data
+    assert "spend" not in spending["totals"] and spending["totals"]["cashback"].value == 0.4
+    assert list(writes[1].data["retailers"]["Shell"]) == ["cashback"]
+    print("✅ Only non-zero increments are written")
+
+def test_top_retailers():
+    print("\nTesting top retailers...")
+    retailers = spending_aggregates.deltas(ROWS)["retailers"]
+    db = MagicMock()
+    db.collection.return_value.document.return_value.collection.return_value.document.return_value.get.return_value = \
+        SimpleNamespace(exists=True, to_dict=lambda: {"retailers": retailers})
+    with patch.object(spending_aggregates.auth, "db", db):
+        spending_aggregates.refresh_top_retailers("u1")
+
+    batch = db.batch.return_value
+    top = batch.set.call_args[0][1]["top_retailers"]
+    assert [entry["retailer"] for entry in top] == ["Shell", "Chipotle"]
+    assert batch.update.call_args[0][1] == {"top_retailer": "Shell"}
+    print("✅ Ranked by spend, profile top_retailer set")
+
+def test_retailers_capped():
+    print("\nTesting the retailers cap...")
+    retailers = {f"Store {i}": {"spend": float(i), "cashback": 0.5, "count": 1} for i in range(1, 8)}
+    db = MagicMock()
+    retailers_ref = db.collection.return_value.document.return_value.collection.return_value.document.return_value
+    retailers_ref.get.return_value = SimpleNamespace(exists=True, update_time="t1", to_dict=lambda: {
+        "retailers": retailers, "other": {"spend": 100.0, "cashback": 1.0, "count": 4}})
+    db.write_option.side_effect = lambda last_update_time: last_update_time
+    with patch.object(spending_aggregates.auth, "db", db), \
+         patch.object(spending_aggregates, "SPENDING_RETAILERS_KEPT", 5):
+        spending_aggregates.refresh_top_retailers("u1")
+
+    data = retailers_ref.update.call_args.args[0]
+    assert sorted(data["retailers"]) == ["Store 3", "Store 4", "Store 5", "Store 6", "Store 7"]
+    assert data["other"] == {"spend": 103.0, "cashback": 2.0, "count": 6}
+    assert retailers_ref.update.call_args.kwargs == {"option": "t1"}
+    print("✅ Smallest retailers folded into 'other', only if the doc is unchanged")
+
+    top = db.batch.return_value.set.call_args[0][1]["top_retailers"]
+    assert [entry["retailer"] for entry in top] == ["Store 7", "Store 6", "Store 5", "Store 4", "Store 3"]
+    print("✅ Top retailers unaffected")
+
+    retailers_ref.update.reset_mock()
+    retailers_ref.update.side_effect = spending_aggregates.gexc.FailedPrecondition("changed")
+    with patch.object(spending_aggregates.auth, "db", db), \
+         patch.object(spending_aggregates, "SPENDING_RETAILERS_KEPT", 5):
+        spending_aggregates.refresh_top_retailers("u1")
+    assert db.batch.return_value.commit.called
+    print("✅ A concurrent write skips the fold, top retailers still refreshed")
+
+if __name__ == "__main__":
+    test_deltas()
+    test_top_retailers()
+    test_retailers_capped()
+    print("\n🎉 All Spending Aggregate Tests Passed!")
@@ -0,0 +1,70 @@
+import sys
+import os
+from datetime import date, timedelta
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# spending_summary imports auth (Firebase) via transaction_pages; tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import spending_summary
+
+TODAY = date(2024, 6, 30)
+
+def _tx(days_ago, retailer, amount, category, card="Amex Gold"):
+    return {"date": (TODAY - timedelta(days=days_ago)).isoformat(), "retailer": retailer,
+            "amount": amount, "category": category, "card_name": card}
+
+def _history(months):
+    rows = []
+    for month in range(months):
+        base = month * 30
+        rows.append(_tx(base + 2, "Netflix", 15.49, "Streaming"))
+        rows += [_tx(base + day, "Chipotle", 18.0 + day, "Dining") for day in range(5, 25, 3)]
+        rows.append(_tx(base + 10, "Whole Foods", 120.0 + month * 7, "Grocery"))
+        rows.append(_tx(base + 12, "Payment Thank You", -900.0, "Other"))
+    return rows
+
+CARDS = [{"name": "Amex Gold", "sign_on_bonus": {"target_spend": 4000.0, "current_spend": 1000.0,
+                                                 "end_date": (TODAY + timedelta(days=60)).isoformat()}}]
+
+def test_features():
+    print("Testing spending features...")
+    block = spending_summary.format_block(spending_summary._features(_history(3), CARDS, TODAY))
+    assert "Dining" in block.splitlines()[3] and "Streaming" in block
+    assert "Netflix ~$15.49" in block and "Chipotle" not in block.split("Recurring charges:")[1].split("\n")[0]
+    assert "$3,000 left in 60 days" in block and "BEHIND" in block
+    print("✅ Category shares, recurring bills and bonus pace")
+    print(block)
+
+def test_bonus_edges():
+    print("\nTesting bonus deadlines...")
+    cards = [{"name": "Amex Gold", "sign_on_bonus": {"target_spend": 4000.0, "current_spend": 3900.0,
+                                                    "end_date": TODAY.isoformat()}},
+             {"name": "Chase Freedom", "sign_on_bonus": {"target_spend": 500.0, "current_spend": None,
+                                                        "end_date": (TODAY + timedelta(days=10)).isoformat()}},
+             {"name": "Citi Premier", "sign_on_bonus": {"target_spend": None, "current_spend": 100.0,
+                                                       "end_date": (TODAY + timedelta(days=10)).isoformat()}}]
+    block = spending_summary.format_block(spending_summary._features(_history(1), cards, TODAY))
+    assert "Bonus Amex Gold: $100 left in 0 days (needs $100/day" in block and "deadline passed" not in block
+    print("✅ A bonus ending today still has a pace")
+    assert "Bonus Chase Freedom: $500 left in 10 days" in block and "Citi Premier" not in block
+    print("✅ Null spend fields don't break the summary")
+
+def test_fixed_size():
+    print("\nTesting prompt size...")
+    small = spending_summary.format_block(spending_summary._features(_history(1), CARDS, TODAY))
+    large = spending_summary.format_block(spending_summary._features(_history(3) * 40, CARDS, TODAY))
+    assert len(large) <= spending_summary.SPENDING_SUMMARY_MAX_CHARS
+    assert abs(len(large) - len(small)) < 200
+    print("✅ Block size independent of history length")
+
+    assert "No recent transactions" in spending_summary.format_block(spending_summary._features([], CARDS, TODAY))
+    print("✅ Empty history")
+
+if __name__ == "__main__":
+    test_features()
+    test_bonus_edges()
+    test_fixed_size()
+    print("\n🎉 All Spending Summary Tests Passed!")
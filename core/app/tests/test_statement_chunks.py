@@ -0,0 +1,141 @@
+import sys
+import os
+import io
+import asyncio
+from unittest.mock import MagicMock, patch
+from pypdf import PdfReader, PdfWriter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# cashback imports auth (Firebase); tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import statement_chunks, structured_output, cashback
+from services.gemini_service import GeminiService
+from models import StatementExtraction, StatementProfile
+
+def _pdf(pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def _tx(date, retailer, amount):
+    return {"date": date, "retailer": retailer, "amount": amount, "card_name": "Amex Gold", "cashback_earned": 0.0}
+
+def test_split():
+    print("Testing page splitting...")
+
+    chunks = statement_chunks.split(io.BytesIO(_pdf(7)), pages_per_chunk=3)
+    assert [(c.first_page, c.last_page) for c in chunks] == [(1, 3), (4, 6), (7, 7)]
+    assert [len(PdfReader(c.pdf).pages) for c in chunks] == [3, 3, 1]
+    assert chunks[1].label == "pages 4-6 of 7"
+    print("✅ 7 pages -> 3 chunks")
+
+    small = io.BytesIO(_pdf(2))
+    chunks = statement_chunks.split(small, pages_per_chunk=3)
+    assert len(chunks) == 1 and chunks[0].pdf is small
+    print("✅ Short statements stay whole")
+
+    assert len(statement_chunks.split(io.BytesIO(b"not a pdf"))) == 1
+    print("✅ Unreadable PDF falls back to one chunk")
+
+def test_merge_boundaries():
+    print("\nTesting boundary dedup...")
+    a = [_tx("2024-01-01", "Uber", 12.5), _tx("2024-01-02", "Starbucks", 5.4)]
+    b = [_tx("2024-01-02", "starbucks ", 5.40), _tx("2024-01-03", "Chipotle", 11.0), _tx("2024-01-01", "Uber", 12.5)]
+
+    merged = statement_chunks.merge([a, b])
+    assert [tx["retailer"] for tx in merged] == ["Uber", "Starbucks", "Chipotle", "Uber"]
+    print("✅ Row split across pages kept once, later repeats kept")
+
+def test_chunked_extraction_retries_one_chunk():
+    print("\nTesting chunked extraction...")
+    calls = []
+    failed = set()
+    in_flight = {"now": 0, "max": 0}
+
+    async def fake_structured(call_site, contents, model_cls, config=None, defaults=None, uid=None, **kwargs):
+        prompt = contents[0].parts[0].text
+        calls.append(call_site)
+        if call_site == "statement_profile":
+            return StatementProfile(card_name="Amex Gold")
+
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+
+        page = prompt.split("pages ")[1].split("-")[0]
+        if page == "4" and page not in failed:
+            failed.add(page)
+            raise RuntimeError("503 UNAVAILABLE")
+        return StatementExtraction(transactions=[_tx("2024-01-0" + page, f"Shop {page}", float(page))])
+
+    with patch.object(structured_output, "generate_structured", fake_structured), \
+         patch.object(statement_chunks, "STATEMENT_PAGES_PER_CHUNK", 3), \
+         patch.object(statement_chunks, "STATEMENT_CHUNK_CONCURRENCY", 2):
+        transactions = asyncio.run(GeminiService().process_statement(_pdf(9), uid="u1"))
+
+    assert [tx["retailer"] for tx in transactions] == ["Shop 1", "Shop 4", "Shop 7"]
+    assert calls.count("statement_profile") == 1
+    assert calls.count("statement_chunk") == 4  # 3 chunks + 1 retry of pages 4-6
+    assert in_flight["max"] == 2
+    print("✅ Chunks merged in page order, only the failed chunk re-ran, concurrency bounded")
+
+def test_single_chunk_extraction():
+    print("\nTesting short statement extraction...")
+    calls = []
+
+    async def fake_structured(call_site, contents, model_cls, config=None, defaults=None, uid=None, **kwargs):
+        calls.append(call_site)
+        return StatementExtraction(transactions=[{**_tx("2024-01-01", "Uber", 12.5), "card_last4": "1234"},
+                                                 _tx("2024-01-02", "Starbucks", 5.4)])
+
+    with patch.object(structured_output, "generate_structured", fake_structured):
+        transactions = asyncio.run(GeminiService().process_statement(_pdf(2), uid="u1"))
+
+    assert calls == ["process_statement"]
+    assert [(tx["retailer"], tx["card_last4"]) for tx in transactions] == [("Uber", "1234"), ("Starbucks", None)]
+    print("✅ One call for the whole document, rows returned as extracted")
+
+def test_chunked_last4_picks_the_right_card():
+    print("\nTesting card last-4 through chunked extraction...")
+
+    async def fake_structured(call_site, contents, model_cls, config=None, defaults=None, uid=None, **kwargs):
+        if call_site == "statement_profile":
+            return StatementProfile(card_name="Chase Freedom", card_last4="2222")
+        page = contents[0].parts[0].text.split("pages ")[1].split("-")[0]
+        row = {**_tx("2024-01-0" + page, "Chipotle", 100.0), "card_name": "Chase Freedom"}
+        # Pages 4-6 list the other card's own activity
+        if page == "4":
+            row["card_last4"] = "1111"
+        return StatementExtraction(transactions=[row])
+
+    with patch.object(structured_output, "generate_structured", fake_structured), \
+         patch.object(statement_chunks, "STATEMENT_PAGES_PER_CHUNK", 3):
+        transactions = asyncio.run(GeminiService().process_statement(_pdf(9), uid="u1"))
+    assert [tx["card_last4"] for tx in transactions] == ["2222", "1111", "2222"]
+    print("✅ Every chunk row carries a last-4 (its own, else the statement's)")
+
+    wallet = [
+        {"card_id": "freedom-old", "name": "Chase Freedom", "last4": "1111",
+         "benefits": [{"title": "1x on all other purchases"}]},
+        {"card_id": "freedom-new", "name": "Chase Freedom", "last4": "2222",
+         "benefits": [{"title": "3x Points at Restaurants"}, {"title": "1x on all other purchases"}]},
+    ]
+    with patch.object(cashback.auth, "get_global_card", return_value=None) as global_card:
+        cashback.apply("u1", transactions, wallet=wallet)
+    assert [tx["cashback_earned"] for tx in transactions] == [3.0, 1.0, 3.0]
+    global_card.assert_not_called()
+    print("✅ Same-named wallet cards told apart by last-4 for cashback")
+
+if __name__ == "__main__":
+    test_split()
+    test_merge_boundaries()
+    test_chunked_extraction_retries_one_chunk()
+    test_single_chunk_extraction()
+    test_chunked_last4_picks_the_right_card()
+    print("\n🎉 All Statement Chunk Tests Passed!")
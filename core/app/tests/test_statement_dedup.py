@@ -0,0 +1,69 @@
+import sys
+import os
+import io
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# statement_dedup imports auth (Firebase); tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import statement_dedup, statement_jobs
+
+def _statement(text, producer):
+    """One-page PDF with `text` in its text layer."""
+    writer = PdfWriter()
+    page = writer.add_blank_page(width=612, height=792)
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)})
+    })
+    content = DecodedStreamObject()
+    content.set_data(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode())
+    page[NameObject("/Contents")] = writer._add_object(content)
+    writer.add_metadata({"/Producer": producer})
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return io.BytesIO(buffer.getvalue())
+
+def test_fingerprints():
+    print("Testing statement fingerprints...")
+    original = statement_dedup.fingerprints(_statement("03/01 UBER 12.50", "Bank Portal v1"))
+    redownload = statement_dedup.fingerprints(_statement("03/01   UBER 12.50", "Bank Portal v2"))
+    other = statement_dedup.fingerprints(_statement("04/01 UBER 12.50", "Bank Portal v1"))
+
+    assert len(original) == 2
+    assert original[0] != redownload[0]
+    assert original[1] == redownload[1]
+    print("✅ Re-downloaded PDF: different bytes, same text fingerprint")
+    assert original[1] != other[1]
+    print("✅ Different statement: different text fingerprint")
+
+def test_find_previous():
+    print("\nTesting re-upload lookup...")
+    keys = ["content_aaa", "text_bbb"]
+    db = MagicMock()
+    db.get_all.return_value = [SimpleNamespace(id="text_bbb", exists=True, to_dict=lambda: {"job_id": "job1"})]
+    done = {"job_id": "job1", "status": "done", "result": {"count": 12}}
+
+    with patch.object(statement_dedup.auth, "db", db), \
+         patch.object(statement_jobs, "get_job", return_value=done):
+        assert statement_dedup.find_previous("u1", keys) == (done, "text")
+    print("✅ Text match returns the earlier job and its result")
+
+    with patch.object(statement_dedup.auth, "db", db), \
+         patch.object(statement_jobs, "get_job", return_value={**done, "status": "failed"}):
+        assert statement_dedup.find_previous("u1", keys) is None
+    print("✅ Failed jobs are processed again")
+
+if __name__ == "__main__":
+    test_fingerprints()
+    test_find_previous()
+    print("\n🎉 All Statement Dedup Tests Passed!")
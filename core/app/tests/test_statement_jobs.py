@@ -0,0 +1,82 @@
+import sys
+import os
+import io
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# statement_jobs imports auth (Firebase); tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import statement_jobs, statement_store
+
+def _run_job(process, save=None):
+    """Runs one pipeline with fakes; returns (status updates, enqueue mock, pdf)."""
+    updates = []
+    enqueue = MagicMock()
+    pdf = io.BytesIO(b"%PDF")
+
+    async def fake_process(file, uid=None):
+        return await process(file)
+
+    with patch.object(statement_jobs, "_update", lambda uid, job_id, **fields: updates.append(fields)), \
+         patch.object(statement_jobs.gemini_service, "process_statement", fake_process), \
+         patch.object(statement_jobs.cashback, "apply", lambda uid, transactions: transactions), \
+         patch.object(statement_store, "save_statement", save or MagicMock()), \
+         patch.object(statement_jobs.agent_queue, "enqueue_agent_run", enqueue):
+        async def scenario():
+            task = statement_jobs.start("u1", "job1", pdf, "march.pdf")
+            assert "job1" in statement_jobs._running
+            await task
+        asyncio.run(scenario())
+    return updates, enqueue, pdf
+
+def test_pipeline_stages():
+    print("Testing statement job pipeline...")
+
+    async def extract(file):
+        await asyncio.sleep(0)
+        return [{"date": "2024-03-01", "retailer": "Uber", "amount": 12.5}]
+
+    save = MagicMock(return_value={"message": "ok", "count": 1, "new_count": 1, "data": [{}], "completed_bonuses": []})
+    updates, enqueue, pdf = _run_job(extract, save)
+
+    assert [u["status"] for u in updates] == ["extracting", "saving", "done"]
+    assert updates[-1]["result"] == {"message": "ok", "count": 1, "new_count": 1, "completed_bonuses": []}
+    save.assert_called_once()
+    enqueue.assert_called_once_with("u1", "statement_upload")
+    assert pdf.closed
+    assert "job1" not in statement_jobs._running
+    print("✅ queued -> extracting -> saving -> done, agent queued, spool closed")
+
+def test_pipeline_failure():
+    print("\nTesting failed job...")
+
+    async def broken(file):
+        raise RuntimeError("503 UNAVAILABLE")
+
+    updates, enqueue, pdf = _run_job(broken)
+    assert updates[-1] == {"status": "failed", "error": "503 UNAVAILABLE"}
+    enqueue.assert_not_called()
+    assert pdf.closed
+    print("✅ Extraction error marks the job failed")
+
+def test_stale_job():
+    print("\nTesting interrupted job...")
+    stale = datetime.now(timezone.utc) - timedelta(seconds=statement_jobs.STATEMENT_JOB_STALE_SECONDS + 60)
+    snap = SimpleNamespace(exists=True, to_dict=lambda: {"status": "extracting", "filename": "march.pdf", "updated_at": stale})
+
+    with patch.object(statement_jobs, "_job_ref") as job_ref:
+        job_ref.return_value.get.return_value = snap
+        job = statement_jobs.get_job("u1", "job1")
+    assert job["status"] == "failed" and "interrupted" in job["error"]
+    print("✅ A job that stopped updating is reported as failed")
+
+if __name__ == "__main__":
+    test_pipeline_stages()
+    test_pipeline_failure()
+    test_stale_job()
+    print("\n🎉 All Statement Job Tests Passed!")
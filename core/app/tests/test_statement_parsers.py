@@ -0,0 +1,110 @@
+import sys
+import os
+import io
+import asyncio
+from unittest.mock import patch
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import statement_parsers
+from services.gemini_service import GeminiService
+
+CHASE_PAGE_1 = """Chase Sapphire Preferred
+Manage your account online: www.chase.com/cardhelp
+Opening/Closing Date 12/16/23 - 01/15/24
+ACCOUNT ACTIVITY
+12/18 STARBUCKS STORE 12345 SEATTLE WA 5.40
+12/29 Payment Thank You-Mobile -500.00
+01/02 UBER *TRIP HELP.UBER.COM CA 23.15
+"""
+CHASE_PAGE_2 = """01/05 SQ *BLUE BOTTLE 0423 OAKLAND CA 6.25
+01/09 AMAZON RETURN 19.99 CR
+"""
+# A layout change the template doesn't know (amount column moved before the description)
+CHASE_PAGE_3 = """01/11 $45.00 WHOLE FOODS MARKET 10293 AUSTIN TX 45.00 USD
+01/12 $12.00 CHIPOTLE ONLINE 12.00 USD
+"""
+
+def _pdf(pages):
+    """PDF whose text layer has one text line per line of each page string."""
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for text in pages:
+        page = writer.add_blank_page(width=612, height=792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})
+        })
+        ops = ["BT /F1 10 Tf 40 750 Td"]
+        for line in text.strip().splitlines():
+            escaped = line.replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({escaped}) Tj 0 -14 Td")
+        ops.append("ET")
+        content = DecodedStreamObject()
+        content.set_data(" ".join(ops).encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def test_chase_template():
+    print("Testing Chase template...")
+    parsed = statement_parsers.parse_pages([CHASE_PAGE_1, CHASE_PAGE_2])
+
+    assert parsed.issuer == "chase"
+    assert parsed.card_name == "Chase Sapphire Preferred"
+    assert parsed.fallback_pages == []
+    rows = [(tx["date"], tx["retailer"], tx["amount"]) for tx in parsed.transactions]
+    assert rows == [
+        ("2023-12-18", "Starbucks Store", 5.40),
+        ("2023-12-29", "Payment Thank You-Mobile", -500.00),
+        ("2024-01-02", "Uber", 23.15),
+        ("2024-01-05", "Blue Bottle", 6.25),
+        ("2024-01-09", "Amazon Return", -19.99),
+    ]
+    print("✅ Rows, years across the new year, credits and retailer names")
+
+def test_confidence_and_unknown():
+    print("\nTesting fallbacks...")
+    parsed = statement_parsers.parse_pages([CHASE_PAGE_1, CHASE_PAGE_2, CHASE_PAGE_3])
+    assert parsed.fallback_pages == [3]
+    assert sorted(parsed.pages) == [1, 2]
+    print("✅ Page the template can't read goes to Gemini")
+
+    assert statement_parsers.parse_pages(["Some Credit Union\n01/02 COFFEE 4.00"]) is None
+    assert statement_parsers.parse_pages(["", ""]) is None
+    print("✅ Unknown issuer / no text layer -> Gemini for the whole statement")
+
+def test_text_layer_and_partial_extraction():
+    print("\nTesting PDF parsing...")
+    pdf = _pdf([CHASE_PAGE_1, CHASE_PAGE_2, CHASE_PAGE_3])
+    parsed = statement_parsers.parse_pdf_bytes(pdf)
+    assert parsed.issuer == "chase" and len(parsed.transactions) == 5
+    print("✅ Text layer read from the PDF")
+
+    gemini_pages = []
+
+    async def fake_chunks(self, chunks, profile, uid):
+        gemini_pages.extend((chunk.first_page, chunk.last_page) for chunk in chunks)
+        assert profile.card_name == "Chase Sapphire Preferred"
+        return [[{"date": "2024-01-11", "retailer": "Whole Foods", "amount": 45.0, "card_name": profile.card_name, "cashback_earned": 0.45}]]
+
+    with patch.object(GeminiService, "_extract_chunk_results", fake_chunks):
+        transactions = asyncio.run(GeminiService().process_statement(pdf, uid="u1"))
+    assert gemini_pages == [(3, 3)]
+    assert [tx["retailer"] for tx in transactions][-2:] == ["Amazon Return", "Whole Foods"]
+    print("✅ Only page 3 sent to Gemini, results merged in page order")
+    assert statement_parsers._get_pool()._mp_context.get_start_method() == "spawn"
+    print("✅ Parsed in spawned (not forked) worker processes")
+    statement_parsers.shutdown()
+
+if __name__ == "__main__":
+    test_chase_template()
+    test_confidence_and_unknown()
+    test_text_layer_and_partial_extraction()
+    print("\n🎉 All Statement Parser Tests Passed!")
@@ -0,0 +1,131 @@
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# statement_store imports auth (Firebase); tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import statement_store
+
+class FakeRef:
+    def __init__(self, path):
+        self.id = path.split("/")[-1]
+        self.path = path
+
+    def collection(self, name):
+        return FakeRef(f"{self.path}/{name}")
+
+    def document(self, doc_id):
+        return FakeRef(f"{self.path}/{doc_id}")
+
+class FakeDB:
+    """Records reads and batched writes against a dict of stored docs."""
+    def __init__(self, stored, fail_path=None):
+        self.stored = stored
+        self.fail_path = fail_path
+        self.reads = []
+        self.writes = []
+
+    def collection(self, name):
+        return FakeRef(name)
+
+    def get_all(self, refs):
+        refs = list(refs)
+        self.reads.append(len(refs))
+        return [SimpleNamespace(id=ref.id, exists=ref.path in self.stored, to_dict=lambda ref=ref: self.stored[ref.path])
+                for ref in refs]
+
+    def batch(self):
+        pending = []
+        batch = MagicMock()
+        batch.set.side_effect = lambda ref, data, merge=False: pending.append(("set", ref.path, data))
+        batch.update.side_effect = lambda ref, data: pending.append(("update", ref.path, data))
+
+        def commit():
+            if any(path == self.fail_path for _, path, _ in pending):
+                raise ValueError("rejected")
+            self.writes.extend(pending)
+        batch.commit.side_effect = commit
+        return batch
+
+def _tx(day, retailer, amount, cashback):
+    return {"date": f"2024-03-{day:02d}", "retailer": retailer, "amount": amount,
+            "card_name": "Amex Gold", "cashback_earned": cashback}
+
+def _path(tx):
+    return f"users/u1/transactions/{statement_store.transaction_id(tx)}"
+
+def test_single_pass():
+    print("Testing incremental statement ingestion...")
+    unchanged = _tx(1, "Chipotle", 20.0, 0.8)
+    recomputed = _tx(2, "Delta", 300.0, 9.0)
+    stored = {_path(unchanged): dict(unchanged), _path(recomputed): {**recomputed, "cashback_earned": 3.0}}
+    db = FakeDB(stored)
+    # The view (possibly cached) lags behind the link, which is what the bonus is read from
+    cards = [{"card_id": "gold", "name": "Amex Gold",
+              "sign_on_bonus": {"current_spend": 500.0, "target_spend": 4000.0, "last_updated": None}}]
+    links = {"gold": {"card_id": "gold",
+                      "sign_on_bonus": {"current_spend": 900.0, "target_spend": 4000.0, "last_updated": None}}}
+    view_ref = MagicMock(path="users/u1/aggregates/wallet")
+    view_ref.get.return_value = SimpleNamespace(exists=True, to_dict=lambda: {"cards": {"gold": cards[0]}})
+
+    rows = [unchanged, recomputed, _tx(3, "Shell", 40.0, 0.4), _tx(4, "Whole Foods", 60.0, 2.4)]
+    with patch.object(statement_store.auth, "db", db), \
+         patch.object(statement_store.auth, "get_user_cards", return_value=cards), \
+         patch.object(statement_store.wallet_view, "read_links", return_value=links), \
+         patch.object(statement_store.wallet_view, "ref", return_value=view_ref):
+        result = statement_store.save_statement("u1", rows, "march.pdf")
+
+    assert (result["count"], result["new_count"], result["updated_count"]) == (4, 2, 1)
+    assert db.reads == [4]
+    print("✅ Existing IDs read once, before any write")
+
+    written = {path for kind, path, _ in db.writes if kind == "set" and "/transactions/" in path}
+    assert written == {_path(rows[1]), _path(rows[2]), _path(rows[3])}
+    print("✅ Only new and changed rows written")
+
+    updates = {path: data for kind, path, data in db.writes if kind == "update"}
+    assert updates["users/u1/cards/gold"]["sign_on_bonus"]["current_spend"] == 1000.0
+    sets = {path: data for kind, path, data in db.writes if kind == "set"}
+    assert sets["users/u1/aggregates/wallet"]["cards"]["gold"]["sign_on_bonus"]["current_spend"] == 1000.0
+    assert updates["users/u1"]["total_cashback"].value == 8.8  # 0.4 + 2.4 new, +6.0 recomputed
+    print("✅ Bonus progress from new rows on top of the link's spend, cashback delta includes recomputed rows")
+
+    spending = sets["users/u1/aggregates/spending"]
+    assert spending["totals"]["spend"].value == 100.0 and spending["totals"]["count"].value == 2
+    assert spending["totals"]["cashback"].value == 8.8
+    assert spending["months"]["2024-03"]["spend"].value == 100.0
+    print("✅ Spending rollups updated in the same pass")
+
+def test_reupload_is_noop():
+    print("\nTesting re-upload...")
+    rows = [_tx(1, "Chipotle", 20.0, 0.8)]
+    db = FakeDB({_path(rows[0]): dict(rows[0], source_file="march.pdf")})
+    with patch.object(statement_store.auth, "db", db), \
+         patch.object(statement_store.auth, "get_user_cards") as get_cards:
+        result = statement_store.save_statement("u1", rows, "march.pdf")
+    assert result["new_count"] == 0 and db.writes == []
+    get_cards.assert_not_called()
+    print("✅ Nothing written, no bonus lookup")
+
+def test_failed_rows_not_counted():
+    print("\nTesting partial write failures...")
+    rows = [_tx(1, "Chipotle", 20.0, 0.8), _tx(2, "Shell", 40.0, 0.4)]
+    db = FakeDB({}, fail_path=_path(rows[1]))
+    with patch.object(statement_store.auth, "db", db), \
+         patch.object(statement_store.auth, "get_user_cards", return_value=[]), \
+         patch.object(statement_store.wallet_view, "read_links", return_value={}):
+        result = statement_store.save_statement("u1", rows, "march.pdf")
+    assert (result["new_count"], result["failed_count"]) == (1, 1)
+    updates = {path: data for kind, path, data in db.writes if kind == "update"}
+    assert updates["users/u1"]["total_cashback"].value == 0.8
+    print("✅ Total only counts rows that were stored")
+
+if __name__ == "__main__":
+    test_single_pass()
+    test_reupload_is_noop()
+    test_failed_rows_not_counted()
+    print("\n🎉 All Statement Store Tests Passed!")
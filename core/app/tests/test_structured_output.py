@@ -0,0 +1,98 @@
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import structured_output
+from models import CardSearchResult, RecommendationResponse, StatementExtraction, AgentCycleResult
+
+def test_trailing_text_and_fences():
+    print("Testing fence / trailing text repair...")
+
+    text = '```json\n{"best_card_id": "amex_gold", "reasoning": ["4x dining"], "estimated_return": "4x Points"}\n```\nLet me know if you need more!'
+    result = structured_output.parse_structured(text, RecommendationResponse)
+    assert result.best_card_id == "amex_gold"
+    assert result.is_valid_store is True # default filled
+    print("✅ Fences and trailing prose stripped")
+
+def test_list_vs_object():
+    print("\nTesting list-vs-object repair...")
+
+    # [ {...} ] where an object is expected
+    card = structured_output.parse_structured('[{"name": "Amex Gold", "brand": "Amex", "benefits": []}]', CardSearchResult)
+    assert card.name == "Amex Gold"
+    print("✅ Single-element list unwrapped")
+
+    # Bare list of rows where {"transactions": [...]} is expected
+    rows = structured_output.parse_structured('[{"date": "2025-01-02", "retailer": "Uber", "amount": 12.5}]', StatementExtraction)
+    assert len(rows.transactions) == 1
+    assert rows.transactions[0].card_name == "Credit Card"
+    print("✅ Bare row list wrapped")
+
+    # Empty list for a "not found" card -> empty result, not an exception
+    assert structured_output.parse_structured('[]', CardSearchResult).name is None
+    print("✅ Empty list handled")
+
+def test_missing_defaults_and_bad_rows():
+    print("\nTesting defaults and invalid rows...")
+
+    text = '{"transactions": [{"date": "2025-01-02", "retailer": "Uber", "amount": 12.5, "cashback_earned": null}, {"retailer": "No date or amount"}]}'
+    rows = structured_output.parse_structured(text, StatementExtraction)
+    assert len(rows.transactions) == 1
+    assert rows.transactions[0].cashback_earned == 0.0
+    print("✅ Null default filled and invalid row dropped")
+
+    agent = structured_output.parse_structured(
+        '{"thought_signature": "t", "public_plan": {"roadmap": null}}',
+        AgentCycleResult,
+        defaults={"public_plan": {"target_goal": "Fly to Tokyo"}}
+    )
+    assert agent.public_plan.target_goal == "Fly to Tokyo"
+    assert agent.public_plan.roadmap == []
+    print("✅ Caller defaults applied")
+
+def test_unrepairable_raises():
+    print("\nTesting unrepairable output...")
+    try:
+        structured_output.parse_structured("I could not find that card.", CardSearchResult)
+        assert False, "Expected StructuredOutputError"
+    except structured_output.StructuredOutputError:
+        print("✅ StructuredOutputError raised")
+
+def test_retry_only_after_repair_fails():
+    print("\nTesting retries...")
+
+    replies = iter([
+        SimpleNamespace(text="Sorry, something went wrong", parsed=None),
+        SimpleNamespace(text='{"lowest_price": 99.0}', parsed=None),
+    ])
+    calls = []
+
+    async def fake_generate(call_site, contents, config=None, model=None, cache_key=None, uid=None):
+        calls.append(config)
+        return next(replies)
+
+    from models import PriceCheckResult
+    with patch.object(structured_output.gemini_gateway, "generate", fake_generate):
+        result = asyncio.run(structured_output.generate_structured("test_retry", "prompt", PriceCheckResult))
+
+    assert result.lowest_price == 99.0
+    assert len(calls) == 2
+    # The request carried the schema derived from the Pydantic model
+    assert calls[0].response_schema is PriceCheckResult
+    assert calls[0].response_mime_type == "application/json"
+
+    from prometheus_client import REGISTRY
+    assert REGISTRY.get_sample_value("gemini_structured_retries_total", {"call_site": "test_retry"}) == 1
+    print("✅ One retry, reported in metrics")
+
+if __name__ == "__main__":
+    test_trailing_text_and_fences()
+    test_list_vs_object()
+    test_missing_defaults_and_bad_rows()
+    test_unrepairable_raises()
+    test_retry_only_after_repair_fails()
+    print("\n🎉 All Structured Output Tests Passed!")
@@ -0,0 +1,79 @@
+import sys
+import os
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from fastapi import HTTPException
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# transaction_pages imports auth (Firebase); tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import transaction_pages
+
+class FakeQuery:
+    """Ordered rows (date DESC, id DESC) supporting start_after / limit / stream."""
+    def __init__(self, rows, after=None, count=None):
+        self.rows, self.after, self.count = rows, after, count
+
+    def start_after(self, position):
+        return FakeQuery(self.rows, (position["date"], position["__name__"]), self.count)
+
+    def limit(self, count):
+        return FakeQuery(self.rows, self.after, count)
+
+    def stream(self):
+        rows = [row for row in self.rows if self.after is None or (row["date"], row["id"]) < self.after]
+        for row in rows[:self.count]:
+            data = {k: v for k, v in row.items() if k != "id"}
+            yield SimpleNamespace(id=row["id"], to_dict=lambda data=data: dict(data))
+
+ROWS = sorted(
+    [{"id": f"tx{i:03d}", "date": f"2024-03-{(i % 28) + 1:02d}", "amount": float(i),
+      "updated_at": datetime(2024, 4, 1, tzinfo=timezone.utc)} for i in range(120)],
+    key=lambda row: (row["date"], row["id"]), reverse=True
+)
+
+def test_cursor_pages():
+    print("Testing cursor pagination...")
+    query, seen, cursor, pages = FakeQuery(ROWS), [], None, 0
+    while True:
+        rows, cursor = transaction_pages.fetch_page(query, 50, cursor)
+        seen += [row["id"] for row in rows]
+        pages += 1
+        if cursor is None:
+            break
+    assert pages == 3 and seen == [row["id"] for row in ROWS]
+    print("✅ Pages cover every row once, in order; no cursor on the last page")
+
+    for bad in ["not-a-cursor", transaction_pages.encode_cursor("2024-03-01", "")]:
+        try:
+            transaction_pages.fetch_page(query, 50, bad)
+            assert False, "expected 400"
+        except HTTPException as e:
+            assert e.status_code == 400
+    print("✅ Invalid cursors rejected")
+
+def test_fields_and_stream():
+    print("\nTesting projection and streaming...")
+    assert transaction_pages.parse_fields("retailer, amount") == ["amount", "date", "retailer"]
+    try:
+        transaction_pages.parse_fields("amount,password")
+        assert False, "expected 400"
+    except HTTPException as e:
+        assert e.status_code == 400
+    print("✅ Projection always keeps date; unknown fields rejected")
+
+    chunks = list(transaction_pages.stream_all(FakeQuery(ROWS)))
+    body = json.loads("".join(chunks))
+    assert [row["id"] for row in body] == [row["id"] for row in ROWS]
+    assert body[0]["updated_at"].startswith("2024-04-01")
+    assert len(chunks) == len(ROWS) + 2
+    print("✅ Full history streamed row by row as one JSON array")
+
+if __name__ == "__main__":
+    test_cursor_pages()
+    test_fields_and_stream()
+    print("\n🎉 All Transaction Page Tests Passed!")
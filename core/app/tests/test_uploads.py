@@ -0,0 +1,110 @@
+import sys
+import os
+import io
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
+from fastapi import FastAPI, UploadFile, File
+from fastapi.testclient import TestClient
+from google.genai import types
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import uploads, gemini_gateway
+
+def _app(max_bytes, handled=None):
+    app = FastAPI()
+    app.add_middleware(uploads.UploadSizeLimitMiddleware, limits={"/upload": max_bytes})
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        if handled is not None:
+            handled.append(file.filename)
+        uploads.ensure_upload_size(file, max_bytes)
+        return {"size": len(file.file.read())}
+
+    return TestClient(app)
+
+def test_size_limits():
+    print("Testing upload size limits...")
+    client = _app(max_bytes=200 * 1024)
+
+    response = client.post("/upload", files={"file": ("s.pdf", b"x" * 1024, "application/pdf")})
+    assert response.status_code == 200 and response.json()["size"] == 1024
+    print("✅ Small upload accepted")
+
+    response = client.post("/upload", files={"file": ("s.pdf", b"x" * 400 * 1024, "application/pdf")})
+    assert response.status_code == 413
+    print("✅ Oversized Content-Length rejected before the body is read")
+
+    # Within the multipart allowance but over the file limit: caught after spooling
+    response = client.post("/upload", files={"file": ("s.pdf", b"x" * 230 * 1024, "application/pdf")})
+    assert response.status_code == 413
+    print("✅ Oversized file rejected by the handler check")
+
+def _stream(app, file_bytes):
+    """Sends a chunked multipart upload (no Content-Length) straight to the ASGI app.
+    Returns (status, number of 64 KB file chunks the app asked for)."""
+    chunks = [b'--b\r\nContent-Disposition: form-data; name="file"; filename="s.pdf"\r\n',
+              b"Content-Type: application/pdf\r\n\r\n"]
+    chunks += [b"x" * 64 * 1024] * (file_bytes // (64 * 1024)) + [b"\r\n--b--\r\n"]
+    scope = {"type": "http", "http_version": "1.1", "method": "POST", "path": "/upload", "raw_path": b"/upload",
+             "root_path": "", "scheme": "http", "query_string": b"", "client": ("test", 1), "server": ("test", 80),
+             "headers": [(b"content-type", b"multipart/form-data; boundary=b"), (b"transfer-encoding", b"chunked")]}
+    sent, statuses = [], []
+
+    async def receive():
+        if len(sent) < len(chunks):
+            sent.append(chunks[len(sent)])
+            return {"type": "http.request", "body": sent[-1], "more_body": len(sent) < len(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    asyncio.run(app(scope, receive, send))
+    return statuses, len(sent) - 3
+
+def test_chunked_upload_limit():
+    print("\nTesting chunked uploads...")
+    handled = []
+    app = _app(max_bytes=200 * 1024, handled=handled).app
+
+    assert _stream(app, 128 * 1024) == ([200], 2)
+    print("✅ Chunked upload under the limit accepted")
+
+    handled.clear()
+    statuses, read = _stream(app, 10 * 1024 * 1024)
+    assert statuses == [413] and handled == []
+    assert read <= (200 + 64) // 64 + 1
+    print("✅ Chunked upload over the limit rejected while streaming, the rest never read")
+
+def test_document_part():
+    print("\nTesting document parts...")
+
+    async def part_for(data):
+        async with gemini_gateway.document_part(io.BytesIO(data), "application/pdf") as part:
+            return part
+
+    with patch.object(gemini_gateway, "GEMINI_INLINE_MAX_BYTES", 100):
+        part = asyncio.run(part_for(b"%PDF small"))
+        assert part.inline_data.data == b"%PDF small"
+        print("✅ Small document sent inline")
+
+        client = MagicMock()
+        client.aio.files.upload = AsyncMock(return_value=types.File(
+            name="files/abc", uri="https://files/abc", state=types.FileState.ACTIVE
+        ))
+        client.aio.files.delete = AsyncMock()
+        with patch.object(gemini_gateway._backend, "uses_file_uploads", True), \
+             patch.object(gemini_gateway, "_require_client", return_value=client):
+            part = asyncio.run(part_for(b"x" * 500))
+        assert part.file_data.file_uri == "https://files/abc"
+        client.aio.files.delete.assert_awaited_once_with(name="files/abc")
+        print("✅ Large document uploaded via the Files API and deleted afterwards")
+
+if __name__ == "__main__":
+    test_size_limits()
+    test_chunked_upload_limit()
+    test_document_part()
+    print("\n🎉 All Upload Tests Passed!")
@@ -0,0 +1,220 @@
+import sys
+import os
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import usage, gemini_gateway
+
+def _response(prompt=0, output=0, cached=0):
+    return SimpleNamespace(text="ok", usage_metadata=SimpleNamespace(
+        prompt_token_count=prompt,
+        candidates_token_count=output,
+        thoughts_token_count=None,
+        cached_content_token_count=cached,
+        tool_use_prompt_token_count=None
+    ))
+
+def _fresh_state(db):
+    return patch.multiple(usage, _totals={}, _pending={}, _seeded={}, _db=MagicMock(return_value=db))
+
+def _empty_db():
+    db = MagicMock()
+    db.collection.return_value.document.return_value.collection.return_value.document.return_value.get.return_value = SimpleNamespace(exists=False)
+    return db
+
+def test_usage_accumulates_per_user_and_call_site():
+    print("Testing per-user accounting...")
+
+    with _fresh_state(_empty_db()):
+        usage.record("u1", "recommend", _response(prompt=1000, output=200, cached=800))
+        usage.record("u1", "help", _response(prompt=300, output=100))
+        usage.record("u2", "help", _response(prompt=50, output=10))
+
+        pending = usage._pending[("u1", usage._today())]
+        assert pending["calls"] == 2
+        # Cached prefix tokens don't count against the budget
+        assert pending["total_tokens"] == (1000 - 800 + 200) + (300 + 100)
+        assert pending["by_call_site"]["recommend"] == {"calls": 1, "prompt": 1000, "output": 200, "cached": 800}
+        assert usage._totals[("u2", usage._today())] == 60
+    print("✅ Counts grouped by user, day and call site")
+
+def test_soft_and_hard_budgets():
+    print("\nTesting budgets...")
+
+    seen_models, seen_configs, seen_cache_keys = [], [], []
+
+    async def fake_generate(client, call_site, model, contents, config):
+        seen_models.append(model)
+        seen_configs.append(config)
+        return _response(prompt=600)
+
+    async def fake_apply(client, cache_key, model, config):
+        seen_cache_keys.append(cache_key)
+        return config
+
+    backend = MagicMock(needs_client=False, uses_context_cache=True)
+    backend.agenerate = fake_generate
+
+    with _fresh_state(_empty_db()), \
+         patch.object(usage, "GEMINI_DAILY_SOFT_TOKEN_BUDGET", 1000), \
+         patch.object(usage, "GEMINI_DAILY_HARD_TOKEN_BUDGET", 2000), \
+         patch.object(gemini_gateway, "_backend", backend), \
+         patch.object(gemini_gateway.context_cache.default_cache, "apply_async", fake_apply):
+
+        async def call():
+            return await gemini_gateway.generate("help", contents="x", uid="heavy_user",
+                                                 config=gemini_gateway.grounded_json_config(), cache_key="help")
+
+        asyncio.run(call())  # 600
+        asyncio.run(call())  # 1200 -> soft
+        asyncio.run(call())  # 1800, ran on the budget model
+        asyncio.run(call())  # 2400 -> hard
+        try:
+            asyncio.run(call())
+            assert False, "Expected BudgetExceededError"
+        except usage.BudgetExceededError as e:
+            assert e.status_code == 429
+
+    assert seen_models[:2] == [gemini_gateway.DEFAULT_MODEL] * 2
+    assert seen_models[2:] == [usage.GEMINI_BUDGET_MODEL] * 2
+    print("✅ Cheaper model past the soft budget, 429 past the hard budget")
+
+    assert all(config.tools for config in seen_configs[:2])
+    assert all(config.tools is None and config.response_mime_type == "application/json" for config in seen_configs[2:])
+    assert seen_cache_keys == ["help", "help", "help_plain", "help_plain"]
+    print("✅ Downgraded calls drop Google Search (the budget model can't combine it with JSON output)")
+
+def test_seeded_once_per_day():
+    print("\nTesting concurrent first checks...")
+
+    db = _empty_db()
+    usage_doc = db.collection.return_value.document.return_value.collection.return_value.document.return_value
+    both_reading = threading.Barrier(2, timeout=1)
+
+    def slow_get():
+        try:
+            both_reading.wait()
+        except threading.BrokenBarrierError:
+            pass
+        return SimpleNamespace(exists=True, to_dict=lambda: {"total_tokens": 700})
+    usage_doc.get.side_effect = slow_get
+
+    with _fresh_state(db), patch.object(usage, "GEMINI_DAILY_SOFT_TOKEN_BUDGET", 1000):
+        threads = [threading.Thread(target=usage.budget_status, args=("u1",)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert usage_doc.get.call_count == 1
+        assert usage._totals[("u1", usage._today())] == 700
+        assert usage.budget_status("u1") == usage.BUDGET_OK
+        print("✅ Flushed total added once, not once per caller")
+
+        usage.record("u2", "help", _response(prompt=100))
+        usage.budget_status("u2")
+        assert usage._totals[("u2", usage._today())] == 800
+        print("✅ A call recorded before the first check still gets the flushed total")
+
+class _UsageStore:
+    """Firestore usage docs shared by several simulated instances; applies Increment merges."""
+    def __init__(self):
+        self.docs = {}
+
+    def ref(self, path):
+        store = self
+        uid, day = path[1], path[3]
+        ref = MagicMock(id=day)
+        ref.parent.parent.id = uid
+        ref.get.side_effect = lambda: store.snap(ref)
+        return ref
+
+    def collection(self, name):
+        return MagicMock(document=lambda uid: MagicMock(
+            collection=lambda sub: MagicMock(document=lambda day: self.ref([name, uid, sub, day]))))
+
+    def snap(self, ref):
+        key = (ref.parent.parent.id, ref.id)
+        return SimpleNamespace(id=ref.id, reference=ref, exists=key in self.docs, to_dict=lambda: dict(self.docs.get(key, {})))
+
+    def get_all(self, refs):
+        return [self.snap(ref) for ref in refs]
+
+    def batch(self):
+        writes = []
+        batch = MagicMock()
+        batch.set.side_effect = lambda ref, data, merge=False: writes.append((ref, data))
+        def commit():
+            for ref, data in writes:
+                doc = self.docs.setdefault((ref.parent.parent.id, ref.id), {})
+                doc["total_tokens"] = doc.get("total_tokens", 0) + data["total_tokens"].value
+        batch.commit.side_effect = commit
+        return batch
+
+class _Instance:
+    """One server process: its own in-memory counters over the shared store."""
+    def __init__(self, store):
+        self.store = store
+        self.state = {"_totals": {}, "_pending": {}, "_seeded": {}}
+
+    def run(self, action, *args):
+        with patch.multiple(usage, _db=MagicMock(return_value=self.store), **self.state):
+            try:
+                return action(*args)
+            finally:
+                self.state = {name: getattr(usage, name) for name in self.state}
+
+def test_budget_across_instances():
+    print("\nTesting budgets with several instances...")
+    store = _UsageStore()
+    a, b = _Instance(store), _Instance(store)
+    with patch.object(usage, "GEMINI_DAILY_SOFT_TOKEN_BUDGET", 1000):
+        a.run(usage.record, "u1", "help", _response(prompt=600))
+        a.run(usage.flush)
+        assert b.run(usage.budget_status, "u1") == usage.BUDGET_OK
+        b.run(usage.record, "u1", "help", _response(prompt=300))
+        b.run(usage.flush)
+
+        a.run(usage.record, "u1", "help", _response(prompt=200))
+        assert a.run(usage.budget_status, "u1") == usage.BUDGET_OK  # 800 seen locally
+        a.run(usage.flush)
+        assert a.state["_totals"][("u1", usage._today())] == 1100
+        assert a.run(usage.budget_status, "u1") == usage.BUDGET_SOFT
+        print("✅ A flush re-reads the total, including other instances' calls")
+
+        b.run(usage.flush)  # no calls on b since its last flush
+        assert b.state["_totals"] == {}
+        assert b.run(usage.budget_status, "u1") == usage.BUDGET_SOFT
+        print("✅ Idle totals are dropped and re-read on the next check")
+
+def test_flush_writes_increments_and_retries():
+    print("\nTesting flush...")
+
+    db = _empty_db()
+    with _fresh_state(db):
+        usage.record("u1", "recommend", _response(prompt=100, output=20))
+        assert usage.flush() == 1
+
+        data = db.batch.return_value.set.call_args.args[1]
+        assert data["total_tokens"].value == 120
+        assert data["by_call_site"]["recommend"]["calls"].value == 1
+        assert db.batch.return_value.set.call_args.kwargs == {"merge": True}
+        assert usage._pending == {}
+        print("✅ Increment merge written")
+
+        db.batch.return_value.commit.side_effect = RuntimeError("unavailable")
+        usage.record("u1", "help", _response(prompt=5))
+        usage.flush()
+        assert usage._pending[("u1", usage._today())]["total_tokens"] == 5
+        print("✅ Failed flush kept for the next run")
+
+if __name__ == "__main__":
+    test_usage_accumulates_per_user_and_call_site()
+    test_soft_and_hard_budgets()
+    test_seeded_once_per_day()
+    test_budget_across_instances()
+    test_flush_writes_increments_and_retries()
+    print("\n🎉 All Usage Tests Passed!")
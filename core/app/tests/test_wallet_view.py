@@ -0,0 +1,209 @@
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from google.api_core import exceptions as gexc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# wallet_view imports auth (Firebase); tests never touch the real DB
+sys.modules.setdefault('auth', MagicMock())
+
+from services import wallet_view, doc_cache
+
+class FakeRef:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.split("/")[-1]
+
+    @property
+    def parent(self):
+        return FakeRef(self.db, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name):
+        return FakeRef(self.db, f"{self.path}/{name}")
+
+    def document(self, doc_id):
+        return FakeRef(self.db, f"{self.path}/{doc_id}")
+
+    def select(self, fields):
+        return self
+
+    def get(self):
+        self.db.reads += 1
+        return self.db.snap(self.path)
+
+    def stream(self):
+        prefix = self.path + "/"
+        return [self.db.snap(path) for path in sorted(self.db.docs)
+                if path.startswith(prefix) and "/" not in path[len(prefix):]]
+
+    def set(self, data):
+        self.db.put(self.path, data)
+
+    def create(self, data):
+        if self.path in self.db.docs:
+            raise gexc.Conflict("exists")
+        self.db.put(self.path, data)
+
+    def update(self, data, option=None):
+        if option is not None and option != self.db.versions.get(self.path):
+            raise gexc.FailedPrecondition("changed")
+        self.db.put(self.path, {**self.db.docs[self.path], **data})
+
+class FakeDB:
+    """Docs by path; every write bumps the doc's version (its update_time)."""
+    def __init__(self, docs):
+        self.docs = {}
+        self.versions = {}
+        self.reads = 0
+        self.batched = []
+        for path, data in docs.items():
+            self.put(path, data)
+
+    def put(self, path, data):
+        self.docs[path] = dict(data)
+        self.versions[path] = self.versions.get(path, 0) + 1
+
+    def snap(self, path):
+        ref = FakeRef(self, path)
+        return SimpleNamespace(id=ref.id, reference=ref, exists=path in self.docs,
+                               update_time=self.versions.get(path), to_dict=lambda: dict(self.docs.get(path, {})))
+
+    def collection(self, name):
+        return FakeRef(self, name)
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
+
+    def write_option(self, last_update_time):
+        return last_update_time
+
+    def collection_group(self, name):
+        db = self
+        class Query:
+            def where(self, field, op, value):
+                self.match = (field, value)
+                return self
+            def stream(self):
+                field, value = self.match
+                return [db.snap(path) for path, data in db.docs.items()
+                        if path.split("/")[-2] == name and value in data.get(field, [])]
+        return Query()
+
+    def batch(self):
+        batch = MagicMock()
+        batch.set.side_effect = lambda ref, data, merge=False: self.batched.append(("set", ref.path, data, merge))
+        batch.update.side_effect = lambda ref, data: self.batched.append(("update", ref.path, data, None))
+        return batch
+
+GOLD = {"name": "Amex Gold", "benefits": [{"title": "4x Dining"}]}
+CSR = {"name": "Chase Sapphire Reserve", "benefits": [{"title": "3x Travel"}]}
+BONUS = {"current_spend": 500.0, "target_spend": 4000.0}
+
+def _db():
+    return FakeDB({
+        "cards/Amex Gold": GOLD,
+        "cards/Chase Sapphire Reserve": CSR,
+        "users/u1": {"first_name": "Ada"},
+        "users/u1/cards/Amex Gold": {"card_id": "Amex Gold", "sign_on_bonus": BONUS, "last4": "1234"},
+        "users/u1/cards/Chase Sapphire Reserve": {"card_id": "Chase Sapphire Reserve"},
+        "users/u1/cards/Deleted Card": {"card_id": "Deleted Card"},
+    })
+
+def test_read():
+    print("Testing wallet reads...")
+    db = _db()
+    with patch.object(wallet_view.auth, "db", db):
+        cards = wallet_view.read("u1")
+        assert [card["card_id"] for card in cards] == ["Amex Gold", "Chase Sapphire Reserve"]
+        assert cards[0]["sign_on_bonus"] == BONUS and cards[0]["last4"] == "1234"
+        assert cards[0]["benefits"] == GOLD["benefits"] and "sign_on_bonus" not in cards[1]
+        view = db.docs["users/u1/aggregates/wallet"]
+        assert view["complete"] and view["card_ids"] == ["Amex Gold", "Chase Sapphire Reserve", "Deleted Card"]
+        print("✅ Missing view built from links + global cards (orphans skipped, but tracked)")
+
+        db.reads = 0
+        assert wallet_view.read("u1") == cards
+        assert db.reads == 1
+        print("✅ Afterwards a wallet is one document read")
+
+def test_maintenance_writes():
+    print("Testing maintenance writes...")
+    db = _db()
+    with patch.object(wallet_view.auth, "db", db):
+        write, = wallet_view.add_writes("u1", "Amex Gold", {"card_id": "Amex Gold", "last4": "9999"})
+        assert write.path == "users/u1/aggregates/wallet"
+        assert write.data["cards"]["Amex Gold"] == {**GOLD, "card_id": "Amex Gold", "last4": "9999"}
+        assert [path.to_api_repr() for path in write.merge] == ["card_ids", "updated_at", "cards.`Amex Gold`"]
+        print("✅ Added card: whole entry replaced, ID unioned into card_ids")
+
+        assert wallet_view.bonus_writes("u1", {"Amex Gold": BONUS}) == []
+        print("✅ No view yet: no bonus write (the first read builds it from the links)")
+
+        wallet_view.read("u1")
+        write, = wallet_view.bonus_writes("u1", {"Amex Gold": BONUS, "Chase Sapphire Reserve": None,
+                                                 "Deleted Card": BONUS})
+        assert write.data["cards"]["Amex Gold"]["sign_on_bonus"] == BONUS
+        assert write.data["cards"]["Chase Sapphire Reserve"]["sign_on_bonus"] is wallet_view.firestore.DELETE_FIELD
+        assert [path.to_api_repr() for path in write.merge] == ["cards.`Amex Gold`.sign_on_bonus",
+                                                                 "cards.`Chase Sapphire Reserve`.sign_on_bonus"]
+        assert "Deleted Card" not in write.data["cards"]
+        print("✅ Bonus changes for several cards: one write, only the bonus fields")
+        print("✅ Cards without a view entry are skipped, not written as partial entries")
+
+def test_refresh_card():
+    print("Testing global card fan-out...")
+    db = _db()
+    db.put("users/u2/aggregates/wallet", {"cards": {}, "card_ids": ["Amex Gold"], "complete": True})
+    db.put("users/u3/aggregates/wallet", {"cards": {}, "card_ids": ["Other"], "complete": True})
+    with patch.object(wallet_view.auth, "db", db):
+        wallet_view.read("u1")
+        db.docs["cards/Amex Gold"] = {**GOLD, "benefits": [{"title": "5x Dining"}]}
+        doc_cache.get(doc_cache.WALLET, "u1", lambda: ["cached"])
+        assert wallet_view.refresh_card("Amex Gold") == 2
+
+    by_path = {path: (kind, data) for kind, path, data, _ in db.batched}
+    kind, data = by_path["users/u1/aggregates/wallet"]
+    entry = data["cards"]["Amex Gold"]
+    assert entry["benefits"] == [{"title": "5x Dining"}] and entry["sign_on_bonus"] == BONUS
+    assert by_path["users/u2/aggregates/wallet"] == ("update", {"complete": False})
+    assert "users/u3/aggregates/wallet" not in by_path
+    assert doc_cache.get(doc_cache.WALLET, "u1", lambda: ["reloaded"]) == ["reloaded"]
+    print("✅ New details copied into holders' views, user fields kept, caches dropped")
+    print("✅ A view where the card was orphaned is marked for rebuild")
+
+def test_check_all():
+    print("Testing drift repair...")
+    db = _db()
+    db.put("users/u2", {})
+    with patch.object(wallet_view.auth, "db", db):
+        wallet_view.read("u1")
+        assert wallet_view.check_all() == {"checked": 2, "repaired": 0}
+        print("✅ Consistent views left alone, users without cards skipped")
+
+        db.docs["users/u1/cards/Amex Gold"]["sign_on_bonus"] = {**BONUS, "current_spend": 800.0}
+        assert wallet_view.check_all()["repaired"] == 1
+        assert db.docs["users/u1/aggregates/wallet"]["cards"]["Amex Gold"]["sign_on_bonus"]["current_spend"] == 800.0
+        print("✅ Drifted view rewritten from the links")
+
+        db.docs["users/u1/cards/Amex Gold"]["last4"] = "0000"
+        view_ref = wallet_view.ref("u1")
+        original_get = FakeRef.get
+        def get_then_concurrent_write(ref):
+            snap = original_get(ref)
+            if ref.path == view_ref.path:
+                db.put(ref.path, {**db.docs[ref.path], "touched": True})
+            return snap
+        with patch.object(FakeRef, "get", get_then_concurrent_write):
+            assert wallet_view.check_all()["repaired"] == 0
+        assert db.docs["users/u1/aggregates/wallet"]["touched"]
+        print("✅ A view changed during the check is not overwritten")
+
+if __name__ == "__main__":
+    test_read()
+    test_maintenance_writes()
+    test_refresh_card()
+    test_check_all()
+    print("\n🎉 All Wallet View Tests Passed!")
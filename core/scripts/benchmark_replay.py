@@ -0,0 +1,143 @@
+"""
+Offline load test for the Gemini-backed request paths.
+
+1. Record once against the real API (needs GEMINI_API_KEY):
+       GEMINI_BACKEND=record python scripts/benchmark_replay.py --requests 1 --pdf statement.pdf
+2. Replay as often as you like, no key / network needed:
+       GEMINI_BACKEND=replay GEMINI_REPLAY_LATENCY_MS=recorded python scripts/benchmark_replay.py --requests 200
+
+Runs /recommend, /cards/search and /transactions/upload (with --pdf) in-process through the
+real FastAPI routes, plus MarathonAgent.run_agent_cycle. Firebase is replaced by fixed
+in-memory fixtures so every request is identical between record and replay.
+Profile with e.g. `python -m cProfile -s cumtime scripts/benchmark_replay.py`.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+os.environ.setdefault("GEMINI_BACKEND", "replay")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+# ==========================================
+# 1. FIXTURES (no Firebase)
+# ==========================================
+
+USER_DOC = {
+    "financial_details": "Salary $95k, spends ~$600/mo on dining and $300/mo on travel.",
+    "thought_signature": "",
+    "target_goal": "Round trip flight to Tokyo",
+    "roadmap": []
+}
+WALLET = [
+    {"card_id": "amex_gold", "name": "American Express Gold Card", "brand": "American Express"},
+    {"card_id": "csp", "name": "Chase Sapphire Preferred", "brand": "Chase"}
+]
+
+mock_auth = MagicMock()
+mock_auth.db.collection.return_value.document.return_value.get.return_value = SimpleNamespace(
+    exists=True, to_dict=lambda: dict(USER_DOC)
+)
+mock_auth.get_user_profile.return_value = {"financial_details": USER_DOC["financial_details"]}
+mock_auth.get_global_card.return_value = None
+mock_auth.get_user_cards.return_value = WALLET
+sys.modules['auth'] = mock_auth
+
+import httpx
+from main import app, get_current_user
+from routers import transactions
+from services import gemini_gateway, statement_jobs
+from services.marathon_agent import MarathonAgent
+
+async def _fake_user():
+    return {"uid": "bench_user", "email": "bench@example.com"}
+
+app.dependency_overrides[get_current_user] = _fake_user
+app.dependency_overrides[transactions.get_current_user_uid] = lambda: "bench_user"
+statement_jobs.agent_queue = MagicMock()
+
+RECOMMEND_BODY = {
+    "store_name": "Starbucks",
+    "user_cards": [
+        {"card_id": "amex_gold", "name": "American Express Gold Card", "brand": "American Express",
+         "benefits": [{"category": "Dining", "title": "4x Points at Restaurants", "description": "", "details": ""}]},
+        {"card_id": "csp", "name": "Chase Sapphire Preferred", "brand": "Chase",
+         "benefits": [{"category": "Travel", "title": "2x Points on Travel", "description": "", "details": ""}]}
+    ]
+}
+
+# ==========================================
+# 2. RUNNERS
+# ==========================================
+
+async def _burst(name, n, concurrency, send):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await send()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(n)])
+    _report(name, latencies, time.perf_counter() - start, errors)
+
+def _report(name, latencies, wall, errors):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(
+        f"{name:<22} n={len(latencies):<5} errors={errors:<3} "
+        f"p50={statistics.median(latencies) * 1000:8.1f}ms p95={p95 * 1000:8.1f}ms "
+        f"max={latencies[-1] * 1000:8.1f}ms throughput={len(latencies) / wall:7.1f}/s"
+    )
+
+async def run_http(n, concurrency, pdf_bytes):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await _burst("POST /recommend", n, concurrency,
+                     lambda: client.post("/recommend", json=RECOMMEND_BODY))
+        await _burst("GET /cards/search", n, concurrency,
+                     lambda: client.get("/cards/search", params={"query": "Amex Gold"}))
+        if pdf_bytes:
+            async def upload_and_wait():
+                # 202 comes back right away; time the whole ingestion job
+                response = await client.post("/transactions/upload",
+                                             files={"file": ("statement.pdf", pdf_bytes, "application/pdf")})
+                task = statement_jobs._running.get(response.json().get("job_id"))
+                if task:
+                    await task
+                return response
+            await _burst("POST /transactions/upload", n, concurrency, upload_and_wait)
+
+def run_agent(n):
+    agent = MarathonAgent()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        agent.run_agent_cycle("bench_user")
+        latencies.append(time.perf_counter() - t)
+    _report("agent cycle", latencies, time.perf_counter() - start, 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--agent-cycles", type=int, default=5)
+    parser.add_argument("--pdf", help="statement PDF for /transactions/upload")
+    args = parser.parse_args()
+
+    pdf_bytes = open(args.pdf, "rb").read() if args.pdf else None
+    print(f"Backend: {gemini_gateway._backend.name}")
+    asyncio.run(run_http(args.requests, args.concurrency, pdf_bytes))
+    run_agent(args.agent_cycles)
@@ -105,7 +105,7 @@ class TransactionService: ObservableObject {
         var request = URLRequest(url: url)
         request.httpMethod = "POST"
         request.setValue("Bearer \(token)", forHTTPHeaderField: "Authorization")
-        request.timeoutInterval = 240 // Increase timeout to 4 minutes for Gemini processing
+        request.timeoutInterval = 60
         
         let boundary = UUID().uuidString
         request.setValue("multipart/form-data; boundary=\(boundary)", forHTTPHeaderField: "Content-Type")
@@ -129,13 +129,21 @@ class TransactionService: ObservableObject {
         
         let (data, response) = try await URLSession.shared.data(for: request)
         
-        guard let httpResponse = response as? HTTPURLResponse, httpResponse.statusCode == 200 else {
+        // The server accepts the statement (202) and processes it in the background
+        guard let httpResponse = response as? HTTPURLResponse, httpResponse.statusCode == 202,
+              let accepted = try? JSONSerialization.jsonObject(with: data) as? [String: Any],
+              let jobId = accepted["job_id"] as? String else {
             throw URLError(.badServerResponse)
         }
         
-        // Check for completed bonuses
-        if let json = try? JSONSerialization.jsonObject(with: data) as? [String: Any],
-           let bonuses = json["completed_bonuses"] as? [[String: Any]] {
+        // A statement uploaded before comes back with the earlier job (already done, or still running)
+        let isDuplicate = accepted["duplicate"] as? Bool ?? false
+        let job = accepted["status"] as? String == "done" ? accepted : try await waitForStatementJob(jobId: jobId, token: token)
+        
+        // Check for completed bonuses (already notified the first time for a re-upload)
+        if !isDuplicate,
+           let result = job["result"] as? [String: Any],
+           let bonuses = result["completed_bonuses"] as? [[String: Any]] {
             
             for bonus in bonuses {
                 if let cardName = bonus["card_name"] as? String,
@@ -152,6 +160,39 @@ class TransactionService: ObservableObject {
         try? await fetchTransactions(forceRefresh: true) 
     }
     
+    /// Polls a statement upload job until it is done (returns the job) or failed (throws).
+    private func waitForStatementJob(jobId: String, token: String) async throws -> [String: Any] {
+        guard let url = URL(string: "\(APIService.baseURL)/transactions/jobs/\(jobId)") else {
+            throw URLError(.badURL)
+        }
+        
+        var request = URLRequest(url: url)
+        request.httpMethod = "GET"
+        request.setValue("Bearer \(token)", forHTTPHeaderField: "Authorization")
+        
+        // Up to ~5 minutes for Gemini processing
+        for _ in 0..<150 {
+            try await Task.sleep(nanoseconds: 2_000_000_000)
+            
+            let (data, response) = try await URLSession.shared.data(for: request)
+            guard let httpResponse = response as? HTTPURLResponse, httpResponse.statusCode == 200,
+                  let job = try? JSONSerialization.jsonObject(with: data) as? [String: Any] else {
+                continue
+            }
+            
+            switch job["status"] as? String {
+            case "done":
+                return job
+            case "failed":
+                print("Statement processing failed: \(job["error"] ?? "unknown error")")
+                throw URLError(.cannotParseResponse)
+            default:
+                continue
+            }
+        }
+        throw URLError(.timedOut)
+    }
+    
     // MARK: - Cache Management
     
     private func saveToCache(_ transactions: [Transaction]) {